@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Bulk datagram transmit for simulators that send from many nodes.
+"""
+from __future__ import print_function
+import array
+import ctypes
+import ctypes.util
+import errno
+import os
+import socket
+import sys
+
+# Most messages the kernel takes in one sendmmsg call (UIO_MAXIOV)
+MAX_BATCH = 1024
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [
+        ('iov_base', ctypes.c_void_p),
+        ('iov_len', ctypes.c_size_t),
+    ]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(_iovec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_hdr', _msghdr),
+        ('msg_len', ctypes.c_uint),
+    ]
+
+
+def _load_sendmmsg():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        func = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    func.restype = ctypes.c_int
+    return func
+
+_sendmmsg = _load_sendmmsg()
+
+
+def _refused():
+    print('connection refused, continuing')
+
+
+def _send_loop(sock, datagrams):
+    sent = 0
+    for datagram in datagrams:
+        try:
+            sock.send(datagram)
+            sent += 1
+        except socket.error as e:
+            if e.errno == errno.ECONNREFUSED:
+                _refused()
+            else:
+                raise
+    return sent
+
+
+def _word_typecode():
+    """Array typecode of a 64 bit unsigned word. Python 2 has no 'Q', but
+    'L' is 64 bits there on 64 bit Linux"""
+    for code in ('L', 'Q'):
+        try:
+            if array.array(code).itemsize == 8:
+                return code
+        except ValueError:
+            pass
+    return None
+
+
+# mmsghdr and iovec laid out as 64 bit words so whole batches can be filled
+# in with array slice assignment instead of one ctypes call per field
+_WORD = _word_typecode()
+_WORDS = ctypes.sizeof(_mmsghdr) // 8
+_IOV_WORD = (_mmsghdr.msg_hdr.offset + _msghdr.msg_iov.offset) // 8
+_IOVLEN_WORD = (_mmsghdr.msg_hdr.offset + _msghdr.msg_iovlen.offset) // 8
+_IOV_SIZE = ctypes.sizeof(_iovec)
+_FLAT = (_WORD is not None and ctypes.sizeof(ctypes.c_void_p) == 8 and ctypes.sizeof(_mmsghdr) % 8 == 0 and
+         _IOV_SIZE == 16 and _msghdr.msg_iov.offset % 8 == 0 and _msghdr.msg_iovlen.offset % 8 == 0)
+
+
+def _fill(datagrams):
+    """Build iovec and mmsghdr arrays for a batch, returns the objects that
+    must stay alive and the address of the mmsghdr array"""
+    n = len(datagrams)
+    joined = b''.join(datagrams)
+    base = ctypes.cast(ctypes.c_char_p(joined), ctypes.c_void_p).value
+
+    lengths = [len(d) for d in datagrams]
+    starts = array.array(_WORD, [0]) * n
+    at = base
+    for i, length in enumerate(lengths):
+        starts[i] = at
+        at += length
+
+    iovs = array.array(_WORD, [0]) * (2 * n)
+    iovs[0::2] = starts
+    iovs[1::2] = array.array(_WORD, lengths)
+    iov_base = iovs.buffer_info()[0]
+
+    hdrs = array.array(_WORD, [0]) * (_WORDS * n)
+    hdrs[_IOV_WORD::_WORDS] = array.array(_WORD, range(iov_base, iov_base + _IOV_SIZE * n, _IOV_SIZE))
+    hdrs[_IOVLEN_WORD::_WORDS] = array.array(_WORD, [1]) * n
+    return (joined, iovs, hdrs), hdrs.buffer_info()[0]
+
+
+def _fill_ctypes(datagrams):
+    n = len(datagrams)
+    iovs = (_iovec * n)()
+    hdrs = (_mmsghdr * n)()
+    for i, datagram in enumerate(datagrams):
+        iovs[i].iov_base = ctypes.cast(ctypes.c_char_p(datagram), ctypes.c_void_p)
+        iovs[i].iov_len = len(datagram)
+        hdrs[i].msg_hdr.msg_iov = ctypes.pointer(iovs[i])
+        hdrs[i].msg_hdr.msg_iovlen = 1
+    return (datagrams, iovs, hdrs), ctypes.addressof(hdrs)
+
+
+def _send_mmsg(sock, datagrams):
+    fd = sock.fileno()
+    sent = 0
+    refused = 0
+    for start in range(0, len(datagrams), MAX_BATCH):
+        chunk = datagrams[start:start + MAX_BATCH]
+        n = len(chunk)
+        keep, address = _fill(chunk) if _FLAT else _fill_ctypes(chunk)
+
+        done = 0
+        while done < n:
+            r = _sendmmsg(fd, address + done * ctypes.sizeof(_mmsghdr), n - done, 0)
+            if r < 0:
+                err = ctypes.get_errno()
+                if err == errno.EINTR:
+                    continue
+                if err == errno.ECONNREFUSED and refused < len(datagrams):
+                    # reported for an earlier datagram, this one wasn't sent yet
+                    refused += 1
+                    _refused()
+                    continue
+                raise socket.error(err, os.strerror(err))
+            done += r
+        sent += done
+    return sent
+
+
+def send_many(sock, datagrams):
+    """Send a batch of datagrams on a connected socket with as few system
+    calls as possible
+
+    :param socket sock: connected datagram socket
+    :param list datagrams: list of bytes, one per datagram
+    :returns: number of datagrams sent
+
+    Uses sendmmsg(2) on Linux, so up to 1024 datagrams go out per call, and
+    falls back to a tight send() loop elsewhere.
+    """
+    if not isinstance(datagrams, list):
+        datagrams = list(datagrams)
+    if _sendmmsg is None or not hasattr(sock, 'fileno'):
+        return _send_loop(sock, datagrams)
+    return _send_mmsg(sock, datagrams)
+
+
+class SocketPool(object):
+    """Connected UDP sockets, one per destination
+
+    :param str bind: Local address to send from
+    :returns: SocketPool object
+
+    Simulators that emulate several onboard nodes can share one pool and
+    hand it datagrams for any mix of destinations.
+    """
+
+    def __init__(self, bind=''):
+        self.bind = bind
+        self._socks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+
+    def get(self, dest):
+        """Socket connected to a destination, made on first use
+
+        :param tuple dest: (host, port)
+        :returns: socket
+
+        """
+        sock = self._socks.get(dest)
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind((self.bind, 0))
+            sock.connect(dest)
+            self._socks[dest] = sock
+        return sock
+
+    def send(self, dest, datagrams):
+        """Send a batch of datagrams to one destination
+
+        :param tuple dest: (host, port)
+        :param list datagrams: list of bytes
+        :returns: number of datagrams sent
+
+        """
+        return send_many(self.get(dest), datagrams)
+
+    def send_batch(self, batch):
+        """Send datagrams to many destinations
+
+        :param batch: iterable of (dest, datagram) pairs. Order is kept per
+                      destination
+        :returns: number of datagrams sent
+
+        """
+        by_dest = {}
+        for dest, datagram in batch:
+            by_dest.setdefault(dest, []).append(datagram)
+        return sum(self.send(dest, datagrams) for dest, datagrams in by_dest.items())
+
+    def close(self):
+        for sock in self._socks.values():
+            sock.close()
+        self._socks = {}
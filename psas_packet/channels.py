@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Column decoding of messages with repeated channels, using NumPy.
+
+Receivers that track several satellites send one set of members per
+channel, flattened into names like ``Elev_Angle_0`` ... ``Elev_Angle_11``
+(GPSSatellite, GPSPsudorange). Decoding these a record at a time with
+:meth:`psas_packet.messages.Message.decode` does the ``units`` math once per
+member per record. Here a whole run of records is decoded at once: each
+channel member becomes one ``[n_records, n_channels]`` array, each other
+member one ``[n_records]`` array, and scaling is applied to a column in one
+step.
+
+Values are the same as ``Message.decode`` gives: members with ``scaleby`` or
+``bias`` come out as float64, others in their packed type. With
+``units=False`` every column stays in its packed type, and
+:meth:`psas_packet.messages.Message.to_units` converts one later.
+"""
+import re
+from psas_packet import messages, overlay
+
+_NUMBERED = re.compile(r'^(.+)_(\d+)$')
+
+
+def layout(message):
+    """Split the members of a message into per record fields and channels
+
+    :param Message message: Fixed size message type
+    :returns: (list of field keys, dict of channel name to the member keys
+              of channel 0, 1, ...)
+
+    Members named ``<name>_<n>`` are a channel when ``n`` runs from 0 with
+    no gaps, there are at least two, and they all have the same type and
+    units. Where ``<name>`` is also a member of its own, they stay fields.
+    """
+    keys = [m['key'] for m in message.member_list]
+    numbered = {}
+    for m in message.member_list:
+        match = _NUMBERED.match(m['key'])
+        if match:
+            numbered.setdefault(match.group(1), {})[int(match.group(2))] = m
+
+    channels = {}
+    for name, members in numbered.items():
+        n = len(members)
+        if n < 2 or sorted(members) != list(range(n)) or name in keys:
+            continue
+        first = members[0]
+        if any(members[i]['stype'] != first['stype'] or members[i].get('units', {}) != first.get('units', {})
+               for i in range(n)):
+            continue
+        channels[name] = [members[i]['key'] for i in range(n)]
+
+    grouped = set(k for ks in channels.values() for k in ks)
+    return [k for k in keys if k not in grouped], channels
+
+
+def _plan(message):
+    """(output name, offset, dtype, channel stride or None, number of
+    channels, units) for every output column, cached on the message"""
+    plan = message.__dict__.get('_channel_plan')
+    if plan is not None:
+        return plan
+    fields, channels = layout(message)
+    dt = overlay.dtype(message)
+    units = dict((m['key'], m.get('units', {})) for m in message.member_list)
+
+    plan = []
+    first = {}
+    for name, keys in channels.items():
+        first[keys[0]] = name
+    for m in message.member_list:
+        key = m['key']
+        if key in first:
+            name = first[key]
+            keys = channels[name]
+            offsets = [dt.fields[k][1] for k in keys]
+            stride = offsets[1] - offsets[0]
+            if any(b - a != stride for a, b in zip(offsets, offsets[1:])):
+                stride = None
+            plan.append((name, keys, dt.fields[key][0], stride, len(keys), units[key]))
+        elif key in fields and key in dt.fields:
+            plan.append((key, [key], dt.fields[key][0], None, 0, units[key]))
+    message._channel_plan = (dt, plan)
+    return message._channel_plan
+
+
+def decode(buff, message, offset=0, count=-1, records=True, units=True):
+    """Decode a run of records of one type into columns
+
+    :param buff: buffer holding the records back to back
+    :param Message message: Fixed size message type
+    :param int offset: byte offset of the first record
+    :param int count: number of records, -1 for as many as fit
+    :param bool records: records have headers, otherwise bare bodies
+    :param bool units: convert to normal units, otherwise keep raw counts
+    :returns: dict of column name to NumPy array, with 'timestamp' when
+              there are headers
+
+    """
+    import numpy
+    dt, plan = _plan(message)
+    table = overlay.frombuffer(buff, message, offset=offset, count=count, records=records)
+    n = len(table)
+    body = offset
+    columns = {}
+    if records:
+        columns['timestamp'] = overlay.timestamps(table['header'])
+        body += overlay.header_dtype().itemsize
+
+    for name, keys, field_dt, stride, channels, member_units in plan:
+        if not channels:
+            column = table['data'][name] if records else table[name]
+        elif n == 0:
+            column = numpy.empty((0, channels), dtype=field_dt)
+        elif stride is not None:
+            # every channel is the same distance from the last, so all of
+            # them are one strided view of the buffer
+            column = numpy.ndarray((n, channels), dtype=field_dt, buffer=buff,
+                                   offset=body + dt.fields[keys[0]][1],
+                                   strides=(table.itemsize, stride))
+        else:
+            data = table['data'] if records else table
+            column = numpy.stack([data[k] for k in keys], axis=1)
+        if units and ('scaleby' in member_units or 'bias' in member_units):
+            columns[name] = message.to_units(keys[0], column)
+        else:
+            columns[name] = column.astype(column.dtype.newbyteorder('='))
+    return columns
+
+
+def from_records(raws, message, units=True):
+    """Decode records of one type into columns
+
+    :param raws: iterable of HEADER and body bytes, such as the raw records
+                 from :meth:`psas_packet.io.BinFile.scan`
+    :param Message message: Fixed size message type
+    :param bool units: convert to normal units, otherwise keep raw counts
+    :returns: dict of column name to NumPy array, see :func:`decode`
+
+    """
+    return decode(b''.join(raws), message, units=units)
+
+
+def read(log, fourcc, units=True):
+    """Decode every record of one type in a log into columns
+
+    :param log: filename, file-like object or segment manifest
+    :param str fourcc: printable fourcc, like 'GPS99'
+    :param bool units: convert to normal units, otherwise keep raw counts
+    :returns: dict of column name to NumPy array, see :func:`decode`
+
+    """
+    from psas_packet import io
+    message = messages.MESSAGES[fourcc]
+    wanted = message.fourcc
+    size = messages.HEADER.size + message.size
+    with io.BinFile(log) as f:
+        # a record of the wrong size would shift every one after it
+        raws = [raw for fc, raw in f.scan() if fc == wanted and len(raw) == size]
+    return from_records(raws, message, units)
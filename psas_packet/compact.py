@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Compact delta encoding of fixed size messages for slow downlinks.
+
+A compact message is sent with the same fourcc as the full one, but with the
+first letter lower case (``ADIS`` becomes ``aDIS``). The body starts with a
+frame byte: the high bit marks a keyframe and the low 7 bits count frames so
+the decoder can notice a lost one.
+
+A keyframe is the frame byte followed by the normal packed message body.
+A delta frame is the frame byte, then a bitmap of which fields changed, then
+any fields marked with ``'bits'`` in the definition packed together, then the
+changed fields in order. Integer fields are sent as the zig-zag varint of
+the difference from the last sample, others are sent packed as usual.
+"""
+import struct
+from psas_packet import messages
+
+KEYFRAME = 0x80
+
+_INT, _OTHER = range(2)
+
+
+def compact_fourcc(fourcc):
+    """Fourcc used for the compact form of a message
+
+    :param bytes fourcc: fourcc of the full message
+    :returns: bytes fourcc with the first letter lower case
+
+    """
+    return fourcc[:1].lower() + fourcc[1:]
+
+
+def is_compact(fourcc):
+    """Whether a fourcc is a compact message"""
+    return fourcc[:1].islower()
+
+
+def full_fourcc(fourcc):
+    """Fourcc of the full message a compact fourcc stands for"""
+    return fourcc[:1].upper() + fourcc[1:]
+
+
+def printable(fourcc):
+    """Printable name of a compact fourcc, like
+    :func:`psas_packet.messages.printable` but keeping the lower case first
+    letter, so ``gPS\\x01`` prints as gPS1
+
+    """
+    name = messages.printable(full_fourcc(fourcc))
+    return name[:1].lower() + name[1:]
+
+
+def zigzag(n):
+    """Map signed integers to unsigned so small magnitudes stay small"""
+    return n << 1 if n >= 0 else ((-n) << 1) - 1
+
+
+def unzigzag(z):
+    return (z >> 1) ^ -(z & 1)
+
+
+def _put_varint(out, n):
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get_varint(buff, offset):
+    n = 0
+    shift = 0
+    while True:
+        b = buff[offset]
+        offset += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, offset
+        shift += 7
+
+
+class _Layout(object):
+    """How each field of a message is sent in a delta frame"""
+
+    def __init__(self, message):
+        if message.variable:
+            raise messages.SchemaError(message.name, "compact encoding needs a Fixed size message")
+
+        self.message = message
+        self.fields = []
+        self.bit_fields = []
+        for i, m in enumerate(message.member_list):
+            stype = m['stype']
+            if 'bits' in m:
+                self.bit_fields.append((i, m['bits']))
+            elif stype in 'bBhHiIlLqQ':
+                self.fields.append((i, _INT, None))
+            else:
+                self.fields.append((i, _OTHER, struct.Struct(message.endianness + stype)))
+        self.bitmap_size = (len(self.fields) + 7) // 8
+        self.bits_size = (sum(b for _, b in self.bit_fields) + 7) // 8
+
+
+class CompactEncoder(object):
+    """Stateful compact encoder for one message type
+
+    :param Message message: Fixed size message type to encode
+    :param int keyframe_interval: Send a full keyframe every this many samples
+    :returns: CompactEncoder object
+
+    """
+
+    def __init__(self, message, keyframe_interval=100):
+        self._layout = _Layout(message)
+        self.message = message
+        self.fourcc = compact_fourcc(message.fourcc)
+        self.keyframe_interval = keyframe_interval
+        self._last = None
+        self._frame = 0
+
+    def reset(self):
+        """Force the next frame to be a keyframe"""
+        self._last = None
+
+    def encode(self, data):
+        """Encode a dictionary of values in normal units
+
+        :param dict data: values to encode, as for :meth:`Message.encode`
+        :returns: compact message body
+
+        """
+        return self.encode_packed(self.message.encode(data))
+
+    def encode_packed(self, body):
+        """Encode an already packed message body
+
+        :param bytes body: body as made by :meth:`Message.encode`
+        :returns: compact message body
+
+        """
+        values = self.message.struct.unpack(body)
+        counter = self._frame & 0x7f
+        self._frame += 1
+
+        last = self._last
+        if last is None or self._frame % self.keyframe_interval == 1 or self.keyframe_interval == 1:
+            self._last = values
+            return bytes(bytearray([KEYFRAME | counter])) + body
+
+        layout = self._layout
+
+        # flags go in a small bit field every frame
+        bits = 0
+        shift = 0
+        for i, width in layout.bit_fields:
+            v = values[i]
+            if v < 0 or v >= 1 << width:
+                # doesn't fit, start over from a keyframe
+                self._last = values
+                return bytes(bytearray([KEYFRAME | counter])) + body
+            bits |= v << shift
+            shift += width
+
+        out = bytearray([counter])
+        out.extend(b'\x00' * layout.bitmap_size)
+        for k in range(layout.bits_size):
+            out.append((bits >> (8 * k)) & 0xff)
+
+        for n, (i, kind, st) in enumerate(layout.fields):
+            v = values[i]
+            if v == last[i]:
+                continue
+            out[1 + n // 8] |= 1 << (n % 8)
+            if kind == _INT:
+                _put_varint(out, zigzag(v - last[i]))
+            else:
+                out.extend(st.pack(v))
+
+        self._last = values
+        return bytes(out)
+
+    def message_bytes(self, data, time):
+        """Encode a full compact message with its header
+
+        :param dict data: values to encode
+        :param int time: Timestamp in nanoseconds
+        :returns: header and compact body
+
+        """
+        body = self.encode(data)
+        return messages.HEADER.encode(self, time, len(body)) + body
+
+
+class CompactDecoder(object):
+    """Stateful decoder for compact messages from any number of types
+
+    :param Registry registry: Where to look up message types, defaults to
+                              :data:`psas_packet.messages.MESSAGES`
+    :returns: CompactDecoder object
+
+    Frames that arrive before a keyframe, or after a lost frame, can't be
+    decoded and are counted in ``lost`` until the next keyframe.
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry if registry is not None else messages.MESSAGES
+        self._state = {}
+        self.lost = 0
+
+    def decode_body(self, fourcc, body):
+        """Decode a compact message body
+
+        :param bytes fourcc: compact fourcc from the header
+        :param bytes body: message body
+        :returns: dictionary of values in normal units, or None if it
+                  can't be decoded until the next keyframe
+
+        """
+        state = self._state.get(fourcc)
+        if state is None:
+            message = self.registry.get(messages.printable(full_fourcc(fourcc)))
+            if message is None:
+                return None
+            state = [_Layout(message), None, 0]
+            self._state[fourcc] = state
+        layout, last, expect = state
+        message = layout.message
+
+        body = bytearray(body)
+        if not body:
+            raise messages.MessageSizeError(1, 0)
+        frame = body[0]
+        counter = frame & 0x7f
+
+        if frame & KEYFRAME:
+            raw = bytes(body[1:])
+            if len(raw) != message.size:
+                raise messages.MessageSizeError(message.size + 1, len(body))
+            values = list(message.struct.unpack(raw))
+        else:
+            if last is None or counter != expect:
+                state[1] = None
+                self.lost += 1
+                return None
+            offset = 1 + layout.bitmap_size
+            if len(body) < offset + layout.bits_size:
+                raise messages.MessageSizeError(offset + layout.bits_size, len(body))
+            values = list(last)
+            bits = 0
+            for k in range(layout.bits_size):
+                bits |= body[offset + k] << (8 * k)
+            offset += layout.bits_size
+            for i, width in layout.bit_fields:
+                values[i] = bits & ((1 << width) - 1)
+                bits >>= width
+
+            try:
+                for n, (i, kind, st) in enumerate(layout.fields):
+                    if not body[1 + n // 8] & (1 << (n % 8)):
+                        continue
+                    if kind == _INT:
+                        z, offset = _get_varint(body, offset)
+                        values[i] += unzigzag(z)
+                    else:
+                        values[i], = st.unpack_from(body, offset)
+                        offset += st.size
+            except (IndexError, struct.error):
+                raise messages.MessageSizeError(offset + 1, len(body))
+            if offset != len(body):
+                raise messages.MessageSizeError(offset, len(body))
+
+        state[1] = values
+        state[2] = (counter + 1) & 0x7f
+
+        decoded = {}
+        for m, v in zip(message.member_list, values):
+            decoded[m['key']] = messages._convert(m, v)
+        return decoded
+
+    def decode(self, buff):
+        """Decode one message from a block of bytes, compact or not. Works
+        like :func:`psas_packet.messages.decode`
+
+        :param bytes buff: bytes to try and decode
+        :returns: Tuple: Number of bytes read, and a (fourcc, dictionary) tuple
+
+        """
+        fourcc, timestamp, length = messages.HEADER.decode(buff[:messages.HEADER.size])
+        if not is_compact(fourcc):
+            return messages.decode(buff)
+
+        body = buff[messages.HEADER.size:messages.HEADER.size + length]
+        data = self.decode_body(fourcc, body)
+        if data is None:
+            return messages.HEADER.size + length, (printable(fourcc), {'timestamp': timestamp, 'raw': messages.hexdump(body)})
+        data['timestamp'] = timestamp
+        return messages.HEADER.size + length, (messages.printable(full_fourcc(fourcc)), data)
@@ -0,0 +1,863 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Export logs for tools outside psas_packet.
+
+:class:`NDJSONWriter` writes one JSON array per line, ``["ADIS", {...}]``,
+the same text as ``json.dumps([fourcc, data], sort_keys=True)``. For fixed
+size messages of plain numbers each type gets a line template with its keys
+already sorted and quoted, so a record is unpacked and formatted in one step
+without building a dict. Everything else goes through ``json``, with bytes
+written as hex strings.
+
+:class:`SQLiteWriter` loads records into an SQLite database with a table per
+message type, for ad-hoc SQL. Every table has ``seqn`` and ``timestamp``
+columns, then one per member. Records of types nobody has defined go to
+``_unknown`` with their body as a blob, so nothing is lost.
+
+:class:`CSVWriter` writes a CSV file per message type, with the
+``# [0]SEQN, [1]Timestamp, [2]<key>, ...`` header line of
+:func:`psas_packet.io.log2csv`. Files can be gzipped, by a background thread
+so compressing doesn't hold up decoding.
+
+Exporters work as :mod:`psas_packet.pipeline` sinks, or on a whole log with
+:func:`dump`, :func:`to_sqlite` and :func:`to_csv`.
+"""
+import binascii
+import csv
+import gzip
+import json
+import operator
+import os
+import sqlite3
+import struct
+import threading
+from psas_packet import io, messages
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+HEADER = messages.HEADER
+_SEQN = messages.MESSAGES['SEQN']
+_TIME = struct.Struct('!HL')
+
+# struct types that unpack to plain numbers json writes like repr()
+_NUMBERS = frozenset('bBhHiIlLqQfd')
+
+
+def _fourcc(name):
+    """fourcc bytes for a printable name or fourcc"""
+    # names first: on Python 2 'GPS1' is bytes too, but means GPS\x01
+    message = messages.MESSAGES.get(name)
+    if message is not None:
+        return message.fourcc
+    if isinstance(name, bytes):
+        return name
+    return name.encode('latin-1')
+
+
+def _hex(obj):
+    if isinstance(obj, (bytes, bytearray)):
+        return binascii.hexlify(bytes(obj)).decode('ascii')
+    raise TypeError("{0!r} is not JSON serializable".format(obj))
+
+
+def _hexed(value):
+    """Decoded values with any bytes in them already as hex. Python 2 json
+    would take bytes as UTF-8 text instead of calling default"""
+    if isinstance(value, (bytes, bytearray)):
+        return _hex(value)
+    if isinstance(value, dict):
+        return dict((k, _hexed(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_hexed(v) for v in value]
+    return value
+
+
+# most raw values of one member to keep the text of
+_TEXTS = 1 << 16
+
+
+def _number(v):
+    """JSON text of a number"""
+    text = repr(v)
+    if text[-1] in 'nf' and type(v) is float:
+        # json spells these NaN and Infinity
+        text = json.dumps(v)
+    return text
+
+
+class _Texts(dict):
+    """Text of each raw value of an integer member, made on first use.
+    Counts from a sensor repeat, so most are a lookup"""
+
+    def __init__(self, scale, bias, text=_number):
+        self.scale = scale
+        self.bias = bias
+        self.text = text
+
+    def __missing__(self, v):
+        text = self.text((v * self.scale) + self.bias)
+        if len(self) < _TEXTS:
+            self[v] = text
+        return text
+
+
+class _Floats(object):
+    """Text of a float member, which doesn't repeat enough to keep"""
+
+    def __init__(self, scale=1, bias=0, text=_number):
+        self.scale = scale
+        self.bias = bias
+        self.text = text
+
+    def __getitem__(self, v):
+        # the same math Message.decode does, which also turns -0.0 to 0.0
+        return self.text((v * self.scale) + self.bias)
+
+
+class _Template(object):
+    """Line template of one fixed size message type"""
+
+    def __init__(self, message):
+        name = messages.printable(message.fourcc)
+        keys = [m['key'] for m in message.member_list]
+        order = sorted(range(len(keys) + 1), key=lambda i: keys[i] if i < len(keys) else 'timestamp')
+        names = [keys[i] if i < len(keys) else 'timestamp' for i in order]
+        self.line = '[{0}, {{{1}}}]\n'.format(
+            json.dumps(name).replace('%', '%%'), ', '.join(json.dumps(k).replace('%', '%%') + ': %s' for k in names))
+        self.struct = message.struct
+        self.size = message.size
+
+        # the timestamp goes in as it is, the members through their texts
+        self.at = names.index('timestamp')
+        members = [i for i in order if i < len(keys)]
+        texts = []
+        for m in message.member_list:
+            units = m.get('units', {})
+            scale, bias = units.get('scaleby', 1), units.get('bias', 0)
+            texts.append(_Floats(scale, bias) if m['stype'] in 'fd' else _Texts(scale, bias))
+        self.texts = [texts[i] for i in members]
+        if len(members) > 1:
+            self.get = operator.itemgetter(*members)
+        else:
+            self.get = lambda values: tuple(values[i] for i in members)
+
+    def format(self, buff, start, timestamp):
+        values = list(map(operator.getitem, self.texts, self.get(self.struct.unpack_from(buff, start))))
+        values.insert(self.at, timestamp)
+        return self.line % tuple(values)
+
+
+def _template(fourcc):
+    message = messages.MESSAGES.get(messages.printable(fourcc))
+    if message is None or message.variable:
+        return None
+    if any(m['stype'] not in _NUMBERS for m in message.member_list):
+        return None
+    return _Template(message)
+
+
+class NDJSONWriter(object):
+    """Write records as newline delimited JSON
+
+    :param f: filename or binary file-like object
+    :param list fourccs: only these types, like ['ADIS', 'GPS1'], default
+                         every type
+    :param bool orjson: encode with orjson, which must be installed. Its
+                        lines are compact, without spaces
+    :param int buffer_size: bytes of lines to collect before each write
+    :returns: NDJSONWriter object
+
+    Records of unknown types are written with their body as a hex string in
+    'raw', as :func:`psas_packet.messages.decode` gives them.
+    """
+
+    def __init__(self, f, fourccs=None, orjson=False, buffer_size=1 << 20):
+        if hasattr(f, 'write'):
+            self.fh = f
+            self._owned = False
+        else:
+            self.fh = open(f, 'wb')
+            self._owned = True
+        self.fourccs = frozenset(_fourcc(n) for n in fourccs) if fourccs is not None else None
+        self.buffer_size = buffer_size
+        self.count = 0
+        self._dumps = None
+        if orjson:
+            import orjson as _orjson
+            option = _orjson.OPT_SORT_KEYS | _orjson.OPT_APPEND_NEWLINE | _orjson.OPT_SERIALIZE_NUMPY
+            self._dumps = lambda obj: _orjson.dumps(obj, default=_hex, option=option)
+        self._templates = {}
+        self._parts = []
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+
+    def _line(self, fourcc, buff, pos, end, timestamp):
+        """Line of the record in buff[pos:end], header included"""
+        if self._dumps is None:
+            try:
+                template = self._templates[fourcc]
+            except KeyError:
+                template = self._templates[fourcc] = _template(fourcc)
+            if template is not None and end - pos - HEADER.size == template.size:
+                return template.format(buff, pos + HEADER.size, timestamp)
+        n, message = messages.decode(buff[pos:end])
+        if self._dumps is not None:
+            return self._dumps(message)
+        return json.dumps([message[0], _hexed(message[1])], sort_keys=True, default=_hex) + '\n'
+
+    def _append(self, line):
+        self._parts.append(line)
+        self._size += len(line)
+        self.count += 1
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def write_raw(self, fourcc, raw):
+        """Write one record
+
+        :param bytes fourcc: fourcc from the header
+        :param bytes raw: HEADER and body
+
+        """
+        if self.fourccs is not None and fourcc not in self.fourccs:
+            return
+        fourcc, hi, lo, length = HEADER.unpack_from(raw)
+        self._append(self._line(fourcc, raw, 0, len(raw), (hi << 32) | lo))
+
+    def write_log(self, log, block=1 << 20):
+        """Write every record of a log
+
+        :param log: filename, file-like object or segment manifest
+        :param int block: bytes to read at a time
+
+        """
+        header = HEADER.size
+        unpack_header = HEADER.unpack_from
+        wanted = self.fourccs
+        templates = self._templates
+        line = self._line
+        append = self._parts.append
+        count = 0
+        size = 0
+        buff = b''
+        pos = 0
+        with io.BinFile(log) as source:
+            read = source.fh.read
+            while True:
+                chunk = read(block)
+                if not chunk:
+                    break
+                buff = buff[pos:] + chunk
+                pos = 0
+                end = len(buff)
+                while pos + header <= end:
+                    fourcc, hi, lo, length = unpack_header(buff, pos)
+                    stop = pos + header + length
+                    if stop > end:
+                        # record continues in the next block
+                        break
+                    if wanted is None or fourcc in wanted:
+                        template = templates.get(fourcc)
+                        if template is not None and length == template.size:
+                            text = template.format(buff, pos + header, (hi << 32) | lo)
+                        else:
+                            text = line(fourcc, buff, pos, stop, (hi << 32) | lo)
+                        append(text)
+                        size += len(text)
+                        count += 1
+                    pos = stop
+                if size >= self.buffer_size:
+                    self.count += count
+                    count = size = 0
+                    self.flush()
+                    append = self._parts.append
+        self.count += count
+
+    def write(self, record):
+        """Write a :class:`psas_packet.pipeline.Record`"""
+        self.write_raw(record.fourcc, record.raw)
+
+    def flush(self):
+        if self._parts:
+            if self._dumps is not None:
+                self.fh.write(b''.join(self._parts))
+            else:
+                self.fh.write(''.join(self._parts).encode('utf-8'))
+            self._parts = []
+            self._size = 0
+        self.fh.flush()
+
+    def close(self):
+        self.flush()
+        if self._owned:
+            self.fh.close()
+
+
+def dump(log, f, fourccs=None, orjson=False):
+    """Write a log as newline delimited JSON
+
+    :param log: filename, file-like object or segment manifest
+    :param f: filename or binary file-like object to write
+    :param list fourccs: only these types, default every type
+    :param bool orjson: encode with orjson, see :class:`NDJSONWriter`
+    :returns: number of records written
+
+    """
+    with NDJSONWriter(f, fourccs, orjson) as out:
+        out.write_log(log)
+        return out.count
+
+
+################################################################################
+# SQLite
+################################################################################
+# struct types stored as SQLite integers
+_INTEGERS = frozenset('bBhHiIlLqQ?')
+
+_PRAGMAS = (
+    # a crash mid load loses the load, not the database
+    "PRAGMA journal_mode=MEMORY",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+)
+
+
+def _quote(name):
+    return '"{0}"'.format(name.replace('"', '""'))
+
+
+def _column_type(m, units):
+    if 'count' in m:
+        return 'BLOB' if m.get('stype') == 's' else 'TEXT'
+    stype = m['stype'][-1:]
+    if stype in 'sc':
+        return 'BLOB'
+    scaled = units and ('scaleby' in m.get('units', {}) or 'bias' in m.get('units', {}))
+    if stype in _INTEGERS and not scaled:
+        return 'INTEGER'
+    return 'REAL'
+
+
+class _Table(object):
+    """Rows waiting to go into the table of one message type"""
+
+    def __init__(self, db, message, units):
+        self.name = messages.printable(message.fourcc)
+        self.message = message
+        self.units = units
+        members = message.member_list
+        columns = ['seqn INTEGER', 'timestamp INTEGER'] + [
+            '{0} {1}'.format(_quote(m['key']), _column_type(m, units)) for m in members]
+        db.execute('CREATE TABLE IF NOT EXISTS {0} ({1})'.format(_quote(self.name), ', '.join(columns)))
+
+        # scaling is done by SQLite as each row goes in, the same math
+        # Message.decode does
+        params = ['?', '?']
+        for m in members:
+            u = m.get('units', {}) if units and not message.variable else {}
+            param = '?'
+            if 'scaleby' in u:
+                param = '{0} * {1!r}'.format(param, u['scaleby'])
+            if 'bias' in u:
+                param = '({0}) + {1!r}'.format(param, u['bias'])
+            params.append(param)
+        self.insert = 'INSERT INTO {0} VALUES ({1})'.format(_quote(self.name), ', '.join(params))
+        self.rows = []
+        self.struct = message.struct
+        self.size = message.size
+        self.keys = [m['key'] for m in members]
+
+    def row(self, seqn, timestamp, buff, start, end):
+        if self.struct is not None and end - start == self.size:
+            return (seqn, timestamp) + self.struct.unpack_from(buff, start)
+        data = self.message.decode(buff[start:end], self.units and self.message.variable)
+        # length prefixed arrays and groups are stored as JSON
+        return (seqn, timestamp) + tuple(
+            json.dumps(v, default=_hex) if isinstance(v, list) else v for v in (data[k] for k in self.keys))
+
+
+class SQLiteWriter(object):
+    """Load records into an SQLite database, a table per message type
+
+    :param str path: database file, created if it doesn't exist
+    :param list fourccs: only these types, default every type
+    :param bool units: store normal units, otherwise raw packed values
+    :param int batch: rows of a table to insert with each executemany
+    :returns: SQLiteWriter object
+
+    Tables are named after the printable fourcc (``ADIS``, ``GPS99``).
+    Rows are inserted in large transactions with journaling relaxed for
+    speed, so a load that is interrupted is rolled back. Indexes on
+    ``seqn`` and ``timestamp`` are built on :meth:`close`, after the rows
+    are in. :meth:`load` remembers how far it got in each file, so loading
+    a growing log or segment manifest again only adds what is new.
+    """
+
+    def __init__(self, path, fourccs=None, units=True, batch=10000):
+        self.path = path
+        self.fourccs = frozenset(_fourcc(n) for n in fourccs) if fourccs is not None else None
+        self.units = units
+        self.batch = batch
+        self.count = 0
+        self.db = sqlite3.connect(path)
+        for pragma in _PRAGMAS:
+            self.db.execute(pragma)
+        self.db.execute('CREATE TABLE IF NOT EXISTS _unknown '
+                        '(seqn INTEGER, timestamp INTEGER, fourcc TEXT, body BLOB)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS _loaded '
+                        '(file TEXT PRIMARY KEY, bytes INTEGER, seqn INTEGER)')
+        self._tables = {}
+        self._unknown = []
+        self._seqn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        if type is None:
+            self.close()
+        else:
+            self.db.rollback()
+            self.db.close()
+
+    def _table(self, fourcc):
+        message = messages.MESSAGES.get(messages.printable(fourcc))
+        table = self._tables[fourcc] = _Table(self.db, message, self.units) if message is not None else None
+        return table
+
+    def _add(self, fourcc, timestamp, buff, start, end, seqn):
+        """Queue a record, the body being buff[start:end]"""
+        try:
+            table = self._tables[fourcc]
+        except KeyError:
+            table = self._table(fourcc)
+        if table is None:
+            # a BLOB on Python 2 as well, where bytes are str
+            self._unknown.append((seqn, timestamp, messages.printable(fourcc), sqlite3.Binary(buff[start:end])))
+            return
+        rows = table.rows
+        rows.append(table.row(seqn, timestamp, buff, start, end))
+        if len(rows) >= self.batch:
+            self.db.executemany(table.insert, rows)
+            table.rows = []
+
+    def write_raw(self, fourcc, raw, seqn=None):
+        """Add one record
+
+        :param bytes fourcc: fourcc from the header
+        :param bytes raw: HEADER and body
+        :param int seqn: SEQN of the datagram it came in. SEQN records
+                         bring their own
+
+        """
+        fourcc, hi, lo, length = HEADER.unpack_from(raw)
+        if fourcc == _SEQN.fourcc and length == _SEQN.size:
+            seqn = _SEQN.decode(raw[HEADER.size:])['Sequence']
+        if self.fourccs is None or fourcc in self.fourccs:
+            self._add(fourcc, (hi << 32) | lo, raw, HEADER.size, len(raw), seqn)
+            self.count += 1
+
+    def write(self, record):
+        """Add a :class:`psas_packet.pipeline.Record`"""
+        self.write_raw(record.fourcc, record.raw, record.seqn)
+
+    def load(self, log, block=1 << 20):
+        """Add the records of a log that haven't been loaded yet
+
+        :param log: filename, segment manifest, or file-like object, which
+                    is loaded in full
+        :param int block: bytes to read at a time
+        :returns: number of records added
+
+        Each file is committed on its own along with how far into it the
+        load got, so the next load of the same file starts from there.
+        """
+        before = self.count
+        if not io._is_string_like(log):
+            self._load(log, None, 0, None, block)
+        elif log.endswith('.manifest'):
+            from psas_packet import segment
+            base = os.path.dirname(log)
+            for s in segment.load_manifest(log)['segments']:
+                self._load_file(os.path.join(base, s['file']), block)
+        else:
+            self._load_file(log, block)
+        return self.count - before
+
+    def _load_file(self, path, block):
+        key = os.path.abspath(path)
+        done = self.db.execute('SELECT bytes, seqn FROM _loaded WHERE file = ?', (key,)).fetchone()
+        start, seqn = done if done is not None else (0, None)
+        if os.path.getsize(path) <= start:
+            return
+        with open(path, 'rb') as fh:
+            fh.seek(start)
+            self._load(fh, key, start, seqn, block)
+
+    def _load(self, fh, key, start, seqn, block):
+        header = HEADER.size
+        unpack_header = HEADER.unpack_from
+        wanted = self.fourccs
+        add = self._add
+        tables = self._tables
+        batch = self.batch
+        executemany = self.db.executemany
+        seqn_fourcc = _SEQN.fourcc
+        decode_seqn = _SEQN.struct.unpack_from
+        count = 0
+        done = start
+        buff = b''
+        pos = 0
+        while True:
+            chunk = fh.read(block)
+            if not chunk:
+                break
+            buff = buff[pos:] + chunk
+            pos = 0
+            end = len(buff)
+            while pos + header <= end:
+                fourcc, hi, lo, length = unpack_header(buff, pos)
+                stop = pos + header + length
+                if stop > end:
+                    # record continues in the next block
+                    break
+                if fourcc == seqn_fourcc and length == _SEQN.size:
+                    seqn, = decode_seqn(buff, pos + header)
+                if wanted is None or fourcc in wanted:
+                    table = tables.get(fourcc)
+                    if table is not None and length == table.size:
+                        rows = table.rows
+                        rows.append((seqn, (hi << 32) | lo) + table.struct.unpack_from(buff, pos + header))
+                        if len(rows) >= batch:
+                            executemany(table.insert, rows)
+                            table.rows = []
+                    else:
+                        add(fourcc, (hi << 32) | lo, buff, pos + header, stop, seqn)
+                    count += 1
+                done += stop - pos
+                pos = stop
+        self.count += count
+        if key is not None:
+            self._flush()
+            self.db.execute('INSERT OR REPLACE INTO _loaded VALUES (?, ?, ?)', (key, done, seqn))
+            self.db.commit()
+
+    def _flush(self):
+        for table in self._tables.values():
+            if table is not None and table.rows:
+                self.db.executemany(table.insert, table.rows)
+                table.rows = []
+        if self._unknown:
+            self.db.executemany('INSERT INTO _unknown VALUES (?, ?, ?, ?)', self._unknown)
+            self._unknown = []
+
+    def close(self):
+        """Insert what is queued, commit and build the indexes"""
+        self._flush()
+        for table in self._tables.values():
+            if table is not None:
+                for column in ('seqn', 'timestamp'):
+                    self.db.execute('CREATE INDEX IF NOT EXISTS {0} ON {1} ({2})'.format(
+                        _quote('{0}_{1}'.format(table.name, column)), _quote(table.name), column))
+        self.db.commit()
+        self.db.close()
+
+
+def to_sqlite(log, path, fourccs=None, units=True):
+    """Load a log into an SQLite database, see :class:`SQLiteWriter`
+
+    :param log: filename, segment manifest or file-like object
+    :param str path: database file. If it already holds part of this log,
+                     only the rest is added
+    :param list fourccs: only these types, default every type
+    :param bool units: store normal units, otherwise raw packed values
+    :returns: number of records added
+
+    """
+    with SQLiteWriter(path, fourccs, units) as db:
+        return db.load(log)
+
+
+################################################################################
+# CSV
+################################################################################
+# zlib's own default. gzip's 9 takes twice as long for a few percent
+_GZIP_LEVEL = 6
+
+class _Deflater(threading.Thread):
+    """Daemon thread that gzips text handed to it by :class:`CSVWriter`.
+    zlib lets go of the GIL while it works, so this runs alongside decoding"""
+
+    def __init__(self, depth=8):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.queue = queue.Queue(depth)
+        self.error = None
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue
+            fh, data = item
+            try:
+                if data is None:
+                    fh.close()
+                else:
+                    fh.write(data)
+            except Exception as e:
+                self.error = e
+
+    def put(self, fh, data):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((fh, data))
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+
+class _Chunks(object):
+    """Text from a csv.writer, handed to the deflater in large pieces"""
+
+    def __init__(self, deflater, fh, buffer_size):
+        self.deflater = deflater
+        self.fh = fh
+        self.buffer_size = buffer_size
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            self.deflater.put(self.fh, ''.join(self.parts).encode('utf-8'))
+            self.parts = []
+            self.size = 0
+
+    def close(self):
+        self.flush()
+        self.deflater.put(self.fh, None)
+
+
+class _Output(object):
+    """CSV file of one message type"""
+
+    def __init__(self, fh, message, keys):
+        self.fh = fh
+        self.writerow = csv.writer(fh, lineterminator='\n').writerow
+        self.message = message
+        self.keys = keys
+        self.struct = message.struct
+        self.size = message.size
+
+        # messages of plain numbers go through the texts NDJSONWriter uses,
+        # as str() makes them
+        index = dict((m['key'], i) for i, m in enumerate(message.member_list))
+        self.texts = None
+        if message.struct is not None and all(m['stype'] in _NUMBERS for m in message.member_list):
+            self.texts = []
+            for m in message.member_list:
+                units = m.get('units', {})
+                scale, bias = units.get('scaleby', 1), units.get('bias', 0)
+                self.texts.append(_Floats(scale, bias, str) if m['stype'] in 'fd' else _Texts(scale, bias, str))
+        wanted = [index[k] for k in keys]
+        if wanted == list(range(len(index))):
+            self.get = tuple
+        elif len(wanted) > 1:
+            self.get = operator.itemgetter(*wanted)
+        else:
+            self.get = lambda values: tuple(values[i] for i in wanted)
+
+        fh.write("# [0]SEQN, [1]Timestamp")
+        for i, key in enumerate(keys):
+            fh.write(", [{0}]{1}".format(i + 2, key))
+        fh.write('\n')
+
+    def values(self, buff, start, end):
+        """Values of the body in buff[start:end] in column order"""
+        if self.texts is None or end - start != self.size:
+            data = self.message.decode(buff[start:end])
+            return tuple(data[k] for k in self.keys)
+        return self.get(list(map(operator.getitem, self.texts, self.struct.unpack_from(buff, start))))
+
+
+class CSVWriter(object):
+    """Write a CSV file per message type
+
+    :param str directory: where to write ``<fourcc>.csv`` files, made if it
+                          doesn't exist
+    :param list fourccs: only these types, like ['ADIS', 'GPS1'], default
+                         every known type
+    :param dict columns: printable fourcc to the member keys to write, in
+                         order. Types not listed get every member
+    :param bool compress: write ``<fourcc>.csv.gz`` files, gzipped by a
+                          background thread
+    :param int buffer_size: bytes of text to collect for each file before
+                            it is written
+    :returns: CSVWriter object
+
+    Each file starts with a ``# [0]SEQN, [1]Timestamp, [2]<key>, ...`` line,
+    and each row is the SEQN, timestamp and values of one record, in normal
+    units. A file is only made once a record of its type turns up. Records
+    of unknown types are skipped.
+    """
+
+    def __init__(self, directory='.', fourccs=None, columns=None, compress=False, buffer_size=1 << 20):
+        self.directory = directory
+        self.fourccs = frozenset(_fourcc(n) for n in fourccs) if fourccs is not None else None
+        self.columns = dict((_fourcc(n), list(keys)) for n, keys in (columns or {}).items())
+        for fourcc, keys in self.columns.items():
+            message = messages.MESSAGES.get(messages.printable(fourcc))
+            missing = [k for k in keys if message is None or k not in message.member_dict]
+            if missing:
+                raise ValueError("{0} has no member {1}".format(messages.printable(fourcc), ', '.join(missing)))
+        self.compress = compress
+        self.buffer_size = buffer_size
+        self.count = 0
+        self.files = {}
+        self._outputs = {}
+        self._deflater = None
+        self._seqn = None
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+
+    def _output(self, fourcc):
+        """Output of a type, None to skip it"""
+        message = messages.MESSAGES.get(messages.printable(fourcc))
+        if message is None or (self.fourccs is not None and fourcc not in self.fourccs):
+            self._outputs[fourcc] = None
+            return None
+        name = str(messages.printable(fourcc)) + '.csv'
+        if self.compress:
+            if self._deflater is None:
+                self._deflater = _Deflater()
+                self._deflater.start()
+            name += '.gz'
+            fh = _Chunks(self._deflater, gzip.open(os.path.join(self.directory, name), 'wb', _GZIP_LEVEL), self.buffer_size)
+        else:
+            fh = open(os.path.join(self.directory, name), 'w', buffering=self.buffer_size)
+        keys = self.columns.get(fourcc, [m['key'] for m in message.member_list])
+        output = self._outputs[fourcc] = _Output(fh, message, keys)
+        self.files[fourcc] = name
+        return output
+
+    def write_raw(self, fourcc, raw, seqn=None):
+        """Write one record
+
+        :param bytes fourcc: fourcc from the header
+        :param bytes raw: HEADER and body
+        :param int seqn: SEQN of the datagram it came in. SEQN records
+                         bring their own
+
+        """
+        fourcc, hi, lo, length = HEADER.unpack_from(raw)
+        if fourcc == _SEQN.fourcc and length == _SEQN.size:
+            seqn = _SEQN.decode(raw[HEADER.size:])['Sequence']
+        try:
+            output = self._outputs[fourcc]
+        except KeyError:
+            output = self._output(fourcc)
+        if output is not None:
+            output.writerow((seqn or 0, (hi << 32) | lo) + output.values(raw, HEADER.size, len(raw)))
+            self.count += 1
+
+    def write(self, record):
+        """Write a :class:`psas_packet.pipeline.Record`"""
+        self.write_raw(record.fourcc, record.raw, record.seqn)
+
+    def write_log(self, log, progress=None, block=1 << 20):
+        """Write every record of a log
+
+        :param log: filename, file-like object or segment manifest
+        :param progress: called with each SEQN, such as the ``update`` of a
+                         :class:`psas_packet.pipeline.Progress`
+        :param int block: bytes to read at a time
+
+        """
+        header = HEADER.size
+        unpack_header = HEADER.unpack_from
+        outputs = self._outputs
+        seqn_fourcc = _SEQN.fourcc
+        decode_seqn = _SEQN.struct.unpack_from
+        seqn = self._seqn or 0
+        count = 0
+        buff = b''
+        pos = 0
+        with io.BinFile(log) as source:
+            read = source.fh.read
+            while True:
+                chunk = read(block)
+                if not chunk:
+                    break
+                buff = buff[pos:] + chunk
+                pos = 0
+                end = len(buff)
+                while pos + header <= end:
+                    fourcc, hi, lo, length = unpack_header(buff, pos)
+                    stop = pos + header + length
+                    if stop > end:
+                        # record continues in the next block
+                        break
+                    if fourcc == seqn_fourcc and length == _SEQN.size:
+                        seqn, = decode_seqn(buff, pos + header)
+                        if progress is not None:
+                            progress(seqn)
+                    try:
+                        output = outputs[fourcc]
+                    except KeyError:
+                        output = self._output(fourcc)
+                    if output is not None:
+                        output.writerow((seqn, (hi << 32) | lo) + output.values(buff, pos + header, stop))
+                        count += 1
+                    pos = stop
+        self._seqn = seqn
+        self.count += count
+
+    def close(self):
+        for output in self._outputs.values():
+            if output is not None:
+                output.fh.close()
+        if self._deflater is not None:
+            self._deflater.stop()
+            self._deflater = None
+
+
+def to_csv(log, directory='.', fourccs=None, columns=None, compress=False, progress=None):
+    """Write a log as a CSV file per message type, see :class:`CSVWriter`
+
+    :param log: filename, file-like object or segment manifest
+    :param str directory: where to write the files
+    :param list fourccs: only these types, default every known type
+    :param dict columns: printable fourcc to the member keys to write
+    :param bool compress: gzip the files
+    :param progress: called with each SEQN
+    :returns: number of records written
+
+    """
+    with CSVWriter(directory, fourccs, columns, compress) as out:
+        out.write_log(log, progress)
+        return out.count
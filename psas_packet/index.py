@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Block index of a log with zone maps, so queries can skip whole blocks.
+
+The log is cut into blocks of about ``block_size`` bytes on record
+boundaries. For each block the index keeps its offset and length, the first
+and last timestamp, a bitmap of which fourccs appear in it, and the min and
+max (in normal units) of every numeric field of every fixed size message in
+it. A query only reads blocks whose zone maps say a match is possible.
+"""
+import json
+import os
+from psas_packet import messages
+
+# Bump when the sidecar layout changes
+VERSION = 1
+
+# offset, length, first time, last time, fourcc bitmap, zones
+_OFFSET, _LENGTH, _TMIN, _TMAX, _MASK, _ZONES = range(6)
+
+
+def _signature(fname):
+    st = os.stat(fname)
+    return [st.st_size, st.st_mtime]
+
+
+def _may_match(op, lo, hi, value):
+    """Whether some x in [lo, hi] can satisfy x op value"""
+    if op == '<':
+        return lo < value
+    if op == '<=':
+        return lo <= value
+    if op == '>':
+        return hi > value
+    if op == '>=':
+        return hi >= value
+    if op == '==':
+        return lo <= value <= hi
+    return not (lo == hi == value)
+
+
+class LogIndex(object):
+    """Zone map index of a log file
+
+    :param int block_size: Bytes per block, blocks end on the first record
+                           boundary past this
+    :param Registry registry: Where to look up message types, defaults to
+                              :data:`psas_packet.messages.MESSAGES`
+    :returns: LogIndex object
+
+    """
+
+    def __init__(self, block_size=65536, registry=None):
+        self.block_size = block_size
+        self.registry = registry if registry is not None else messages.MESSAGES
+        self.blocks = []
+        self.fourccs = []
+        self.offset = 0
+        self.signature = None
+        self._layouts = {}
+
+    def _bit(self, name):
+        try:
+            return 1 << self.fourccs.index(name)
+        except ValueError:
+            self.fourccs.append(name)
+            return 1 << (len(self.fourccs) - 1)
+
+    def _layout(self, fourcc):
+        """(message, [(column, scaleby, bias)]) for a fourcc, or None if it
+        can't have zones"""
+        if fourcc not in self._layouts:
+            message = self.registry.get(messages.printable(fourcc))
+            if message is None or message.variable:
+                self._layouts[fourcc] = None
+            else:
+                columns = []
+                for i, m in enumerate(message.member_list):
+                    if 's' not in m['stype'] and m['stype'] not in ('c', '?', 'x'):
+                        units = m.get('units', {})
+                        columns.append((i, units.get('scaleby', 1), units.get('bias', 0)))
+                self._layouts[fourcc] = (message, columns)
+        return self._layouts[fourcc]
+
+    def _block(self, offset, buff, records):
+        """Index entry for one block from its (fourcc, timestamp, body) records"""
+        mask = 0
+        tmin = tmax = None
+        bodies = {}
+        for fourcc, timestamp, body in records:
+            bodies.setdefault(fourcc, []).append(body)
+            if tmin is None or timestamp < tmin:
+                tmin = timestamp
+            if tmax is None or timestamp > tmax:
+                tmax = timestamp
+
+        zones = {}
+        for fourcc, group in bodies.items():
+            name = messages.printable(fourcc)
+            mask |= self._bit(name)
+            layout = self._layout(fourcc)
+            if layout is None:
+                continue
+            message, columns = layout
+            group = [b for b in group if len(b) == message.size]
+            if not group:
+                continue
+            cols = list(zip(*messages._iter_unpack(message.struct, b''.join(group))))
+            zone = [None] * len(message.member_list)
+            for i, scaleby, bias in columns:
+                lo, hi = min(cols[i]), max(cols[i])
+                if lo != lo or hi != hi:
+                    # NaN first in the block, min and max mean nothing
+                    continue
+                lo, hi = lo * scaleby + bias, hi * scaleby + bias
+                if scaleby < 0:
+                    lo, hi = hi, lo
+                zone[i] = [lo, hi]
+            zones[name] = zone
+        return [offset, len(buff), tmin, tmax, mask, zones]
+
+    def update(self, log):
+        """Index any records written to the log since the last update
+
+        :param str log: log filename
+
+        """
+        if os.path.getsize(log) < self.offset:
+            # log was replaced, start over
+            self.blocks = []
+            self.offset = 0
+        elif self.blocks and self.blocks[-1][_LENGTH] < self.block_size:
+            # redo a short last block so blocks stay about block_size
+            self.offset = self.blocks.pop()[_OFFSET]
+
+        header = messages.HEADER.size
+        unpack_header = messages.HEADER.unpack_from
+        with open(log, 'rb') as fh:
+            fh.seek(self.offset)
+            buff = b''
+            while True:
+                block = fh.read(self.block_size)
+                buff += block
+                pos = 0
+                records = []
+                end = len(buff)
+                while pos + header <= end and (pos < self.block_size or not block):
+                    fourcc, hi, lo, length = unpack_header(buff, pos)
+                    if pos + header + length > end:
+                        break
+                    records.append((fourcc, (hi << 32) | lo, buff[pos + header:pos + header + length]))
+                    pos += header + length
+                if pos >= self.block_size or (not block and records):
+                    self.blocks.append(self._block(self.offset, buff[:pos], records))
+                    self.offset += pos
+                    buff = buff[pos:]
+                if not block:
+                    break
+
+        self.signature = _signature(log)
+
+    def _wanted(self, where):
+        """Per fourcc bit and zone tests for a where dict"""
+        wanted = []
+        for name, predicates in where.items():
+            message = self.registry[name]
+            tests = []
+            for key, op, value in predicates:
+                if key == 'timestamp':
+                    tests.append((None, op, value))
+                elif key in message.member_dict:
+                    tests.append((message.member_dict[key]['i'], op, value))
+            bit = 0
+            if name in self.fourccs:
+                bit = 1 << self.fourccs.index(name)
+            wanted.append((name, bit, tests))
+        return wanted
+
+    def may_match(self, entry, wanted):
+        """Whether a block could hold a record the query wants"""
+        for name, bit, tests in wanted:
+            if not entry[_MASK] & bit:
+                continue
+            zone = entry[_ZONES].get(name)
+            for i, op, value in tests:
+                if i is None:
+                    # block times bound the times of every type in it
+                    if not _may_match(op, entry[_TMIN], entry[_TMAX], value):
+                        break
+                elif zone is not None and zone[i] is not None:
+                    if not _may_match(op, zone[i][0], zone[i][1], value):
+                        break
+            else:
+                return True
+        return False
+
+    def select(self, where):
+        """Byte ranges of the log that could hold matching records
+
+        :param where: dict of printable fourcc to list of (key, op, value)
+                      predicates, as for :class:`psas_packet.query.Filter`,
+                      or a Filter
+        :returns: list of (offset, length), adjacent blocks merged
+
+        """
+        where = getattr(where, 'where', where)
+        wanted = self._wanted(where)
+        ranges = []
+        for entry in self.blocks:
+            if not self.may_match(entry, wanted):
+                continue
+            if ranges and ranges[-1][0] + ranges[-1][1] == entry[_OFFSET]:
+                ranges[-1] = (ranges[-1][0], ranges[-1][1] + entry[_LENGTH])
+            else:
+                ranges.append((entry[_OFFSET], entry[_LENGTH]))
+        return ranges
+
+    def save(self, path):
+        state = {
+            'version': VERSION,
+            'block_size': self.block_size,
+            'offset': self.offset,
+            'signature': self.signature,
+            'fourccs': self.fourccs,
+            'blocks': self.blocks,
+        }
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(json.dumps(state).encode('utf-8'))
+        os.rename(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read an index saved with :meth:`save`
+
+        :returns: LogIndex, or None if the file is missing, damaged or out
+                  of date
+
+        """
+        try:
+            with open(path, 'rb') as f:
+                state = json.loads(f.read().decode('utf-8'))
+            if state['version'] != VERSION:
+                return None
+            index = cls(state['block_size'])
+            index.offset = state['offset']
+            index.signature = state['signature']
+            index.fourccs = state['fourccs']
+            index.blocks = state['blocks']
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+        return index
+
+
+def log_index(log, block_size=65536, cache=True):
+    """Build the index of a log, reusing and extending its ``<log>.index``
+    sidecar
+
+    :param str log: log filename
+    :param int block_size: Bytes per block
+    :param bool cache: read and write the sidecar file
+    :returns: LogIndex
+
+    """
+    sidecar = log + '.index'
+    index = LogIndex.load(sidecar) if cache else None
+    if index is None or index.block_size != block_size:
+        index = LogIndex(block_size)
+    if index.signature != _signature(log):
+        index.update(log)
+        if cache:
+            index.save(sidecar)
+    return index
@@ -6,6 +6,7 @@ import errno
 import sys
 import time
 from psas_packet import messages
+from psas_packet.stats import clock, Histogram
 
 SEQN = messages.MESSAGES['SEQN']
 HEADER = messages.HEADER
@@ -25,12 +26,30 @@ class Network(object):
     """Read from a network protcol and decode
 
     :param connection: socket to read from
+    :param logfile: filename or file-like object to log raw data to
+    :param stats: :class:`psas_packet.stats.Stats` to record counters in
+    :param decoder: function to decode messages with, defaults to
+                    :func:`psas_packet.messages.decode`. Use
+                    ``CompactDecoder().decode`` to receive compact messages
+    :param ring: :class:`psas_packet.ring.RingWriter` to hand every framed
+                 message to other processes through
+    :param reorder: :class:`psas_packet.reorder.ReorderBuffer` to put
+                    datagrams back in SEQN order and drop duplicates with
+    :param tracer: :class:`psas_packet.latency.LatencyTracer` to time every
+                   message from its producer to the consumer with
     :returns: Network object
 
     """
 
-    def __init__(self, connection, logfile=None):
+    def __init__(self, connection, logfile=None, stats=None, decoder=None, ring=None, reorder=None,
+                 tracer=None):
         self.conn = connection
+        self._stats = stats
+        self.decode = decoder if decoder is not None else messages.decode
+        self.ring = ring
+        self.reorder = reorder
+        self.tracer = tracer
+        self._local_port = None
 
         self.fh = None
         if logfile is not None:
@@ -41,39 +60,154 @@ class Network(object):
             else:
                 self.fh = open(logfile, 'wb')
 
-    def listen(self):
+    def listen(self, framed=False):
         """Read from socket, and decode the messages inside.
+
+        :param bool framed: also yield the HEADER and body bytes of each
+                            message, as they would be in a log, giving
+                            (time, (fourcc, data), bytes). The SEQN is
+                            framed with the arrival time, and SEQE gaps
+                            have None
+
+        With a reorder buffer this yields the datagrams that are ready, in
+        SEQN order, and a SEQE message in place of each gap. If the socket
+        has a timeout, a listen that times out still releases datagrams
+        whose wait has expired.
         """
 
         # grab bits off the wire
-        buff, addr = self.conn.recvfrom(2048)
+        try:
+            buff, addr = self.conn.recvfrom(2048)
+        except socket.timeout:
+            if self.reorder is None:
+                raise
+            buff = None
         timestamp = time.time()
+        stats = self._stats
+
+        if buff is not None and stats is not None:
+            stats.datagram(timestamp, len(buff))
+
+        reorder = self.reorder
+        if reorder is None:
+            if buff is not None:
+                for out in self._datagram(buff, timestamp, framed):
+                    yield out
+            return
 
         if buff is not None:
             seqn = SEQN.decode(buff[:SEQN.size])
             if seqn is None:
                 return
-            yield timestamp, ('SEQN', seqn)
-            buff = buff[SEQN.size:]
-
-            if self.fh is not None:
-                self.fh.write(HEADER.encode(SEQN, int(timestamp)))
-                self.fh.write(SEQN.encode(seqn))
-                self.fh.write(buff)
-                self.fh.flush()
-
-            # decode until we run out of bytes
-            while buff != '':
-                try:
-                    bytes_read, data = messages.decode(buff)
-                    buff = buff[bytes_read:]
-                    yield timestamp, data
-                except messages.MessageSizeError:
-                    print("out of sync")
-                    return
-                except:
-                    print("Reader Broke!")
-                    return
+            reorder.push(seqn['Sequence'], buff, timestamp)
+        for out in self._released(reorder.pop(timestamp), framed):
+            yield out
+
+    def flush(self, framed=False):
+        """Release everything still held in the reorder buffer, at the end of
+        a stream
+
+        :param bool framed: also yield message bytes, see :meth:`listen`
+        """
+        if self.reorder is None:
+            return
+        for out in self._released(self.reorder.flush(), framed):
+            yield out
+
+    def _released(self, datagrams, framed):
+        """Decode datagrams let out of the reorder buffer, with a SEQE for
+        each gap"""
+        for seqn, buff, arrived, missing in datagrams:
+            if missing:
+                gap = ('SEQE', {'Port': self._port(),
+                                'Expected': (seqn - missing) % (1 << 32),
+                                'Received': seqn})
+                yield (arrived, gap, None) if framed else (arrived, gap)
+            for out in self._datagram(buff, arrived, framed):
+                yield out
+
+    def _port(self):
+        if self._local_port is None:
+            try:
+                self._local_port = self.conn.getsockname()[1]
+            except (socket.error, IndexError, TypeError):
+                self._local_port = 0
+        return self._local_port
+
+    def _datagram(self, buff, timestamp, framed=False):
+        """Log, forward and decode one datagram"""
+        stats = self._stats
+        tracer = self.tracer
+        if tracer is not None:
+            port = self._port()
+        seqn = SEQN.decode(buff[:SEQN.size])
+        if seqn is None:
+            return
+        if self.ring is not None or framed:
+            frame = HEADER.encode(SEQN, int(timestamp)) + SEQN.encode(seqn)
+            if self.ring is not None:
+                self.ring.write(frame, timestamp)
+        yield (timestamp, ('SEQN', seqn), frame) if framed else (timestamp, ('SEQN', seqn))
+        buff = buff[SEQN.size:]
+
+        if self.fh is not None:
+            if stats is not None:
+                start = clock()
+            self.fh.write(HEADER.encode(SEQN, int(timestamp)))
+            self.fh.write(SEQN.encode(seqn))
+            self.fh.write(buff)
+            self.fh.flush()
+            if stats is not None:
+                stats.log_write_latency.record((clock() - start) * 1e6)
+
+        # decode until we run out of bytes
+        while buff:
+            try:
+                if stats is not None:
+                    start = clock()
+                    bytes_read, data = self.decode(buff)
+                    stats.decode_latency.record((clock() - start) * 1e6)
+                    stats.message(data[0])
+                    if 'raw' in data[1]:
+                        stats.unknown += 1
+                else:
+                    bytes_read, data = self.decode(buff)
+                frame = buff[:bytes_read]
+                if self.ring is not None:
+                    self.ring.write(frame, timestamp)
+                buff = buff[bytes_read:]
+                out = (timestamp, data, frame) if framed else (timestamp, data)
+                if tracer is None:
+                    yield out
+                    continue
+                decoded = time.time()
+                fourcc = data[0]
+                if 'timestamp' in data[1]:
+                    tracer.arrived(port, fourcc, data[1]['timestamp'], timestamp)
+                tracer.decoded(port, fourcc, timestamp, decoded)
+                yield out
+                # back here once the consumer wants the next message
+                tracer.consumed(port, fourcc, decoded, time.time())
+            except messages.MessageSizeError:
+                if stats is not None:
+                    stats.out_of_sync += 1
+                print("out of sync")
+                return
+            except:
+                if stats is not None:
+                    stats.errors += 1
+                print("Reader Broke!")
+                return
+
+    def stats(self):
+        """Snapshot of the receive counters
+
+        :returns: dict of counters, or None if this Network was made without stats
+
+        """
+        if self._stats is None:
+            return None
+        return self._stats.snapshot()
 
     def send_data(self, msgtype, seqn, data):
         """Send message with a sequence number header over a socket. Does the packing for you.
@@ -96,10 +230,142 @@ class Network(object):
                 raise
 
 
+class BatchSender(object):
+    """Send many messages per datagram
+
+    :param connection: connected socket to send on
+    :param int mtu: Link MTU. Datagrams are kept under this minus the IP and
+                    UDP headers
+    :param float max_delay: Longest a message waits for company, in seconds
+    :param int seqn: First sequence number to send
+    :returns: BatchSender object
+
+    Messages are framed with a :data:`HEADER` and packed back to back after a
+    SEQN, exactly as :meth:`Network.listen` reads them. A datagram is sent
+    when the next message wouldn't fit, or when the oldest message has waited
+    max_delay. There is no timer thread: call :meth:`poll` from your loop (or
+    :meth:`timeout` to know how long you can sleep) so a quiet stream still
+    goes out on time.
+    """
+
+    # IPv4 + UDP header
+    OVERHEAD = 28
+
+    def __init__(self, connection, mtu=1500, max_delay=0.01, seqn=0):
+        self.conn = connection
+        self.size = mtu - self.OVERHEAD - SEQN.size
+        self.max_delay = max_delay
+        self.seqn = seqn
+        self._start = clock()
+        self._buff = []
+        self._length = 0
+        self._queued = []
+        self._deadline = None
+
+        self.datagrams = 0
+        self.messages = 0
+        self.latency = Histogram()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.flush()
+
+    def add(self, msgtype, data, timestamp=None):
+        """Queue a message to send
+
+        :param Message msgtype: Message class to use for packing
+        :param dict data: Data to get packed and sent
+        :param int timestamp: Header timestamp in nanoseconds, defaults to
+                              time since this sender was made
+
+        """
+        now = clock()
+        if timestamp is None:
+            timestamp = int((now - self._start) * 1e9)
+        body = msgtype.encode(data)
+        self.add_raw(HEADER.encode(msgtype, timestamp, len(body)) + body, now)
+
+    def add_raw(self, framed, now=None):
+        """Queue an already framed message (header and body)
+
+        :param bytes framed: Message with its header
+
+        """
+        if now is None:
+            now = clock()
+        if self._length and self._length + len(framed) > self.size:
+            self._send(now)
+
+        self._buff.append(framed)
+        self._length += len(framed)
+        self._queued.append(now)
+        if self._deadline is None:
+            self._deadline = now + self.max_delay
+
+        if self._length >= self.size or now >= self._deadline:
+            self._send(now)
+
+    def timeout(self):
+        """Seconds until the pending datagram is due, or None if empty"""
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - clock())
+
+    def poll(self):
+        """Send the pending datagram if its deadline has passed"""
+        if self._deadline is not None:
+            now = clock()
+            if now >= self._deadline:
+                self._send(now)
+
+    def flush(self):
+        """Send anything pending now"""
+        if self._buff:
+            self._send(clock())
+
+    def _send(self, now):
+        datagram = SEQN.encode({'Sequence': self.seqn}) + b''.join(self._buff)
+        self.seqn += 1
+        try:
+            self.conn.send(datagram)
+        except socket.error as e:
+            if e.errno == errno.ECONNREFUSED:
+                print('connection refused, continuing')
+            else:
+                raise
+
+        self.datagrams += 1
+        self.messages += len(self._queued)
+        for queued in self._queued:
+            self.latency.record((now - queued) * 1e6)
+        self._buff = []
+        self._length = 0
+        self._queued = []
+        self._deadline = None
+
+    def stats(self):
+        """Batching efficiency so far
+
+        :returns: dict with datagrams, messages, messages per datagram and
+                  the added latency in microseconds
+
+        """
+        return {
+            'datagrams': self.datagrams,
+            'messages': self.messages,
+            'messages_per_datagram': self.messages / float(self.datagrams) if self.datagrams else 0.0,
+            'latency_us': self.latency.summary(),
+        }
+
+
 class BinFile(object):
     """Read from a binary log file
 
-    :param fname: A filename or file-like object
+    :param fname: A filename or file-like object. A ``.manifest`` file
+                  written by :class:`psas_packet.segment.SegmentWriter`
+                  reads all its segments as one log
     :returns: BinFile object
 
     """
@@ -108,7 +374,11 @@ class BinFile(object):
 
         # Try and see if the passed in file is filename (string) or an object that might act like a file
         if _is_string_like(fname):
-            self.fh = open(fname, 'rb')
+            if fname.endswith('.manifest'):
+                from psas_packet import segment
+                self.fh = segment.SegmentedFile(fname)
+            else:
+                self.fh = open(fname, 'rb')
         else:
             self.fh = fname
 
@@ -134,45 +404,56 @@ class BinFile(object):
             raw = self.fh.read(length)
             yield fourcc, (header + raw)
 
-    def read(self):
+    def read(self, units=True):
         """Read the file and return data inside it
+
+        :param bool units: convert to normal units, otherwise values are
+                           left as packed, see :meth:`psas_packet.messages.Message.decode`
         """
 
         for _fourcc, raw in self.scan():
-            _bytes_read, data = messages.decode(raw)
+            _bytes_read, data = messages.decode(raw, units)
             yield data
 
+    def filter(self, where, index=None):
+        """Read only records that match a filter. Predicates are tested on
+        the raw bytes, so records that don't match are never decoded
+
+        :param where: dict of printable fourcc to list of (key, op, value)
+                      predicates, or a :class:`psas_packet.query.Filter`
+                      to get the scanned and decoded counts afterwards
+        :param index: :class:`psas_packet.index.LogIndex` of this log. Blocks
+                      its zone maps rule out are not read at all
+        :returns: generator of (fourcc, dict) tuples
 
-def log2csv(f_in):
+        A segmented log skips, and never opens, segments whose manifest
+        entry rules them out.
+        """
+        from psas_packet import query
+        if not isinstance(where, query.Filter):
+            where = query.Filter(where)
+        if index is not None:
+            ranges = index.select(where)
+        elif hasattr(self.fh, 'select'):
+            ranges = self.fh.select(where)
+        else:
+            ranges = None
+        return where.run(self.fh, ranges)
+
+
+def log2csv(f_in, directory='.', fourccs=None, columns=None, compress=False, progress=True):
     """Read in a binary logfile and output a set of .csv files with the data
-    """
 
-    files = {}
-    seq = 0
-    with BinFile(f_in) as log:
-
-        # Read file
-        for fourcc, data in log.read():
-            if fourcc in messages.MESSAGES:
-
-                # first time seeing data from this type
-                if fourcc not in files:
-                    files[fourcc] = open(str(fourcc)+'.csv', 'w')
-                    files[fourcc].write("# [0]SEQN, [1]Timestamp")
-                    for i, member in enumerate(messages.MESSAGES[fourcc].member_list):
-                        files[fourcc].write(", [{0}]{1}".format(i+2, member['key']))
-                    files[fourcc].write('\n')
-
-                if fourcc == b'SEQN':
-                    seq = data['Sequence']
-                    sys.stdout.write(" SEQN: %10d \r" % seq)
-                    sys.stdout.flush()
-
-                f_out = files[fourcc]
-                f_out.write(str(seq)+","+str(data['timestamp']))
-                for member in messages.MESSAGES[fourcc].member_list:
-                    f_out.write(","+str(data[member['key']]))
-                f_out.write('\n')
-
-    for fourcc, fh in files.items():
-        fh.close()
+    :param f_in: filename, file-like object or segment manifest
+    :param str directory: where to write the ``<fourcc>.csv`` files
+    :param list fourccs: only these types, default every known type
+    :param dict columns: printable fourcc to the member keys to write
+    :param bool compress: gzip the files
+    :param bool progress: show the SEQN on stderr a few times a second
+    :returns: number of records written
+
+    See :class:`psas_packet.export.CSVWriter`.
+    """
+    from psas_packet import export, pipeline
+    update = pipeline.Progress(sys.stderr, interval=0.2).update if progress else None
+    return export.to_csv(f_in, directory, fourccs, columns, compress, update)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Where telemetry lag comes from, from the producer's timestamp to the
+code that uses the message.
+
+Each message is timed in three stages, per port and fourcc:
+
+``transit``
+    From the producer's HEADER timestamp to the datagram arriving.
+``decode``
+    From arrival until the message is decoded.
+``consume``
+    From decode until the consumer is done with it and asks for the next
+    message.
+
+The producer's clock isn't the ground clock, so transit needs the offset
+between them. Unless one is given, it is estimated for each port as the
+smallest ``arrival - producer time`` seen in the last two windows. That
+takes the fastest message as zero transit, so transit times are the lag
+above the best the link has done. A fixed offset, for producers on a
+synchronized clock, gives absolute transit instead.
+
+All latencies are recorded in microseconds in
+:class:`psas_packet.stats.Histogram`.
+"""
+import time
+from psas_packet.stats import Histogram
+
+STAGES = ('transit', 'decode', 'consume')
+
+
+class _Offset(object):
+    """Running minimum of arrival - producer time over two windows"""
+
+    def __init__(self, window):
+        self.window = window
+        self.start = None
+        self.current = None
+        self.previous = None
+
+    def update(self, diff, now):
+        if self.start is None or now - self.start >= self.window:
+            self.previous = self.current
+            self.current = diff
+            self.start = now
+        elif diff < self.current:
+            self.current = diff
+
+    @property
+    def value(self):
+        if self.previous is None:
+            return self.current
+        return min(self.current, self.previous)
+
+
+class LatencyTracer(object):
+    """Latency histograms of each stage, per port and fourcc
+
+    :param float offset: Seconds to add to producer time to get ground
+                         time, if the clocks are known to agree. Estimated
+                         per port when None
+    :param float window: Seconds per window of the offset estimate. The
+                         estimate follows clock drift within two windows
+    :param int sub_bits: Precision of the histograms
+    :returns: LatencyTracer object
+
+    Pass one to :class:`psas_packet.io.Network` as ``tracer`` to time every
+    message it decodes, or wrap any other source of messages with
+    :meth:`trace`.
+    """
+
+    def __init__(self, offset=None, window=10.0, sub_bits=5):
+        self.offset = offset
+        self.window = window
+        self.sub_bits = sub_bits
+        self.histograms = {}
+        self._offsets = {}
+
+    def _stages(self, port, fourcc):
+        key = (port, fourcc)
+        stages = self.histograms.get(key)
+        if stages is None:
+            stages = self.histograms[key] = dict((s, Histogram(self.sub_bits)) for s in STAGES)
+        return stages
+
+    def clock_offset(self, port=0):
+        """Seconds to add to a producer timestamp to get ground time
+
+        :param int port: Port the producer sends to
+        :returns: float, or None before anything has arrived
+
+        """
+        if self.offset is not None:
+            return self.offset
+        estimate = self._offsets.get(port)
+        return estimate.value if estimate is not None else None
+
+    def arrived(self, port, fourcc, produced, received):
+        """Record the transit time of a message
+
+        :param int port: Port it came in on
+        :param str fourcc: printable fourcc
+        :param int produced: HEADER timestamp, nanoseconds
+        :param float received: arrival time, Unix seconds
+
+        """
+        produced = produced * 1e-9
+        offset = self.offset
+        if offset is None:
+            estimate = self._offsets.get(port)
+            if estimate is None:
+                estimate = self._offsets[port] = _Offset(self.window)
+            estimate.update(received - produced, received)
+            offset = estimate.value
+        self._stages(port, fourcc)['transit'].record((received - produced - offset) * 1e6)
+
+    def decoded(self, port, fourcc, received, decoded):
+        """Record the time from arrival to decoded
+
+        :param float received: arrival time
+        :param float decoded: time decoding finished
+
+        """
+        self._stages(port, fourcc)['decode'].record((decoded - received) * 1e6)
+
+    def consumed(self, port, fourcc, decoded, consumed):
+        """Record the time from decoded to the consumer being done
+
+        :param float decoded: time decoding finished
+        :param float consumed: time the consumer was done with it
+
+        """
+        self._stages(port, fourcc)['consume'].record((consumed - decoded) * 1e6)
+
+    def trace(self, source, port=0):
+        """Time a stream of decoded messages
+
+        :param source: iterable of (arrival time, (fourcc, data)), such as
+                       ``RingReader.listen()`` in another process
+        :param int port: Port to file them under
+        :returns: generator of the same items
+
+        Transit is recorded as each message comes out, and consume as the
+        time from arrival until the consumer asks for the next one. The
+        decode stage is left to whatever decoded them.
+        """
+        for received, message in source:
+            fourcc, data = message
+            produced = data.get('timestamp')
+            if produced is not None and fourcc != 'SEQN':
+                self.arrived(port, fourcc, produced, received)
+            yield received, message
+            self.consumed(port, fourcc, received, time.time())
+
+    def summary(self, percentiles=(50, 90, 99, 99.9)):
+        """Percentiles of every stage
+
+        :returns: dict with 'offsets' (port to seconds) and 'latency'
+                  ('<port>/<fourcc>' to stage to histogram summary)
+
+        """
+        out = {'offsets': dict((port, self.clock_offset(port)) for port in self._offsets), 'latency': {}}
+        for (port, fourcc), stages in sorted(self.histograms.items()):
+            out['latency']['{0}/{1}'.format(port, fourcc)] = dict(
+                (stage + '_us', h.summary(percentiles)) for stage, h in stages.items() if h.count)
+        return out
+
+    def report(self):
+        """Human readable table of the p50, p99 and max of every stage
+
+        :returns: str
+
+        """
+        lines = ["{0:<14} {1:<8} {2:>9} {3:>10} {4:>10} {5:>10}".format(
+            'port/fourcc', 'stage', 'count', 'p50 us', 'p99 us', 'max us')]
+        for (port, fourcc), stages in sorted(self.histograms.items()):
+            for stage in STAGES:
+                h = stages[stage]
+                if h.count:
+                    lines.append("{0:<14} {1:<8} {2:>9} {3:>10} {4:>10} {5:>10}".format(
+                        '{0}/{1}'.format(port, fourcc), stage, h.count,
+                        h.percentile(50), h.percentile(99), h.max))
+        for port in sorted(self._offsets):
+            lines.append("port {0} clock offset {1:.6f} s".format(port, self.clock_offset(port)))
+        return '\n'.join(lines)
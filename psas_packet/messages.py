@@ -1,5 +1,6 @@
 """ PSAS Message definitions, encoding and decoding functions.
 """
+import binascii
 import struct
 
 FIXLENGTH = [b'MPL3']
@@ -7,9 +8,10 @@ FIXLENGTH = [b'MPL3']
 ################################################################################
 # Exceptions:
 ################################################################################
-class MessageSizeError(Exception):
+class MessageSizeError(ValueError):
     """Raised when the byte str to be unpacked does not match the expected
-    size for this type. Check your message boundaries.
+    size for this type. Check your message boundaries. A ValueError, so it
+    can be caught along with other bad data errors.
 
     :param int expected: correct size
     :param int got: attempted size
@@ -19,17 +21,33 @@ class MessageSizeError(Exception):
 
     def __init__(self, expected, got):
         msg = "Wrong data size, expected {0} bytes, given {1}".format(expected, got)
+        ValueError.__init__(self, msg)
+
+
+class SchemaError(Exception):
+    """Raised when a message definition is malformed.
+
+    :param str source: where the definition came from
+    :param str problem: what is wrong with it
+    :returns: SchemaError exception
+
+    """
+
+    def __init__(self, source, problem):
+        msg = "Bad message definition in {0}: {1}".format(source, problem)
         Exception.__init__(self, msg)
 
 
 ################################################################################
 # Decoders:
 ################################################################################
-def decode(buff):
+def decode(buff, units=True):
     """Decode a single message from a block of bytes. Attempts to read a message
     in the given byte array.
 
     :param bytes buff: bytes to try and decode
+    :param bool units: convert to normal units, otherwise leave the raw
+                       packed values, see :meth:`Message.decode`
     :returns: Tuple: Number of bytes read, and a dictionary with unpacked values
 
     """
@@ -45,10 +63,9 @@ def decode(buff):
 
     # Don't recognize it. Skip it but make a record that we tried to unpack
     if message_cls is None:
-        fmt_body = ' '.join('{:02X}'.format(ord(b)) for b in body)
-        return HEADER.size + length, (printable(fourcc), {'timestamp': timestamp, 'raw': fmt_body})
+        return HEADER.size + length, (printable(fourcc), {'timestamp': timestamp, 'raw': hexdump(body)})
 
-    unpacked = message_cls.decode(body)
+    unpacked = message_cls.decode(body, units)
     return HEADER.size + length, (printable(fourcc), dict({'timestamp': timestamp}, **unpacked))
 
 
@@ -61,17 +78,19 @@ class Head(object):
     def __init__(self):
         self.size = self.struct.size
 
-    def encode(self, message_class, time):
+    def encode(self, message_class, time, length=None):
         """Make a header for a given message class. Headers also contain
         timestamps of the local time a data was created.
 
         :param Message message_class: Type message to encode
         :param int time: Timestamp in nanoseconds
+        :param int length: Body length, required for variable size messages
         :returns: array of raw bytes the size of a Head.struct.size
 
         """
         fourcc = message_class.fourcc
-        length = message_class.struct.size
+        if length is None:
+            length = message_class.size
 
         # make weird 6 byte timestamp
         timestamp_hi = (time >> 32) & 0xffff
@@ -81,6 +100,22 @@ class Head(object):
         raw = self.struct.pack(fourcc, timestamp_hi, timestamp_lo, length)
         return raw
 
+    def unpack_from(self, buff, offset=0):
+        """Unpack a header in place, for walking the records in a block of
+        a log without slicing each one out first
+
+        :param buff: buffer holding the header
+        :param int offset: where the header starts
+        :returns: tuple of the fourcc, high 16 and low 32 bits of the
+                  timestamp, and body length, with the length fixed for
+                  FIXLENGTH types as :meth:`decode` does
+
+        """
+        fourcc, hi, lo, length = self.struct.unpack_from(buff, offset)
+        if fourcc in FIXLENGTH:
+            length = MESSAGES.size(printable(fourcc))
+        return fourcc, hi, lo, length
+
     def decode(self, raw):
         """Take a buffer of bytes and attempt to decode a header
 
@@ -99,8 +134,7 @@ class Head(object):
 
             # FIX special ones
         if fourcc in FIXLENGTH:
-            message_cls = MESSAGES.get(printable(fourcc))
-            length = message_cls.size
+            length = MESSAGES.size(printable(fourcc))
 
         return fourcc, timestamp, length
 
@@ -119,10 +153,12 @@ class Message(object):
     def __init__(self, definition):
         self.name = definition['name']
         self.fourcc = definition['fourcc']
+        self.endianness = definition['endianness']
 
         # Pre-compute struct for fixed size packets
         self.member_dict = {}
         self.member_list = []
+        self._keys = [m['key'] for m in definition['members']]
         if definition['size'] == "Fixed":
             struct_string = definition['endianness']
             for i, m in enumerate(definition['members']):
@@ -130,8 +166,22 @@ class Message(object):
                 self.member_list.append(m)
                 struct_string += m['stype']
             self.struct = struct.Struct(struct_string)
+            self.size = self.struct.size
+            self.variable = False
 
-        self.size = self.struct.size
+        # Variable size packets get a plan of fixed runs and length
+        # prefixed parts, walked with unpack_from
+        elif definition['size'] == "Variable":
+            for i, m in enumerate(definition['members']):
+                self.member_dict[m['key']] = {'i': i, 'units': m.get('units', {})}
+                self.member_list.append(m)
+            self.plan = _plan(definition['endianness'], self.member_list)
+            self.struct = None
+            self.size = None
+            self.variable = True
+
+        else:
+            raise SchemaError(self.name, "unknown size {0!r}".format(definition['size']))
 
     def __repr__(self):
         return "<{0} message>".format(self.name)
@@ -146,6 +196,9 @@ class Message(object):
         have values who's keys match the members list.
         """
 
+        if self.variable:
+            return self._encode_variable(data)
+
         # Initialize as zeros
         values = [0] * len(self.member_list)
 
@@ -164,19 +217,27 @@ class Message(object):
 
         return self.struct.pack(*values)
 
-    def decode(self, raw):
+    def decode(self, raw, units=True):
         """Decode a single message body (the data lines). Header info and
         message boundaries are solved in network
 
         :param bytestr raw: Raw string of bytes the length of
+        :param bool units: convert to normal units. If False the values are
+                           left as packed, ADC counts stay ints, and can be
+                           converted later with :meth:`to_units`
         :returns: A dictionary of values in normal units
         """
 
+        if self.variable:
+            return self._decode_variable(raw, units)
+
         if len(raw) != self.struct.size:
             raise(MessageSizeError(self.struct.size, len(raw)))
             return
 
         unpack = self.struct.unpack(raw)
+        if not units:
+            return dict(zip(self._keys, unpack))
 
         values = {}
         for i, v in enumerate(unpack):
@@ -191,6 +252,102 @@ class Message(object):
         # Return dictionary instead of list
         return values
 
+    def to_units(self, key, values):
+        """Convert raw packed values of a member to normal units
+
+        :param str key: member key
+        :param values: a value from ``decode(raw, units=False)``, a list of
+                       them, or a NumPy array of a whole column
+        :returns: the same kind of thing in normal units. Arrays of scaled
+                  members come back as float64
+
+        Members without ``scaleby`` or ``bias`` are returned as they are.
+        """
+        units = self.member_dict[key]['units']
+        if 'scaleby' not in units and 'bias' not in units:
+            return values
+        scale = units.get('scaleby', 1)
+        bias = units.get('bias', 0)
+        if isinstance(values, (list, tuple)):
+            return [(v * scale) + bias for v in values]
+        if hasattr(values, 'dtype'):
+            import numpy
+            out = numpy.multiply(values, scale, dtype=numpy.float64)
+            if bias:
+                out += bias
+            return out
+        return (values * scale) + bias
+
+    def _encode_variable(self, data):
+        parts = []
+        for kind, prefix, st, members in self.plan:
+            if kind == _FIXED:
+                parts.append(st.pack(*[_packable(m, data.get(m['key'], 0)) for m in members]))
+                continue
+
+            m = members[0]
+            value = data.get(m['key'])
+            if kind == _STRING:
+                value = value or b''
+                parts.append(prefix.pack(len(value)))
+                parts.append(value)
+            elif kind == _ARRAY:
+                value = value or []
+                parts.append(prefix.pack(len(value)))
+                parts.append(st(len(value)).pack(*[_packable(m, v) for v in value]))
+            else:
+                value = value or []
+                parts.append(prefix.pack(len(value)))
+                for group in value:
+                    parts.append(st.pack(*[_packable(g, group.get(g['key'], 0)) for g in m['members']]))
+        return b''.join(parts)
+
+    def _decode_variable(self, raw, units=True):
+        convert = _convert if units else _as_is
+        values = {}
+        offset = 0
+        end = len(raw)
+        for kind, prefix, st, members in self.plan:
+            if kind == _FIXED:
+                if offset + st.size > end:
+                    raise(MessageSizeError(offset + st.size, end))
+                for m, v in zip(members, st.unpack_from(raw, offset)):
+                    values[m['key']] = convert(m, v)
+                offset += st.size
+                continue
+
+            if offset + prefix.size > end:
+                raise(MessageSizeError(offset + prefix.size, end))
+            n, = prefix.unpack_from(raw, offset)
+            offset += prefix.size
+
+            m = members[0]
+            if kind == _STRING:
+                size = n
+            elif kind == _ARRAY:
+                item = st(n)
+                size = item.size
+            else:
+                size = n * st.size
+            if offset + size > end:
+                raise(MessageSizeError(offset + size, end))
+
+            if kind == _STRING:
+                values[m['key']] = raw[offset:offset + n]
+            elif kind == _ARRAY:
+                values[m['key']] = [convert(m, v) for v in item.unpack_from(raw, offset)]
+            else:
+                groups = []
+                for i in range(n):
+                    unpacked = st.unpack_from(raw, offset + i * st.size)
+                    groups.append(dict((g['key'], convert(g, v)) for g, v in zip(m['members'], unpacked)))
+                values[m['key']] = groups
+            offset += size
+
+        if offset != end:
+            raise(MessageSizeError(offset, end))
+        return values
+
     def typedef(self):
         """Autogen c style typedef structs
 
@@ -205,10 +362,23 @@ class Message(object):
 
         # data
         for line in self.member_list:
-            stype = line['stype']
-
             var = line['key'].lower()
 
+            # variable parts are a length field, followed by the data
+            if 'count' in line:
+                typestruct += "\t{0} {1}_count;\n".format(CTYPES[line['count']], var)
+                if 'members' in line:
+                    fields = ' '.join("{0} {1};".format(CTYPES[g['stype']], g['key'].lower())
+                                      for g in line['members'])
+                    typestruct += "\t/* struct {{ {0} }} {1}[{1}_count]; */\n".format(fields, var)
+                elif line['stype'] == 's':
+                    typestruct += "\t/* char {0}[{0}_count]; */\n".format(var)
+                else:
+                    typestruct += "\t/* {0} {1}[{1}_count]; */\n".format(CTYPES[line['stype']], var)
+                continue
+
+            stype = line['stype']
+
             if 's' in stype:
                 ctype = 'char'
                 size = int(stype.replace('s', ''))
@@ -229,10 +399,405 @@ class Message(object):
 
         return typestruct
 
+    def ctype(self):
+        """Packed ctypes structure with the same layout as :meth:`typedef`,
+        see :func:`psas_packet.overlay.ctype`
+        """
+        from psas_packet import overlay
+        return overlay.ctype(self)
+
+    def dtype(self):
+        """NumPy dtype with the same layout as :meth:`typedef`, see
+        :func:`psas_packet.overlay.dtype`. Needs NumPy
+        """
+        from psas_packet import overlay
+        return overlay.dtype(self)
+
+
+################################################################################
+# Registry
+################################################################################
+def schema_hash(definitions):
+    """Stable hash of a list of message definitions
+
+    :param list definitions: Message definition dictionaries
+    :returns: hex digest string
+
+    """
+    import hashlib
+    import json
+
+    def _bytes(b):
+        return b.decode('latin-1')
+    text = json.dumps(list(definitions), sort_keys=True, default=_bytes)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def layout(definition):
+    """Work out the packed struct format and size of a message definition
+    without building the :class:`Message`
+
+    :param dict definition: Dictionary defining data in a message
+    :returns: dict with the struct 'format' and 'size' in bytes, both None
+              for variable size messages
+
+    """
+    if definition['size'] == "Variable":
+        return {'format': None, 'size': None}
+    fmt = definition['endianness'] + ''.join(m['stype'] for m in definition['members'])
+    return {'format': fmt, 'size': struct.calcsize(fmt)}
+
+
+def validate(definition, source='<definition>'):
+    """Check a message definition and normalize it into the form the built-in
+    definitions use (fourcc as 4 bytes)
+
+    :param dict definition: Dictionary defining data in a message
+    :param str source: Where it came from, for error messages
+    :returns: The normalized definition dictionary
+
+    """
+    for key in ('name', 'fourcc', 'size', 'endianness', 'members'):
+        if key not in definition:
+            raise SchemaError(source, "missing '{0}'".format(key))
+
+    definition = dict(definition)
+    fourcc = definition['fourcc']
+    if not isinstance(fourcc, bytes):
+        fourcc = fourcc.encode('latin-1')
+    if len(fourcc) != 4:
+        raise SchemaError(source, "fourcc {0!r} is not 4 bytes".format(fourcc))
+    definition['fourcc'] = fourcc
+
+    if definition['size'] not in ("Fixed", "Variable"):
+        raise SchemaError(source, "unknown size {0!r}".format(definition['size']))
+    variable = definition['size'] == "Variable"
+
+    def check(m):
+        if 'key' not in m or ('stype' not in m and 'members' not in m):
+            raise SchemaError(source, "{0} member needs a 'key' and 'stype'".format(definition['name']))
+        if ('count' in m or 'members' in m) and not variable:
+            raise SchemaError(source, "{0} is length prefixed in a Fixed message".format(m['key']))
+        if 'members' in m and 'count' not in m:
+            raise SchemaError(source, "{0} group needs a 'count'".format(m['key']))
+        try:
+            if 'count' in m and m['count'] not in ('B', 'b', 'H', 'h', 'L', 'l', 'Q', 'q'):
+                raise struct.error("count must be an integer type")
+            if 'count' in m and len(m.get('stype', 'B')) != 1:
+                raise struct.error("counted stype must be a single character")
+            if 'stype' in m:
+                struct.calcsize(definition['endianness'] + m['stype'])
+            if 'bits' in m and (m.get('stype') not in ('B', 'H', 'L', 'Q') or not 0 < m['bits'] <= 64):
+                raise struct.error("bits only work on unsigned integer types")
+        except struct.error as e:
+            raise SchemaError(source, "{0}.{1}: {2}".format(definition['name'], m['key'], e))
+
+    for m in definition['members']:
+        check(m)
+        for g in m.get('members', []):
+            if 'stype' not in g or 'count' in g or 'members' in g or 's' in g['stype']:
+                raise SchemaError(source, "{0}.{1} group members must be fixed numbers".format(m['key'], g.get('key')))
+            check(g)
+    return definition
+
+
+def read_schema(path):
+    """Read message definitions from a JSON or TOML file
+
+    :param str path: File to read. TOML is used for a .toml extension
+    :returns: list of definition dictionaries
+
+    The file holds a list of definitions with the same shape as the
+    dictionaries passed to :class:`Message`, under a top level "messages" key
+    (a bare list is also accepted for JSON). Fourccs are strings; GPS style
+    raw bytes can be written as escapes, e.g. "GPS\\u0001".
+    """
+    if path.endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:
+            import toml as tomllib
+        with open(path, 'rb') as f:
+            data = tomllib.loads(f.read().decode('utf-8'))
+    else:
+        import json
+        with open(path) as f:
+            data = json.load(f)
+
+    if isinstance(data, dict):
+        data = data.get('messages', [])
+    return [validate(d, path) for d in data]
+
+
+class Registry(object):
+    """Lazy collection of message types, keyed by printable fourcc
+
+    :param list definitions: Message definition dictionaries
+    :returns: Registry instance
+
+    Definitions are kept as plain data. A :class:`Message` (and its struct)
+    is only built the first time that fourcc is looked up, so tools that
+    touch one or two types don't pay for all of them at import.
+    """
+
+    def __init__(self, definitions=()):
+        self._definitions = {}
+        self._messages = {}
+        self._layouts = {}
+        for definition in definitions:
+            self.define(definition)
+
+    def define(self, definition):
+        """Add (or replace) a message definition
+
+        :param dict definition: Dictionary defining data in a message
+
+        """
+        key = printable(definition['fourcc'])
+        self._definitions[key] = definition
+        self._messages.pop(key, None)
+        self._layouts.pop(key, None)
+
+    def remove(self, fourcc):
+        """Drop a message type from the registry
+
+        :param str fourcc: printable fourcc
+
+        """
+        del self._definitions[fourcc]
+        self._messages.pop(fourcc, None)
+        self._layouts.pop(fourcc, None)
+
+    def load(self, path, cache_dir=None):
+        """Merge message definitions from a schema file into the registry.
+        Definitions from the file replace any existing ones with the same
+        fourcc.
+
+        :param str path: JSON or TOML schema file, see :func:`read_schema`
+        :param str cache_dir: Optional directory for compiled schema cache
+        :returns: list of printable fourccs that were loaded
+
+        With a cache directory the parsed and compiled definitions are stored
+        keyed by a hash of the file, in the JSON format of :meth:`save_cache`,
+        so loading the same schema again skips parsing and validation.
+        """
+        cache = None
+        if cache_dir is not None:
+            import hashlib
+            import os
+            with open(path, 'rb') as f:
+                key = hashlib.sha1(f.read()).hexdigest()
+            cache_path = os.path.join(cache_dir, key + '.json')
+            cache = _read_cache(cache_path, key)
+            if cache is not None and 'definitions' not in cache:
+                cache = None
+
+        if cache is not None:
+            definitions, layouts = cache['definitions'], cache['layouts']
+        else:
+            definitions = read_schema(path)
+            layouts = dict((printable(d['fourcc']), layout(d)) for d in definitions)
+            if cache_dir is not None:
+                try:
+                    _write_cache(cache_path, key, layouts, definitions)
+                except (IOError, OSError):
+                    # no cache this time, the schema is loaded all the same
+                    pass
+
+        loaded = []
+        for definition in definitions:
+            self.define(definition)
+            key = printable(definition['fourcc'])
+            self._layouts[key] = layouts[key]
+            loaded.append(key)
+        return loaded
+
+    def definition(self, fourcc):
+        """The raw definition dictionary for a fourcc"""
+        return self._definitions[fourcc]
+
+    def __getitem__(self, fourcc):
+        message = self._messages.get(fourcc)
+        if message is None:
+            message = Message(self._definitions[fourcc])
+            self._messages[fourcc] = message
+        return message
+
+    def get(self, fourcc, default=None):
+        message = self._messages.get(fourcc)
+        if message is not None:
+            return message
+        if fourcc in self._definitions:
+            return self[fourcc]
+        return default
+
+    def __contains__(self, fourcc):
+        return fourcc in self._definitions
+
+    def __iter__(self):
+        return iter(self._definitions)
+
+    def __len__(self):
+        return len(self._definitions)
+
+    def keys(self):
+        return list(self._definitions)
+
+    def values(self):
+        return [self[k] for k in self._definitions]
+
+    def items(self):
+        return [(k, self[k]) for k in self._definitions]
+
+    def size(self, fourcc):
+        """Size in bytes of a message body, without building the message
+
+        :param str fourcc: printable fourcc
+        :returns: int size
+
+        """
+        message = self._messages.get(fourcc)
+        if message is not None:
+            return message.size
+        info = self._layouts.get(fourcc)
+        if info is None:
+            info = layout(self._definitions[fourcc])
+            self._layouts[fourcc] = info
+        return info['size']
+
+    def schema_hash(self):
+        """Hash of every definition in the registry"""
+        return schema_hash(self._definitions[k] for k in sorted(self._definitions))
+
+    def save_cache(self, path):
+        """Write the compiled layout of every message to a cache file
+
+        :param str path: File to write
+
+        """
+        layouts = dict((k, self._layouts.get(k) or layout(d)) for k, d in self._definitions.items())
+        _write_cache(path, self.schema_hash(), layouts)
+
+    def load_cache(self, path):
+        """Read compiled layouts from a cache file written by :meth:`save_cache`
+
+        :param str path: File to read
+        :returns: True if the cache matched these definitions and was used
+
+        """
+        cache = _read_cache(path, self.schema_hash())
+        if cache is None:
+            return False
+        self._layouts.update(cache['layouts'])
+        return True
+
+
+def _write_cache(path, key, layouts, definitions=None):
+    """Write a compiled schema cache: JSON with the hash it is good for,
+    the layout of each message and optionally the definitions themselves.
+    Replaced atomically, so a reader never sees half a cache"""
+    import json
+    import os
+    cache = {'hash': key, 'layouts': layouts}
+    if definitions is not None:
+        # fourccs are bytes, and not always valid UTF-8
+        cache['definitions'] = [dict(d, fourcc=d['fourcc'].decode('latin-1')) for d in definitions]
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(json.dumps(cache).encode('utf-8'))
+    os.rename(tmp, path)
+
+
+def _read_cache(path, key):
+    """A cache written by :func:`_write_cache`, or None if it is missing,
+    damaged or for some other hash. Fourccs come back as bytes"""
+    import json
+    try:
+        with open(path, 'rb') as f:
+            cache = json.loads(f.read().decode('utf-8'))
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(cache, dict) or cache.get('hash') != key or 'layouts' not in cache:
+        return None
+    for definition in cache.get('definitions', ()):
+        definition['fourcc'] = definition['fourcc'].encode('latin-1')
+    return cache
+
 
 ################################################################################
 # Utils
 ################################################################################
+# Kinds of steps in a variable size message plan
+_FIXED, _STRING, _ARRAY, _GROUP = range(4)
+
+
+def _plan(endianness, members):
+    """Precompute how to walk a variable size message
+
+    Runs of fixed members are merged into one struct. Each length prefixed
+    string, array or repeated group becomes its own step with a struct for
+    the count that comes before it.
+
+    :returns: list of (kind, prefix struct, struct, members) tuples
+
+    """
+    plan = []
+    run = []
+    for m in members:
+        if 'count' not in m:
+            run.append(m)
+            continue
+        if run:
+            plan.append((_FIXED, None, struct.Struct(endianness + ''.join(r['stype'] for r in run)), run))
+            run = []
+        prefix = struct.Struct(endianness + m['count'])
+        if 'members' in m:
+            group = struct.Struct(endianness + ''.join(g['stype'] for g in m['members']))
+            plan.append((_GROUP, prefix, group, [m]))
+        elif m['stype'] == 's':
+            plan.append((_STRING, prefix, None, [m]))
+        else:
+            plan.append((_ARRAY, prefix, _array_struct(endianness, m['stype']), [m]))
+    if run:
+        plan.append((_FIXED, None, struct.Struct(endianness + ''.join(r['stype'] for r in run)), run))
+    return plan
+
+
+def _array_struct(endianness, stype):
+    """Function returning a (cached) struct for n items of stype"""
+    cache = {}
+
+    def get(n):
+        st = cache.get(n)
+        if st is None:
+            st = struct.Struct(endianness + str(n) + stype)
+            if len(cache) < 64:
+                cache[n] = st
+        return st
+    return get
+
+
+def _convert(m, v):
+    """Packed value to normal units"""
+    if type(v) is int or type(v) is float:
+        units = m.get('units', {})
+        v = (v * units.get('scaleby', 1)) + units.get('bias', 0)
+    return v
+
+
+def _as_is(m, v):
+    """Packed value left as it is"""
+    return v
+
+
+def _packable(m, v):
+    """Normal units to a value struct can pack"""
+    if isinstance(v, bytes):
+        return v
+    units = m.get('units', {})
+    return Packable((v - units.get('bias', 0)) / units.get('scaleby', 1.0))
+
+
 def printable(s):
     """Takes fourcc code and makes a printable string
 
@@ -246,14 +811,39 @@ def printable(s):
     if s.startswith(b'GPS'):
         char = s[-1]
         if type(char) is int:
-            s = 'GPS' + str(char)
+            s = s[:3].decode('utf-8') + str(char)
         else:
-            s = 'GPS' + str(ord(char))
+            s = s[:3].decode('utf-8') + str(ord(char))
         return s
 
     return s.decode('utf-8')
 
 
+def hexdump(body):
+    """Format raw bytes as space separated hex, e.g. '0A FF 00'
+
+    :param bytes body: bytes to format
+    :returns: str
+
+    """
+    try:
+        return bytes(body).hex(' ').upper()
+    except (AttributeError, TypeError):
+        # no separator before Python 3.8
+        h = binascii.hexlify(bytes(body)).decode('ascii').upper()
+        return ' '.join([h[i:i + 2] for i in range(0, len(h), 2)])
+
+
+def _iter_unpack(st, buff):
+    """Every record of a Struct packed back to back in buff, like
+    Struct.iter_unpack, which Python 2 doesn't have"""
+    if hasattr(st, 'iter_unpack'):
+        return st.iter_unpack(buff)
+    if len(buff) % st.size:
+        raise struct.error("buffer size must be a multiple of {0}".format(st.size))
+    return (st.unpack_from(buff, offset) for offset in range(0, len(buff), st.size))
+
+
 # for some reason floats in python 3 wont cast to int automatically
 class Packable(float):
     def __index__(self):
@@ -285,7 +875,7 @@ _rnhumbscale = (3.3/2**12)
 # Types:
 ################################################################################
 _list = [
-Message({
+{
     'name': "SequenceNo",
     'fourcc': b'SEQN',
     'size': "Fixed",
@@ -293,8 +883,8 @@ Message({
     'members': [
         {'key': "Sequence", 'stype': "L"},
     ]
-}),
-Message({
+},
+{
     'name': "SequenceError",
     'fourcc': b'SEQE',
     'size': "Fixed",
@@ -304,8 +894,8 @@ Message({
         {'key': "Expected", 'stype': "L"},
         {'key': "Received", 'stype': "L"},
     ]
-}),
-Message({
+},
+{
     'name': "ADIS16405",
     'fourcc': b'ADIS',
     'size': "Fixed",
@@ -324,8 +914,8 @@ Message({
         {'key': "Temp",    'stype': "h", 'units': {'mks': "degree c",  'scaleby': 0.14, 'bias': 25}},
         {'key': "Aux_ADC", 'stype': "H", 'units': {'mks': "volt",      'scaleby': 806}},
     ]
-}),
-Message({
+},
+{
     'name': "State",
     'fourcc': b'VSTE',
     'size': "Fixed",
@@ -338,28 +928,28 @@ Message({
         {'key': "Roll_Rate",    'stype': "d", 'units': {'mks': "degrees/s"}},
         {'key': "Roll_Angle",   'stype': "d", 'units': {'mks': "degrees"}},
     ]
-}),
-Message({
+},
+{
     'name': "MPL3115A2",
     'fourcc': b'MPL3',
     'size': "Fixed",
     'endianness': '!',
     'members': [
         {'key': "Pressure",             'stype': "L", 'units': {'mks': "kPa",      'scaleby': 1.5625e-5 }},
-        {'key': "Temp",                 'stype': "h", 'units': {'mks': "degree c", 'scaleby': 1/256}},
+        {'key': "Temp",                 'stype': "h", 'units': {'mks': "degree c", 'scaleby': 1/256.0}},
     ]
-}),
-Message({
+},
+{
     'name': "RollServo",
     'fourcc': b'ROLL',
     'size': "Fixed",
     'endianness': '!',
     'members': [
         {'key': "Angle",                'stype': "d"},
-        {'key': "Disable",              'stype': "B"},
+        {'key': "Disable",              'stype': "B", 'bits': 1},
     ]
-}),
-Message({
+},
+{
     'name': "BMP180Pressure",
     'fourcc': b'BMP1',
     'size': "Fixed",
@@ -368,8 +958,8 @@ Message({
         {'key': "Pressure",             'stype': "L"},
         {'key': "Temperature",          'stype': "H"},
     ]
-}),
-Message({
+},
+{
     'name': "RNHHealth",
     'fourcc': b'RNHH',
     'size': "Fixed",
@@ -389,8 +979,8 @@ Message({
         {'key': "PackVoltage",              'stype': "H", 'units': {'mks': "volt",      'scaleby': 0.001}},
         {'key': "AverageVoltage",           'stype': "H", 'units': {'mks': "volt",      'scaleby': 0.001}},
     ]
-}),
-Message({
+},
+{
     'name': "RNHPower",
     'fourcc': b'RNHP',
     'size': "Fixed",
@@ -405,17 +995,17 @@ Message({
         {'key': "Port7",                        'stype': "H", 'units': {'mks': 'amp', 'scaleby': _rnhpscale}},
         {'key': "Port8",                        'stype': "H", 'units': {'mks': 'amp', 'scaleby': _rnhpscale}},
     ]
-}),
-Message({
+},
+{
     'name': "RNHUmbilical",
     'fourcc': b'RNHU',
     'size': "Fixed",
     'endianness': '!',
     'members': [
-        {'key': "Detect",                       'stype': "B"},
+        {'key': "Detect",                       'stype': "B", 'bits': 1},
     ]
-}),
-Message({
+},
+{
     'name': "FCFHealth",
     'fourcc': b'FCFH',
     'size': "Fixed",
@@ -448,8 +1038,8 @@ Message({
         {'key': "IO_wlan0_Packets_Recv",        'stype': 'L'},
         {'key': "Core_Temp",                    'stype': 'H'},
     ]
-}),
-Message({
+},
+{
     'name': "Venus8Navigation",
     'fourcc': b'V8A8',
     'size': "Fixed",
@@ -475,17 +1065,17 @@ Message({
         {'key': "ECEF_VY",              'stype': "l" ,  'units': {'mks': "m/s",    "scaleby": 1e-2}},
         {'key': "ECEF_VZ",              'stype': "l" ,  'units': {'mks': "m/s",    "scaleby": 1e-2}},
     ]
-}),
-Message({
+},
+{
     'name': "LaunchTowerComputer",
     'fourcc': b'LTCH',
     'size': "Fixed",
     'endianness': '!',
     'members': [
         {'key': "Rocket_Ready",                  'stype': "f", 'units': {'mks': "volt"}},
-        {'key': "Iginition_Relay",               'stype': "B"},
+        {'key': "Iginition_Relay",               'stype': "B", 'bits': 1},
         {'key': "Ignition_Battery",              'stype': "f", 'units': {'mks': "volt"}},
-        {'key': "Shore_Power_Relay",             'stype': "B"},
+        {'key': "Shore_Power_Relay",             'stype': "B", 'bits': 1},
         {'key': "Shore_Power",                   'stype': "f", 'units': {'mks': "volt"}},
         {'key': "Solar_Voltage",                 'stype': "f", 'units': {'mks': "volt"}},
         {'key': "System_Battery",                'stype': "f", 'units': {'mks': "volt"}},
@@ -496,8 +1086,8 @@ Message({
         {'key': "Wind_Direction",                'stype': "f"},
         {'key': "Barometric_Pressure",           'stype': "f"}
     ]
-}),
-Message({
+},
+{
     'name': "GPSFix",
     'fourcc': b'GPS'+chr(1).encode(),
     'size': "Fixed",
@@ -517,8 +1107,8 @@ Message({
         {'key': "Nav_Mode",             'stype': 'H'},
         {'key': "Extended_Age_Of_Diff", 'stype': 'H', 'units': {'mks': "second"}},
     ]
-}),
-Message({
+},
+{
     'name': "GPSFixQuality",
     'fourcc': b'GPS'+chr(2).encode(),
     'size': "Fixed",
@@ -531,8 +1121,8 @@ Message({
         {'key': "VDOP",                 'stype': 'H', 'units': {'scaleby': 10}},
         {'key': "Mask_WAAS_PRN",        'stype': 'H'},
     ]
-}),
-Message({
+},
+{
     'name': "GPSWAASMessage",
     'fourcc': b'GPS'+chr(80).encode(),
     'size': "Fixed",
@@ -543,8 +1133,8 @@ Message({
         {'key': "Msg_Sec_of_Week",      'stype': 'L'},
         {'key': "Waas_Msg",             'stype': '32s'},
     ]
-}),
-Message({
+},
+{
     'name': "GPSWAASEphemeris",
     'fourcc': b'GPS'+chr(93).encode(),
     'size': "Fixed",
@@ -568,8 +1158,8 @@ Message({
         {'key': "Gf_Zero",              'stype': 'H'},
         {'key': "Gf_Zero_Dot",          'stype': 'H'},
     ]
-}),
-Message({
+},
+{
     'name': "GPSIonosphereUTC",
     'fourcc': b'GPS'+chr(94).encode(),
     'size': "Fixed",
@@ -593,8 +1183,8 @@ Message({
         {'key': "dtlsf",                'stype': 'H'},
         {'key': "space",                'stype': 'H'},
     ]
-}),
-Message({
+},
+{
     'name': "GPSEphemeris",
     'fourcc': b'GPS'+chr(95).encode(),
     'size': "Fixed",
@@ -607,8 +1197,8 @@ Message({
         {'key': "SF2_Words",            'stype': '40s'},
         {'key': "SF3_Words",            'stype': '40s'},
     ]
-}),
-Message({
+},
+{
     'name': "GPSPsudorange",
     'fourcc': b'GPS'+chr(96).encode(),
     'size': "Fixed",
@@ -666,8 +1256,8 @@ Message({
         {'key': "Phase_10",             'stype': 'd', 'units': {'mks': "meter"}},
         {'key': "Phase_11",             'stype': 'd', 'units': {'mks': "meter"}},
     ]
-}),
-Message({
+},
+{
     'name': "GPSProcessor",
     'fourcc': b'GPS'+chr(97).encode(),
     'size': "Fixed",
@@ -684,8 +1274,8 @@ Message({
         {'key': "spare4",               'stype': 'H'},
         {'key': "spare5",               'stype': 'H'},
     ]
-}),
-Message({
+},
+{
     'name': "GPSAlmanac",
     'fourcc': b'GPS'+chr(98).encode(),
     'size': "Fixed",
@@ -696,8 +1286,8 @@ Message({
         {'key': "IonoUTCV_Flag",        'stype': 'B'},
         {'key': "spare",                'stype': 'H'},
     ]
-}),
-Message({
+},
+{
     'name': "GPSSatellite",
     'fourcc': b'GPS'+chr(99).encode(),
     'size': "Fixed",
@@ -941,7 +1531,36 @@ Message({
         {'key': "Clock_Err_L1",         'stype': 'h'},
         {'key': "spare",                'stype': 'H'},
     ]
-})]
+}]
 
-MESSAGES = {printable(cls.fourcc): cls for cls in _list}
+MESSAGES = Registry(_list)
 HEADER = Head()
+
+
+def load_schema(path, cache_dir=None):
+    """Add message definitions from a JSON or TOML file to :data:`MESSAGES`
+
+    :param str path: Schema file
+    :param str cache_dir: Optional directory for compiled schema cache
+    :returns: list of printable fourccs that were loaded
+
+    """
+    return MESSAGES.load(path, cache_dir)
+
+
+def _load_environment():
+    """Load any schema files listed in the PSAS_PACKET_SCHEMA environment
+    variable (separated like PATH). A file that can't be loaded is reported
+    with a warning and skipped, so a bad schema can't break the import"""
+    import os
+    import warnings
+    paths = os.environ.get('PSAS_PACKET_SCHEMA')
+    if paths:
+        for path in paths.split(os.pathsep):
+            if path:
+                try:
+                    load_schema(path, os.environ.get('PSAS_PACKET_SCHEMA_CACHE'))
+                except (SchemaError, ImportError, IOError, OSError, ValueError, KeyError, TypeError) as e:
+                    warnings.warn("PSAS_PACKET_SCHEMA: skipping {0}: {1}".format(path, e))
+
+_load_environment()
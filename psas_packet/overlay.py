@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Packed ctypes structures and NumPy dtypes made from message definitions.
+
+These have the same layout as the C structs from
+:meth:`psas_packet.messages.Message.typedef`, so a receive buffer or an
+mmap'd log can be overlaid and fields read in place without unpacking.
+Overlaid fields are the raw packed values, ``units`` scaling is not applied.
+
+NumPy is optional and only imported by the dtype functions.
+"""
+import ctypes
+from psas_packet import messages
+
+# struct format character to ctypes type, standard sizes
+CTYPES = {
+    'b': ctypes.c_int8,
+    'B': ctypes.c_uint8,
+    'h': ctypes.c_int16,
+    'H': ctypes.c_uint16,
+    'i': ctypes.c_int32,
+    'I': ctypes.c_uint32,
+    'l': ctypes.c_int32,
+    'L': ctypes.c_uint32,
+    'q': ctypes.c_int64,
+    'Q': ctypes.c_uint64,
+    'f': ctypes.c_float,
+    'd': ctypes.c_double,
+    'c': ctypes.c_char,
+    '?': ctypes.c_bool,
+}
+
+# struct format character to NumPy type code, without byte order
+DTYPES = {
+    'b': 'i1',
+    'B': 'u1',
+    'h': 'i2',
+    'H': 'u2',
+    'i': 'i4',
+    'I': 'u4',
+    'l': 'i4',
+    'L': 'u4',
+    'q': 'i8',
+    'Q': 'u8',
+    'f': 'f4',
+    'd': 'f8',
+    'c': 'S1',
+    '?': 'b1',
+}
+
+_BASES = {
+    '!': ctypes.BigEndianStructure,
+    '>': ctypes.BigEndianStructure,
+    '<': ctypes.LittleEndianStructure,
+    '=': ctypes.Structure,
+    '@': ctypes.Structure,
+}
+
+_ORDERS = {'!': '>', '>': '>', '<': '<', '=': '=', '@': '='}
+
+
+def _fields(message):
+    if message.variable:
+        raise messages.SchemaError(message.name, "overlays need a Fixed size message")
+    fields = []
+    for m in message.member_list:
+        stype = m['stype']
+        if stype.endswith('s'):
+            fields.append((m['key'], int(stype[:-1] or 1)))
+        elif stype == 'x':
+            fields.append((None, 1))
+        else:
+            fields.append((m['key'], stype))
+    return fields
+
+
+class Header(ctypes.BigEndianStructure):
+    """Packed message header, with the 6 byte timestamp split the same way
+    as on the wire"""
+    _pack_ = 1
+    _fields_ = [
+        ('ID', ctypes.c_char * 4),
+        ('timestamp_hi', ctypes.c_uint16),
+        ('timestamp_lo', ctypes.c_uint32),
+        ('data_length', ctypes.c_uint16),
+    ]
+
+    @property
+    def timestamp(self):
+        """Timestamp in nanoseconds"""
+        return self.timestamp_hi << 32 | self.timestamp_lo
+
+
+def ctype(message):
+    """Packed ctypes structure for the body of a message
+
+    :param Message message: Fixed size message type
+    :returns: ctypes.Structure subclass named after the message
+
+    """
+    cls = message.__dict__.get('_ctype')
+    if cls is None:
+        fields = []
+        pad = 0
+        for name, t in _fields(message):
+            if name is None:
+                fields.append(('_pad{0}'.format(pad), ctypes.c_uint8))
+                pad += 1
+            elif isinstance(t, int):
+                fields.append((name, ctypes.c_char * t))
+            else:
+                fields.append((name, CTYPES[t]))
+        base = _BASES[message.endianness]
+        cls = type(str(message.name + 'Data'), (base,), {'_pack_': 1, '_fields_': fields})
+        message._ctype = cls
+    return cls
+
+
+def record_ctype(message):
+    """Packed ctypes structure for a header followed by a message body, like
+    the ``<fourcc>Message`` typedef
+
+    :param Message message: Fixed size message type
+    :returns: ctypes.Structure subclass
+
+    """
+    cls = message.__dict__.get('_record_ctype')
+    if cls is None:
+        # the outer struct only nests, each part keeps its own byte order
+        cls = type(str(message.name + 'Message'), (ctypes.Structure,),
+                   {'_pack_': 1, '_fields_': [('header', Header), ('data', ctype(message))]})
+        message._record_ctype = cls
+    return cls
+
+
+def view(cls, buff, offset=0):
+    """Overlay a ctypes structure on a buffer
+
+    :param cls: structure from :func:`ctype`, :func:`record_ctype` or
+                :class:`Header`
+    :param buff: writable buffer (bytearray, mmap, ...) to overlay in place.
+                 Read only buffers such as bytes are copied
+    :param int offset: where the structure starts
+    :returns: structure instance
+
+    """
+    try:
+        return cls.from_buffer(buff, offset)
+    except TypeError:
+        return cls.from_buffer_copy(buff, offset)
+
+
+def header_dtype():
+    """NumPy dtype of a packed message header"""
+    import numpy
+    return numpy.dtype([('ID', 'S4'), ('timestamp_hi', '>u2'), ('timestamp_lo', '>u4'), ('data_length', '>u2')])
+
+
+def dtype(message):
+    """NumPy dtype for the body of a message
+
+    :param Message message: Fixed size message type
+    :returns: numpy.dtype with one field per member
+
+    """
+    import numpy
+    order = _ORDERS[message.endianness]
+    fields = []
+    for name, t in _fields(message):
+        if name is None:
+            fields.append(('', 'V1'))
+        elif isinstance(t, int):
+            fields.append((name, 'S{0}'.format(t)))
+        else:
+            fields.append((name, order + DTYPES[t]))
+    return numpy.dtype(fields)
+
+
+def record_dtype(message):
+    """NumPy dtype for a header followed by a message body
+
+    :param Message message: Fixed size message type
+    :returns: numpy.dtype with 'header' and 'data' fields
+
+    """
+    import numpy
+    return numpy.dtype([('header', header_dtype()), ('data', dtype(message))])
+
+
+def timestamps(headers):
+    """Timestamps in nanoseconds from an array of headers
+
+    :param headers: NumPy array with :func:`header_dtype`
+    :returns: int64 array
+
+    """
+    import numpy
+    return (headers['timestamp_hi'].astype(numpy.int64) << 32) | headers['timestamp_lo']
+
+
+def frombuffer(buff, message, offset=0, count=-1, records=True):
+    """Overlay a run of records (or bare bodies) of one type as a NumPy array,
+    without copying
+
+    :param buff: buffer holding the records
+    :param Message message: Fixed size message type
+    :param int offset: byte offset of the first record
+    :param int count: number of records, -1 for as many as fit
+    :param bool records: records have headers, otherwise bare bodies
+    :returns: numpy structured array viewing buff
+
+    """
+    import numpy
+    dt = record_dtype(message) if records else dtype(message)
+    if count < 0:
+        count = (len(buff) - offset) // dt.itemsize
+    return numpy.frombuffer(buff, dtype=dt, count=count, offset=offset)
@@ -0,0 +1,554 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Composable operators over streams of telemetry records.
+
+A pipeline starts from a source, a log file or a live
+:class:`psas_packet.io.Network`, and chains operators that each return a new
+pipeline. Nothing runs until it is iterated or sent to sinks::
+
+    pipeline.from_log('flight.log').select(['ADIS']).where(lambda r: r.data['VCC'] > 5).to(
+        pipeline.LogSink('high.log'), pipeline.CSVSink('csv'))
+
+Both kinds of source yield :class:`Record` objects. A record from a log holds
+its raw bytes and decodes them only if something reads ``data``, so
+``select`` and sinks that copy bytes never decode at all. Runs of
+``select``, ``where``, ``map`` and ``tee`` are fused into a single loop, so
+chaining them doesn't stack generators. Operators that group records
+(``batch``, ``window``) yield lists of records.
+
+A sink is any object with ``write(item)`` and ``close()``.
+"""
+from __future__ import print_function
+import binascii
+import errno
+import os
+import socket
+import sys
+import time
+from psas_packet import export, messages
+
+SEQN = messages.MESSAGES['SEQN']
+HEADER = messages.HEADER
+
+_SELECT, _WHERE, _MAP, _TEE = range(4)
+
+
+def _fourcc(name):
+    """fourcc bytes for a printable name or fourcc"""
+    # names first: on Python 2 'GPS1' is bytes too, but means GPS\x01
+    message = messages.MESSAGES.get(name)
+    if message is not None:
+        return message.fourcc
+    if isinstance(name, bytes):
+        return name
+    return name.encode('latin-1')
+
+
+class Record(object):
+    """One message in a stream
+
+    :param bytes fourcc: fourcc from the header
+    :param bytes raw: HEADER and body, or None if only decoded data is known
+    :param dict data: decoded values with 'timestamp', or None to decode
+                      raw on first use
+    :param int seqn: the last SEQN seen in the stream, including this one
+    :param float received: arrival time for live records, else None
+
+    """
+
+    __slots__ = ('fourcc', 'seqn', 'received', '_raw', '_data')
+
+    def __init__(self, fourcc, raw=None, data=None, seqn=None, received=None):
+        self.fourcc = fourcc
+        self.seqn = seqn
+        self.received = received
+        self._raw = raw
+        self._data = data
+
+    @property
+    def name(self):
+        """Printable fourcc"""
+        return messages.printable(self.fourcc)
+
+    @property
+    def data(self):
+        """Decoded values, with 'timestamp'"""
+        if self._data is None:
+            self._data = messages.decode(self._raw)[1][1]
+        return self._data
+
+    @property
+    def raw(self):
+        """HEADER and body bytes, as in a log file"""
+        if self._raw is None:
+            data = self._data
+            timestamp = data.get('timestamp', int(self.received or 0))
+            message = messages.MESSAGES.get(self.name)
+            if message is None:
+                # unknown types pass through with the body messages.decode
+                # kept as hex
+                if 'raw' not in data:
+                    raise ValueError("no bytes for {0} records, an unknown type".format(self.name))
+                body = binascii.unhexlify(data['raw'].replace(' ', ''))
+                header = HEADER.struct.pack(self.fourcc, (timestamp >> 32) & 0xffff, timestamp & 0xffffffff, len(body))
+            else:
+                body = message.encode(data)
+                header = HEADER.encode(message, timestamp, len(body))
+            self._raw = header + body
+        return self._raw
+
+    @property
+    def timestamp(self):
+        """Header timestamp in nanoseconds"""
+        if self._raw is not None:
+            fourcc, hi, lo, length = HEADER.struct.unpack_from(self._raw)
+            return (hi << 32) | lo
+        return self._data.get('timestamp')
+
+    @property
+    def message(self):
+        """(printable fourcc, data), as from :meth:`psas_packet.io.BinFile.read`"""
+        return self.name, self.data
+
+    def __repr__(self):
+        return 'Record({0!r}, seqn={1!r})'.format(self.name, self.seqn)
+
+
+def _scan(log):
+    from psas_packet import io
+    seqn = None
+    with io.BinFile(log) as f:
+        for fourcc, raw in f.scan():
+            if fourcc == SEQN.fourcc and len(raw) == HEADER.size + SEQN.size:
+                seqn = SEQN.decode(raw[HEADER.size:])['Sequence']
+            yield Record(fourcc, raw, None, seqn)
+
+
+def _decoded(source):
+    fourccs = {}
+    seqn = None
+    for item in source:
+        received, (name, data) = item[:2]
+        fourcc = fourccs.get(name)
+        if fourcc is None:
+            fourcc = fourccs[name] = _fourcc(name)
+        if fourcc == SEQN.fourcc:
+            seqn = data['Sequence']
+        yield Record(fourcc, item[2] if len(item) > 2 else None, data, seqn, received)
+
+
+def _listen(net):
+    while True:
+        for item in net.listen(framed=True):
+            yield item
+
+
+def from_log(log):
+    """Pipeline over the records of a log
+
+    :param log: filename, file-like object or segment manifest, anything
+                :class:`psas_packet.io.BinFile` opens
+    :returns: :class:`Pipeline`
+
+    """
+    return Pipeline(lambda: _scan(log))
+
+
+def from_messages(source):
+    """Pipeline over decoded messages
+
+    :param source: iterable of (arrival time, (fourcc, data)), such as
+                   ``Network.listen()`` or ``RingReader.listen()``, or of
+                   (arrival time, (fourcc, data), bytes) from
+                   ``Network.listen(framed=True)``, whose records keep the
+                   bytes as they came
+    :returns: :class:`Pipeline`
+
+    """
+    return Pipeline(lambda: _decoded(source))
+
+
+def from_network(net):
+    """Pipeline over everything a :class:`psas_packet.io.Network` receives,
+    until it is interrupted. Records keep the bytes each message came in,
+    so sinks like :class:`LogSink` write them back unchanged
+
+    :returns: :class:`Pipeline`
+
+    """
+    return from_messages(_listen(net))
+
+
+def _fused(source, ops):
+    """Run a run of per record operators in one loop"""
+    if len(ops) == 1 and ops[0][0] == _SELECT:
+        wanted = ops[0][1]
+        for item in source:
+            if item.fourcc in wanted:
+                yield item
+        return
+    for item in source:
+        for kind, arg in ops:
+            if kind == _SELECT:
+                if item.fourcc not in arg:
+                    break
+            elif kind == _WHERE:
+                if not arg(item):
+                    break
+            elif kind == _MAP:
+                item = arg(item)
+            else:
+                for sink in arg:
+                    sink.write(item)
+        else:
+            yield item
+
+
+def _batch(source, n):
+    batch = []
+    for item in source:
+        batch.append(item)
+        if len(batch) >= n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _window(source, width):
+    current = None
+    batch = []
+    for item in source:
+        t = item.timestamp
+        if t is None:
+            continue
+        w = t // width
+        if w != current:
+            if batch:
+                yield batch
+            batch = []
+            current = w
+        batch.append(item)
+    if batch:
+        yield batch
+
+
+def _seqns(source, begin, end):
+    for item in source:
+        seqn = item.seqn
+        if seqn is None:
+            if begin is None:
+                yield item
+            continue
+        if begin is not None and seqn < begin:
+            continue
+        if end is not None and seqn > end:
+            return
+        yield item
+
+
+def _pace(source, speed):
+    first = None
+    start = None
+    for item in source:
+        if item.fourcc == SEQN.fourcc:
+            t = item.timestamp
+            if first is None:
+                first = t
+                start = time.time()
+            else:
+                wait = (t - first) / 1e9 / speed - (time.time() - start)
+                if wait > 0:
+                    time.sleep(wait)
+        yield item
+
+
+class Pipeline(object):
+    """A source and the operators applied to it
+
+    :param source: function returning a fresh iterator of records
+    :returns: Pipeline object
+
+    Operators return a new Pipeline and leave this one as it was, so a
+    common start can be shared by several pipelines.
+    """
+
+    def __init__(self, source, stages=()):
+        self.source = source
+        self.stages = tuple(stages)
+
+    def _then(self, kind, arg):
+        return Pipeline(self.source, self.stages + ((kind, arg),))
+
+    def select(self, fourccs):
+        """Only records of these types
+
+        :param list fourccs: printable fourccs, like 'ADIS' or 'GPS1'
+
+        """
+        return self._then(_SELECT, frozenset(_fourcc(f) for f in fourccs))
+
+    def where(self, predicate):
+        """Only records for which predicate(record) is true"""
+        return self._then(_WHERE, predicate)
+
+    def map(self, func):
+        """Replace each item with func(item)"""
+        return self._then(_MAP, func)
+
+    def tee(self, *sinks):
+        """Write each item to sinks as it passes, and pass it on"""
+        return self._then(_TEE, sinks)
+
+    def batch(self, n):
+        """Group items into lists of n, the last one possibly shorter"""
+        return self._then(_batch, (n,))
+
+    def window(self, seconds):
+        """Group records into lists by tumbling windows of header time
+
+        :param float seconds: window width
+
+        """
+        return self._then(_window, (int(seconds * 1e9),))
+
+    def seqns(self, begin=None, end=None):
+        """Only records from the datagrams with SEQN begin through end
+
+        :param int begin: first SEQN, None for the start of the stream
+        :param int end: last SEQN, None for the end of the stream
+
+        """
+        return self._then(_seqns, (begin, end))
+
+    def pace(self, speed=1.0):
+        """Let records through no faster than the SEQN timestamps say they
+        were logged, for replaying a log in real time
+
+        :param float speed: how many times faster than real time
+
+        """
+        return self._then(_pace, (speed,))
+
+    def __iter__(self):
+        stream = self.source()
+        run = []
+        for kind, arg in self.stages:
+            if kind in (_SELECT, _WHERE, _MAP, _TEE):
+                run.append((kind, arg))
+                continue
+            if run:
+                stream = _fused(stream, run)
+                run = []
+            stream = kind(stream, *arg)
+        if run:
+            stream = _fused(stream, run)
+        return iter(stream)
+
+    def each(self, func):
+        """Run the pipeline, calling func(item) for every item
+
+        :returns: number of items
+
+        """
+        n = 0
+        for item in self:
+            func(item)
+            n += 1
+        return n
+
+    def to(self, *sinks):
+        """Run the pipeline into sinks, and close them at the end
+
+        :returns: number of items
+
+        """
+        n = 0
+        try:
+            if len(sinks) == 1:
+                write = sinks[0].write
+                for item in self:
+                    write(item)
+                    n += 1
+            else:
+                for item in self:
+                    for sink in sinks:
+                        sink.write(item)
+                    n += 1
+        finally:
+            for sink in sinks:
+                sink.close()
+        return n
+
+
+def _open(f, mode):
+    """(file, whether we opened it) for a filename or file-like object"""
+    if hasattr(f, 'write'):
+        return f, False
+    return open(f, mode), True
+
+
+class LogSink(object):
+    """Write records to a log file
+
+    :param f: filename or binary file-like object
+
+    """
+
+    def __init__(self, f):
+        self.fh, self._owned = _open(f, 'wb')
+
+    def write(self, record):
+        self.fh.write(record.raw)
+
+    def close(self):
+        if self._owned:
+            self.fh.close()
+        else:
+            self.fh.flush()
+
+
+class CSVSink(export.CSVWriter):
+    """Write one CSV file per message type, as :func:`psas_packet.io.log2csv`.
+    Takes the same options as :class:`psas_packet.export.CSVWriter`
+
+    :param str directory: where to write ``<fourcc>.csv`` files
+    :param list fourccs: only these types, default every known type
+
+    Each file starts with a ``# [0]SEQN, [1]Timestamp, [2]<key>, ...`` line,
+    and each row is the SEQN, timestamp and fields of one record.
+    """
+
+
+class Columns(object):
+    """Collect records into columns, one dict of lists per type
+
+    :param bool numpy: turn each column into a NumPy array on close
+    :param bool units: convert to normal units, otherwise keep the raw
+                       packed values, which with numpy are stored in their
+                       packed type (int16 counts stay int16)
+
+    After the pipeline has run, ``columns['ADIS']['Gyro_X']`` is every
+    Gyro_X in order, and ``columns['ADIS']['timestamp']`` their times. Raw
+    columns can be converted later with
+    :meth:`psas_packet.messages.Message.to_units`.
+    """
+
+    def __init__(self, numpy=False, units=True):
+        self.numpy = numpy
+        self.units = units
+        self.columns = {}
+
+    def write(self, record):
+        name = record.name
+        if self.units or record._raw is None:
+            data = record.data
+        else:
+            data = messages.decode(record._raw, False)[1][1]
+        cols = self.columns.get(name)
+        if cols is None:
+            cols = self.columns[name] = dict((k, []) for k in data)
+        for k, v in data.items():
+            col = cols.get(k)
+            if col is None:
+                col = cols[k] = []
+            col.append(v)
+
+    def close(self):
+        if self.numpy:
+            import numpy as np
+            for name, cols in self.columns.items():
+                fields = {}
+                message = messages.MESSAGES.get(name)
+                if not self.units and message is not None and not message.variable:
+                    fields = message.dtype().fields
+                for k, v in cols.items():
+                    if k in fields:
+                        cols[k] = np.asarray(v, dtype=fields[k][0].newbyteorder('='))
+                    else:
+                        cols[k] = np.asarray(v)
+
+
+class SocketSink(object):
+    """Send records over UDP, a datagram per SEQN as they were received
+
+    :param address: (host, port) to send to, or a connected socket
+
+    Records are gathered until the next SEQN record, then sent as one
+    datagram: the sequence number followed by the framed records. A refused
+    connection, nobody listening yet, is ignored.
+    """
+
+    def __init__(self, address):
+        if hasattr(address, 'send'):
+            self.sock = address
+            self._owned = False
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.connect(address)
+            self._owned = True
+        self.sent = 0
+        self._parts = []
+
+    def write(self, record):
+        if record.fourcc == SEQN.fourcc:
+            self._send()
+            self._parts.append(record.raw[HEADER.size:])
+        elif self._parts:
+            self._parts.append(record.raw)
+
+    def _send(self):
+        if not self._parts:
+            return
+        try:
+            self.sock.send(b''.join(self._parts))
+            self.sent += 1
+        except socket.error as e:
+            if e.errno != errno.ECONNREFUSED:
+                raise
+        self._parts = []
+
+    def close(self):
+        self._send()
+        if self._owned:
+            self.sock.close()
+
+
+class Progress(object):
+    """Show the current SEQN on a terminal line
+
+    :param stream: where to write, default stdout
+    :param str fmt: line format, given the SEQN
+    :param float interval: least seconds between lines, 0 to show every SEQN
+
+    """
+
+    def __init__(self, stream=None, fmt=" SEQN: {0:10d} \r", interval=0):
+        self.stream = stream if stream is not None else sys.stdout
+        self.fmt = fmt
+        self.interval = interval
+        self.last = None
+        self._shown = None
+
+    def update(self, seqn):
+        """Note the current SEQN, showing it if interval has gone by"""
+        self.last = seqn
+        if self.interval:
+            now = time.time()
+            if self._shown is not None and now - self._shown < self.interval:
+                return
+            self._shown = now
+        line = self.fmt.format(seqn)
+        try:
+            self.stream.write(line)
+        except TypeError:
+            # a Python 2 text stream, like io.StringIO, only takes unicode
+            self.stream.write(line.decode('utf-8'))
+        self.stream.flush()
+
+    def write(self, record):
+        if record.fourcc == SEQN.fourcc:
+            self.update(record.seqn)
+
+    def close(self):
+        pass
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Multi-resolution min/max/mean pyramid of a log for fast plotting.
+"""
+import array
+import json
+import os
+import struct
+import sys
+from bisect import bisect_left
+from psas_packet import io, messages
+
+# Bump when the sidecar layout changes
+VERSION = 1
+
+# Sidecar: magic, version and JSON length, then the JSON description, then
+# the raw bytes of every array in the order the JSON lists them
+_SIDECAR = struct.Struct('!4sHL')
+_MAGIC = b'PYRM'
+
+
+def _int64():
+    """Array typecode of a 64 bit signed int. Python 2 has no 'q', but 'l'
+    is 64 bits there on 64 bit Linux"""
+    for code in ('l', 'q'):
+        try:
+            if array.array(code).itemsize == 8:
+                return code
+        except ValueError:
+            pass
+    raise ImportError("no 64 bit array typecode")
+
+_INT = _int64()
+
+
+def _tobytes(a):
+    return a.tobytes() if hasattr(a, 'tobytes') else a.tostring()
+
+
+def _frombytes(typecode, raw):
+    a = array.array(typecode)
+    if hasattr(a, 'frombytes'):
+        a.frombytes(raw)
+    else:
+        a.fromstring(raw)
+    return a
+
+
+class _Level(object):
+    """Buckets of one message type at one resolution, sorted by bucket
+    number. Bucket numbers and counts are shared by all fields."""
+
+    def __init__(self, nfields):
+        self.buckets = array.array(_INT)
+        self.counts = array.array(_INT)
+        self.mins = [array.array('d') for i in range(nfields)]
+        self.maxs = [array.array('d') for i in range(nfields)]
+        self.sums = [array.array('d') for i in range(nfields)]
+
+    def arrays(self):
+        """Every array of this level, in sidecar order"""
+        return [self.buckets, self.counts] + self.mins + self.maxs + self.sums
+
+    def add(self, bucket, count, los, his, totals):
+        n = len(self.buckets)
+        if n and self.buckets[-1] >= bucket:
+            i = bisect_left(self.buckets, bucket)
+            if i < n and self.buckets[i] == bucket:
+                self.counts[i] += count
+                for f in range(len(los)):
+                    if los[f] < self.mins[f][i]:
+                        self.mins[f][i] = los[f]
+                    if his[f] > self.maxs[f][i]:
+                        self.maxs[f][i] = his[f]
+                    self.sums[f][i] += totals[f]
+                return
+            # late timestamp for a bucket we never saw, rare
+            self.buckets.insert(i, bucket)
+            self.counts.insert(i, count)
+            for f in range(len(los)):
+                self.mins[f].insert(i, los[f])
+                self.maxs[f].insert(i, his[f])
+                self.sums[f].insert(i, totals[f])
+            return
+        self.buckets.append(bucket)
+        self.counts.append(count)
+        for f in range(len(los)):
+            self.mins[f].append(los[f])
+            self.maxs[f].append(his[f])
+            self.sums[f].append(totals[f])
+
+    def truncate(self, bucket):
+        """Drop every bucket from this one on"""
+        i = bisect_left(self.buckets, bucket)
+        for a in self.arrays():
+            del a[i:]
+
+    def halve(self, finer, start):
+        """Append merged pairs of buckets from a finer level, starting at
+        bucket number start (of this level). Call :meth:`truncate` first."""
+        i = bisect_left(finer.buckets, start << 1)
+        parents = [b >> 1 for b in finer.buckets[i:]]
+        if not parents:
+            return
+
+        # [begin, end) of the finer buckets under each bucket of this level
+        edges = [j for j in range(1, len(parents)) if parents[j] != parents[j - 1]]
+        begins = [0] + edges
+        ends = edges + [len(parents)]
+        spans = list(zip([i + b for b in begins], [i + e for e in ends]))
+
+        self.buckets.extend(array.array(_INT, [parents[b] for b in begins]))
+        counts = finer.counts
+        self.counts.extend(array.array(_INT, [sum(counts[b:e]) for b, e in spans]))
+        for f in range(len(self.mins)):
+            mins, maxs, sums = finer.mins[f], finer.maxs[f], finer.sums[f]
+            self.mins[f].extend(array.array('d', [min(mins[b:e]) for b, e in spans]))
+            self.maxs[f].extend(array.array('d', [max(maxs[b:e]) for b, e in spans]))
+            self.sums[f].extend(array.array('d', [sum(sums[b:e]) for b, e in spans]))
+
+
+class _Type(object):
+    """Pyramid levels of one message type"""
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.index = dict((k, i) for i, k in enumerate(keys))
+        self.levels = [_Level(len(keys))]
+
+
+class Pyramid(object):
+    """Min, max and mean of every numeric field in power of two time buckets
+
+    :param float base_ms: Width of the finest bucket in milliseconds
+    :returns: Pyramid object
+
+    Level 0 buckets are base_ms wide and each level up is twice as wide, so
+    any window can be drawn from about as many buckets as it has pixels.
+    Windows narrower than width * base_ms come back at level 0, with fewer
+    points than pixels. Times are header timestamps, in milliseconds.
+    """
+
+    def __init__(self, base_ms=10.0):
+        self.base_ms = base_ms
+        self._base_ns = int(base_ms * 1e6)
+        self.types = {}
+        self.offset = 0
+        self.signature = None
+
+    def update(self, log):
+        """Add any records written to the log since the last update
+
+        :param str log: log filename
+
+        """
+        size = os.path.getsize(log)
+        if size < self.offset:
+            # log was replaced, start over
+            self.types = {}
+            self.offset = 0
+
+        header = messages.HEADER.size
+        base = self._base_ns
+        pending = {}
+        first = {}
+        offset = self.offset
+
+        def flush(state):
+            bucket, rows, columns, message, name = state
+            if not rows:
+                return
+            cols = list(zip(*rows))
+            los, his, totals = [], [], []
+            for i, scaleby, bias in columns:
+                col = cols[i]
+                lo, hi = min(col) * scaleby + bias, max(col) * scaleby + bias
+                if scaleby < 0:
+                    lo, hi = hi, lo
+                los.append(lo)
+                his.append(hi)
+                totals.append(sum(col) * scaleby + bias * len(col))
+            self.types[name].levels[0].add(bucket, len(rows), los, his, totals)
+            if name not in first or bucket < first[name]:
+                first[name] = bucket
+            del rows[:]
+
+        with open(log, 'rb') as fh:
+            fh.seek(offset)
+            for fourcc, raw in io.BinFile(fh).scan():
+                _fourcc, timestamp, length = messages.HEADER.decode(raw[:header])
+                if len(raw) < header + length:
+                    # still being written
+                    break
+                offset += len(raw)
+
+                state = pending.get(fourcc)
+                if state is None:
+                    name = messages.printable(fourcc)
+                    message = messages.MESSAGES.get(name)
+                    if message is None or message.variable:
+                        pending[fourcc] = False
+                        continue
+                    columns = []
+                    keys = []
+                    for i, m in enumerate(message.member_list):
+                        if 's' not in m['stype']:
+                            units = m.get('units', {})
+                            columns.append((i, units.get('scaleby', 1), units.get('bias', 0)))
+                            keys.append(m['key'])
+                    if name not in self.types:
+                        self.types[name] = _Type(keys)
+                    state = [None, [], columns, message, name]
+                    pending[fourcc] = state
+                elif state is False:
+                    continue
+
+                message = state[3]
+                if length != message.size:
+                    continue
+                bucket = timestamp // base
+                if bucket != state[0]:
+                    flush(state)
+                    state[0] = bucket
+                state[1].append(message.struct.unpack(raw[header:]))
+
+            for state in pending.values():
+                if state:
+                    flush(state)
+
+        self.offset = offset
+        self.signature = _signature(log)
+
+        # rebuild the coarser levels from the first bucket that changed
+        for name, start in first.items():
+            levels = self.types[name].levels
+            k = 1
+            while True:
+                if k == len(levels):
+                    if len(levels[-1].buckets) <= 1:
+                        break
+                    levels.append(_Level(len(self.types[name].keys)))
+                levels[k].truncate(start >> k)
+                levels[k].halve(levels[k - 1], start >> k)
+                k += 1
+
+    def fetch(self, fourcc, key, start_ms, end_ms, width):
+        """Series for a time window, at about one bucket per pixel
+
+        :param str fourcc: printable fourcc
+        :param str key: field name
+        :param float start_ms: window start, header time in milliseconds
+        :param float end_ms: window end, header time in milliseconds
+        :param int width: plot width in pixels
+        :returns: dict of lists 'time' (bucket start, ms), 'min', 'max',
+                  'mean' and 'count'
+
+        """
+        out = {'time': [], 'min': [], 'max': [], 'mean': [], 'count': []}
+        kind = self.types.get(fourcc)
+        if kind is None or key not in kind.index:
+            return out
+        f = kind.index[key]
+        levels = kind.levels
+
+        # coarsest level that still has a bucket per pixel
+        span = (end_ms - start_ms) / float(max(width, 1))
+        k = 0
+        while k + 1 < len(levels) and self.base_ms * (1 << (k + 1)) <= span:
+            k += 1
+        level = levels[k]
+        bucket_ns = self._base_ns << k
+
+        lo = bisect_left(level.buckets, int(start_ms * 1e6) // bucket_ns)
+        hi = bisect_left(level.buckets, int(end_ms * 1e6) // bucket_ns + 1)
+        out['time'] = [b * bucket_ns / 1e6 for b in level.buckets[lo:hi]]
+        out['min'] = level.mins[f][lo:hi].tolist()
+        out['max'] = level.maxs[f][lo:hi].tolist()
+        out['count'] = level.counts[lo:hi].tolist()
+        out['mean'] = [s / c for s, c in zip(level.sums[f][lo:hi], out['count'])]
+        return out
+
+    def save(self, path):
+        types = sorted(self.types.items())
+        meta = {
+            'base_ms': self.base_ms,
+            'offset': self.offset,
+            'signature': self.signature,
+            'byteorder': sys.byteorder,
+            'types': [[name, kind.keys, [len(level.buckets) for level in kind.levels]] for name, kind in types],
+        }
+        text = json.dumps(meta).encode('utf-8')
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_SIDECAR.pack(_MAGIC, VERSION, len(text)))
+            f.write(text)
+            for name, kind in types:
+                for level in kind.levels:
+                    for a in level.arrays():
+                        f.write(_tobytes(a))
+        os.rename(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read a pyramid saved with :meth:`save`
+
+        :returns: Pyramid, or None if the file is missing, damaged or out
+                  of date
+
+        """
+        try:
+            with open(path, 'rb') as f:
+                magic, version, size = _SIDECAR.unpack(f.read(_SIDECAR.size))
+                if magic != _MAGIC or version != VERSION:
+                    return None
+                meta = json.loads(f.read(size).decode('utf-8'))
+                swap = meta['byteorder'] != sys.byteorder
+                p = cls(meta['base_ms'])
+                p.offset = meta['offset']
+                p.signature = meta['signature']
+                for name, keys, lengths in meta['types']:
+                    kind = _Type(keys)
+                    kind.levels = []
+                    for n in lengths:
+                        level = _Level(len(keys))
+                        for a in level.arrays():
+                            raw = f.read(8 * n)
+                            if len(raw) != 8 * n:
+                                return None
+                            a.extend(_frombytes(a.typecode, raw))
+                            if swap:
+                                a.byteswap()
+                        kind.levels.append(level)
+                    p.types[name] = kind
+        except (IOError, OSError, struct.error, ValueError, KeyError, TypeError):
+            return None
+        return p
+
+
+def _signature(fname):
+    st = os.stat(fname)
+    return [st.st_size, st.st_mtime]
+
+
+def pyramid(log, base_ms=10.0, cache=True):
+    """Build the pyramid for a log, reusing and extending its
+    ``<log>.pyramid`` sidecar
+
+    :param str log: log filename
+    :param float base_ms: Width of the finest bucket in milliseconds
+    :param bool cache: read and write the sidecar file
+    :returns: Pyramid
+
+    """
+    sidecar = log + '.pyramid'
+    p = Pyramid.load(sidecar) if cache else None
+    if p is None or p.base_ms != base_ms:
+        p = Pyramid(base_ms)
+    if p.signature != _signature(log):
+        p.update(log)
+        if cache:
+            p.save(sidecar)
+    return p
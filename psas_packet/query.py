@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Filter log records on raw bytes before decoding them.
+
+A filter is a dict of printable fourcc to a list of ``(key, op, value)``
+predicates, all of which must hold. ``value`` is in normal units and ``op`` is
+one of ``< <= > >= == !=``. The key ``timestamp`` tests the header time in
+nanoseconds. A fourcc with an empty list matches every record of that type,
+and fourccs that aren't in the dict are skipped after reading their header::
+
+    where = {
+        'VSTE': [('Altitude', '>', 1000)],
+        'ADIS': [('VCC', '<', 4.9)],
+    }
+"""
+import operator
+import struct
+from psas_packet import messages
+
+OPS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+# bytes read from the log at a time
+BLOCK = 1 << 20
+
+
+def field_offsets(message):
+    """Byte offset of every member of a fixed size message
+
+    :param Message message: Fixed size message type
+    :returns: dict of key to (offset, struct.Struct for that member)
+
+    """
+    offsets = {}
+    fmt = message.endianness
+    for m in message.member_list:
+        offsets[m['key']] = (struct.calcsize(fmt), struct.Struct(message.endianness + m['stype']))
+        fmt += m['stype']
+    return offsets
+
+
+def compile_predicate(message, key, op, value):
+    """Build a test that runs on a raw message body
+
+    :param Message message: message type the body is
+    :param str key: member to test
+    :param str op: comparison, one of :data:`OPS`
+    :param value: value to compare to, in normal units
+    :returns: function(body, offset) -> bool, where offset is the start of
+              the body in the buffer
+
+    """
+    if op not in OPS:
+        raise ValueError("Unknown comparison {0!r}".format(op))
+    compare = OPS[op]
+    if key not in message.member_dict:
+        raise KeyError("{0} has no member {1}".format(message.name, key))
+    m = message.member_list[message.member_dict[key]['i']]
+
+    if message.variable:
+        raise messages.SchemaError(message.name, "raw predicates need a Fixed size message")
+
+    start, st = field_offsets(message)[key]
+    unpack_from = st.unpack_from
+    units = m.get('units', {})
+    scaleby = units.get('scaleby', 1)
+    bias = units.get('bias', 0)
+
+    if 's' in m['stype'] or (scaleby == 1 and bias == 0):
+        def test(buff, offset):
+            return compare(unpack_from(buff, offset + start)[0], value)
+    else:
+        # compare in normal units, the same way decode converts
+        def test(buff, offset):
+            return compare(unpack_from(buff, offset + start)[0] * scaleby + bias, value)
+    return test
+
+
+class Filter(object):
+    """Compiled filter over log records
+
+    :param dict where: printable fourcc to list of (key, op, value)
+    :param Registry registry: Where to look up message types, defaults to
+                              :data:`psas_packet.messages.MESSAGES`
+    :returns: Filter object
+
+    After a run, ``scanned`` counts records read, ``decoded`` the ones fully
+    unpacked and ``matched`` the ones returned. Variable size messages can't
+    be tested in place, so every record of those types is decoded.
+    """
+
+    def __init__(self, where, registry=None):
+        registry = registry if registry is not None else messages.MESSAGES
+        self.where = where
+        self._tests = {}
+        for name, predicates in where.items():
+            message = registry[name]
+            tests = []
+            times = []
+            for key, op, value in predicates:
+                if op not in OPS:
+                    raise ValueError("Unknown comparison {0!r}".format(op))
+                if key == 'timestamp':
+                    times.append((OPS[op], value))
+                elif message.variable:
+                    if key not in message.member_dict:
+                        raise KeyError("{0} has no member {1}".format(message.name, key))
+                    tests.append((key, OPS[op], value))
+                else:
+                    tests.append(compile_predicate(message, key, op, value))
+            self._tests[message.fourcc] = (message, times, tests)
+        self.scanned = 0
+        self.decoded = 0
+        self.matched = 0
+
+    def run(self, fh, ranges=None):
+        """Yield matching records from a log
+
+        :param fh: open binary log file
+        :param list ranges: only read these (offset, length) parts of the
+                            log, each starting on a record boundary, as
+                            from :meth:`psas_packet.index.LogIndex.select`
+        :returns: generator of (fourcc, dict) tuples like
+                  :func:`psas_packet.messages.decode`
+
+        """
+        if ranges is None:
+            return self._run(fh.read)
+        return self._run_ranges(fh, ranges)
+
+    def _run_ranges(self, fh, ranges):
+        for offset, length in ranges:
+            fh.seek(offset)
+            left = [length]
+
+            def read(size):
+                chunk = fh.read(min(size, left[0]))
+                left[0] -= len(chunk)
+                return chunk
+
+            for record in self._run(read):
+                yield record
+
+    def _run(self, read):
+        header = messages.HEADER.size
+        unpack_header = messages.HEADER.unpack_from
+        tests = self._tests
+        printable = messages.printable
+        buff = b''
+        pos = 0
+
+        while True:
+            block = read(BLOCK)
+            if not block:
+                return
+            buff = buff[pos:] + block
+            pos = 0
+            end = len(buff)
+            while pos + header <= end:
+                fourcc, hi, lo, length = unpack_header(buff, pos)
+                if pos + header + length > end:
+                    # record continues in the next block
+                    break
+                start = pos + header
+                pos = start + length
+                self.scanned += 1
+
+                entry = tests.get(fourcc)
+                if entry is None:
+                    continue
+                message, times, predicates = entry
+                if message.size is not None and length != message.size:
+                    continue
+
+                if times:
+                    timestamp = (hi << 32) | lo
+                    if not all(compare(timestamp, value) for compare, value in times):
+                        continue
+                if message.variable:
+                    self.decoded += 1
+                    data = message.decode(buff[start:pos])
+                    if not all(compare(data[key], value) for key, compare, value in predicates):
+                        continue
+                else:
+                    if not all(test(buff, start) for test in predicates):
+                        continue
+                    self.decoded += 1
+                    data = message.decode(buff[start:pos])
+
+                self.matched += 1
+                yield printable(fourcc), dict({'timestamp': (hi << 32) | lo}, **data)
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Receive on several processes at once, so ingest isn't limited to one core.
+
+A :class:`Supervisor` starts worker processes that each run their own
+:class:`psas_packet.io.Network`. Workers on the same port bind with
+``SO_REUSEPORT``, and the kernel spreads datagrams across them. Where
+that isn't available there is one worker per port. Each worker decodes
+what it receives, logs it to its own segmented log
+(:class:`psas_packet.segment.SegmentWriter`) and sends its
+:class:`psas_packet.stats.Stats` to the supervisor every few seconds. The
+supervisor totals the stats and, once stopped, merges the worker logs of
+each port back into one log in SEQN order.
+"""
+import heapq
+import multiprocessing
+import os
+import socket
+import time
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+from psas_packet import io, messages, segment
+from psas_packet.stats import Stats
+
+SEQN = messages.MESSAGES['SEQN']
+HEADER = messages.HEADER
+
+
+def _bind(host, port, reuse):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuse:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    return sock
+
+
+def _worker(host, port, index, reuse, log_base, max_bytes, handler, queue, stop, interval):
+    """Body of one worker process"""
+    sock = _bind(host, port, reuse)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+    sock.settimeout(0.1)
+    stats = Stats()
+    log = None
+    if log_base is not None:
+        log = segment.SegmentWriter('{0}-{1}-{2}'.format(log_base, port, index), max_bytes=max_bytes)
+    net = io.Network(sock, logfile=log, stats=stats)
+    queue.put(('ready', port, index, None))
+
+    report = time.time() + interval
+    try:
+        while not stop.is_set():
+            try:
+                for timestamp, message in net.listen():
+                    if handler is not None:
+                        handler(timestamp, message)
+            except socket.timeout:
+                pass
+            now = time.time()
+            if now >= report:
+                queue.put(('stats', port, index, stats))
+                report = now + interval
+    finally:
+        if log is not None:
+            log.close()
+        sock.close()
+        queue.put(('done', port, index, stats))
+
+
+class Supervisor(object):
+    """Run receivers for one or more ports in worker processes
+
+    :param list ports: UDP ports to receive on. 0 picks a free one
+    :param int workers: Processes per port, defaults to the CPU count
+    :param str host: Address to bind
+    :param str log_base: Path prefix for logs. Worker logs are segmented
+                         logs named ``<log_base>-<port>-<worker>``. None
+                         to not log
+    :param int max_bytes: Segment size of the worker logs
+    :param handler: Function(timestamp, message) each worker calls for every
+                    message it decodes. It runs in the worker process
+    :param float interval: Seconds between stats reports from each worker
+    :returns: Supervisor object
+
+    """
+
+    def __init__(self, ports, workers=None, host='0.0.0.0', log_base=None, max_bytes=64 << 20,
+                 handler=None, interval=1.0):
+        self.ports = list(ports)
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.reuse = hasattr(socket, 'SO_REUSEPORT')
+        self.workers = workers if self.reuse else 1
+        self.host = host
+        self.log_base = log_base
+        self.max_bytes = max_bytes
+        self.handler = handler
+        self.interval = interval
+        self.worker_stats = {}
+        self._procs = []
+        self._queue = None
+        self._stop = None
+
+    def start(self, timeout=10.0):
+        """Start the workers
+
+        :param float timeout: Seconds to wait for every worker to bind
+        :returns: self, once every worker is receiving
+
+        """
+        self._queue = multiprocessing.Queue()
+        self._stop = multiprocessing.Event()
+        for n, port in enumerate(self.ports):
+            if port == 0:
+                # pick the port now so every worker binds the same one. Close
+                # it before forking, a child holding it would take a share
+                probe = _bind(self.host, 0, False)
+                self.ports[n] = probe.getsockname()[1]
+                probe.close()
+        for port in self.ports:
+            for index in range(self.workers):
+                proc = multiprocessing.Process(
+                    target=_worker,
+                    args=(self.host, port, index, self.reuse, self.log_base, self.max_bytes,
+                          self.handler, self._queue, self._stop, self.interval))
+                proc.daemon = True
+                proc.start()
+                self._procs.append(proc)
+
+        ready = 0
+        deadline = time.time() + timeout
+        while ready < len(self._procs):
+            kind, port, index, stats = self._queue.get(timeout=max(deadline - time.time(), 0.001))
+            if kind == 'ready':
+                ready += 1
+            else:
+                self.worker_stats[(port, index)] = stats
+        return self
+
+    def poll(self, timeout=0.0):
+        """Collect stats reports the workers have sent
+
+        :param float timeout: Seconds to wait for the first one
+        :returns: number of reports read
+
+        """
+        n = 0
+        try:
+            while True:
+                kind, port, index, stats = self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait()
+                timeout = 0.0
+                if stats is not None:
+                    self.worker_stats[(port, index)] = stats
+                n += 1
+        except Empty:
+            pass
+        return n
+
+    def stats(self, port=None):
+        """Total of the latest stats from every worker
+
+        :param int port: Only the workers on this port
+        :returns: :class:`psas_packet.stats.Stats`
+
+        """
+        self.poll()
+        total = Stats()
+        for (p, index), stats in sorted(self.worker_stats.items()):
+            if port is None or p == port:
+                total.merge(stats)
+        return total
+
+    def stop(self, timeout=10.0):
+        """Stop the workers and collect their final stats"""
+        self._stop.set()
+        done = 0
+        deadline = time.time() + timeout
+        while done < len(self._procs) and time.time() < deadline:
+            try:
+                kind, port, index, stats = self._queue.get(timeout=max(deadline - time.time(), 0.001))
+            except Empty:
+                break
+            self.worker_stats[(port, index)] = stats
+            if kind == 'done':
+                done += 1
+        for proc in self._procs:
+            proc.join(max(deadline - time.time(), 0.001))
+        self._procs = []
+
+    def logs(self, port):
+        """Manifests of the worker logs of a port"""
+        return ['{0}-{1}-{2}.manifest'.format(self.log_base, port, index) for index in range(self.workers)]
+
+    def merge(self):
+        """Merge each port's worker logs into ``<log_base>-<port>.log``
+
+        :returns: list of merged log filenames
+
+        """
+        out = []
+        for port in self.ports:
+            path = '{0}-{1}.log'.format(self.log_base, port)
+            merge_logs([m for m in self.logs(port) if os.path.exists(m)], path)
+            out.append(path)
+        return out
+
+
+def datagrams(log):
+    """Group a log into datagrams
+
+    :param str log: log filename or manifest
+    :returns: generator of (sequence number, bytes of the SEQN record and
+              the records after it)
+
+    """
+    seqn = None
+    parts = []
+    with io.BinFile(log) as f:
+        for fourcc, raw in f.scan():
+            if fourcc == SEQN.fourcc:
+                if parts:
+                    yield seqn if seqn is not None else -1, b''.join(parts)
+                seqn = SEQN.decode(raw[HEADER.size:])['Sequence']
+                parts = [raw]
+            else:
+                parts.append(raw)
+    if parts:
+        yield seqn if seqn is not None else -1, b''.join(parts)
+
+
+def sorted_datagrams(log):
+    """Datagrams of a log in SEQN order
+
+    :param str log: log filename or manifest
+    :returns: generator of (sequence number, bytes), as :func:`datagrams`
+
+    Workers log datagrams in the order they arrive, which isn't always SEQN
+    order. Only the SEQN, offset and length of each datagram are held to
+    sort them, then they are read back in order. Datagrams with the same
+    SEQN keep their order in the log.
+    """
+    places = []
+    offset = 0
+    for seqn, raw in datagrams(log):
+        places.append((seqn, offset, len(raw)))
+        offset += len(raw)
+    places.sort()
+    with io.BinFile(log) as f:
+        fh = f.fh
+        at = 0
+        for seqn, offset, length in places:
+            if offset != at:
+                fh.seek(offset)
+            yield seqn, fh.read(length)
+            at = offset + length
+
+
+def merge_logs(logs, output):
+    """Merge logs holding different datagrams of the same stream
+
+    :param list logs: log filenames or manifests, in any order
+    :param str output: log file to write
+    :returns: number of datagrams written
+
+    """
+    def numbered(i, log):
+        # the input number breaks ties so equal SEQNs never compare bytes
+        for seqn, raw in sorted_datagrams(log):
+            yield seqn, i, raw
+
+    n = 0
+    with open(output, 'wb') as out:
+        streams = [numbered(i, log) for i, log in enumerate(logs)]
+        for seqn, i, raw in heapq.merge(*streams):
+            out.write(raw)
+            n += 1
+    return n
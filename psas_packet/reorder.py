@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Put datagrams back in SEQN order and drop duplicates before decoding.
+"""
+from psas_packet.stats import Histogram
+
+_MOD = 1 << 32
+_HALF = 1 << 31
+
+
+class ReorderBuffer(object):
+    """Bounded jitter buffer keyed on the 32 bit SEQN of each datagram
+
+    :param int window: How many sequence numbers ahead of the next expected
+                       one can be held. A datagram further ahead than that
+                       pushes the window forward. Must be a power of
+                       two so slots line up when the SEQN wraps
+    :param float timeout: Seconds a datagram waits for missing ones before
+                          it, after which they are given up on
+    :returns: ReorderBuffer object
+
+    Held datagrams sit in a fixed ring of ``window`` slots, and two
+    bitmaps relative to the next expected number make every check O(1):
+    one of the numbers already released behind it (for duplicates) and one
+    of the slots filled ahead of it. :meth:`pop` releases datagrams in order
+    and reports how many numbers were skipped before each one. A datagram
+    far behind the window is dropped as late, unless the one after it
+    follows on, which means the sender restarted its count. ``latency``
+    is a :class:`psas_packet.stats.Histogram` of how long each released
+    datagram was held, in microseconds.
+    """
+
+    def __init__(self, window=64, timeout=0.05):
+        if window < 1 or window & (window - 1):
+            raise ValueError("window must be a power of two, got {0}".format(window))
+        self.window = window
+        self.timeout = timeout
+        self.next = None
+        self.held = 0
+        self._items = [None] * window
+        self._times = [0.0] * window
+        self._mask = (1 << window) - 1
+        self._behind = 0
+        self._ahead = 0
+        self._skipped = 0
+        self._ready = []
+        self._restart = None
+
+        self.received = 0
+        self.released = 0
+        self.duplicates = 0
+        self.late = 0
+        self.gaps = 0
+        self.lost = 0
+        self.resets = 0
+        self.latency = Histogram()
+
+    def push(self, seqn, item, now):
+        """Hold a datagram until its turn
+
+        :param int seqn: Sequence number from the datagram's SEQN
+        :param item: What to hand back from :meth:`pop`, usually the datagram
+        :param float now: Arrival time
+        :returns: True if it was kept, False for a duplicate or a datagram
+                  that arrived after it was given up on
+
+        """
+        self.received += 1
+        if self.next is None:
+            self.next = seqn
+        d = (seqn - self.next) % _MOD
+        if d >= _HALF:
+            d -= _MOD
+        if d < 0:
+            if -d <= self.window:
+                if (self._behind >> (-d - 1)) & 1:
+                    self.duplicates += 1
+                else:
+                    self.late += 1
+                return False
+            restart = self._restart
+            if restart is None or (seqn - restart[0]) % _MOD != 1:
+                # a stray old datagram, unless the next one follows on
+                self._restart = (seqn, item, now)
+                self.late += 1
+                return False
+            # two in a row far behind, the sender restarted
+            self.resets += 1
+            self.late -= 1
+            self._jump(restart[0], now, True)
+            self._store(0, restart[0], restart[1], restart[2])
+            d = 1
+        elif d >= self.window:
+            self._jump(seqn, now, False)
+            d = 0
+        self._restart = None
+        if self._ahead & (1 << d):
+            self.duplicates += 1
+            return False
+        self._store(d, seqn, item, now)
+        return True
+
+    def _store(self, d, seqn, item, now):
+        slot = seqn % self.window
+        self._items[slot] = item
+        self._times[slot] = now
+        self._ahead |= 1 << d
+        self.held += 1
+
+    def _jump(self, seqn, now, restart):
+        """Release everything held and make seqn the next expected number"""
+        self._ready.extend(self._release(now, True))
+        if restart:
+            self._behind = 0
+            self._skipped = 0
+        else:
+            skipped = (seqn - self.next) % _MOD
+            if skipped:
+                self.gaps += 1
+                self.lost += skipped
+            self._skipped += skipped
+            self._behind = (self._behind << skipped) & self._mask if skipped < self.window else 0
+        self.next = seqn
+
+    def pop(self, now):
+        """Release held datagrams that are ready
+
+        :param float now: Current time, to expire missing datagrams against
+        :returns: generator of (seqn, item, arrival time, missing) in
+                  sequence order, where missing is how many sequence
+                  numbers were given up on just before this one
+
+        """
+        if self._ready:
+            ready, self._ready = self._ready, []
+            for out in ready:
+                yield out
+        for out in self._release(now, False):
+            yield out
+
+    def flush(self):
+        """Release everything held, skipping over whatever is missing. Call
+        it at the end of a stream
+
+        :returns: generator like :meth:`pop`
+
+        """
+        ready, self._ready = self._ready, []
+        for out in ready:
+            yield out
+        for out in self._release(None, True):
+            yield out
+
+    def _release(self, now, force):
+        items = self._items
+        times = self._times
+        window = self.window
+        mask = self._mask
+        latency = self.latency
+        while self.held:
+            slot = self.next % window
+            item = items[slot]
+            missing = self._skipped
+            if item is None:
+                ahead = self._ahead
+                skip = (ahead & -ahead).bit_length() - 1
+                first = times[(self.next + skip) % window]
+                if not force and now - first < self.timeout:
+                    return
+                self.gaps += 1
+                self.lost += skip
+                missing += skip
+                self._ahead = ahead >> skip
+                self._behind = (self._behind << skip) & mask if skip < window else 0
+                self.next = (self.next + skip) % _MOD
+                slot = self.next % window
+                item = items[slot]
+            arrived = times[slot]
+            items[slot] = None
+            self.held -= 1
+            self._skipped = 0
+            self._ahead >>= 1
+            self._behind = ((self._behind << 1) | 1) & mask
+            seqn = self.next
+            self.next = (seqn + 1) % _MOD
+            self.released += 1
+            if now is not None:
+                latency.record((now - arrived) * 1e6)
+            yield seqn, item, arrived, missing
+
+    def summary(self):
+        """Counters and held time percentiles
+
+        :returns: dict of plain values safe to serialize
+
+        """
+        return {
+            'received': self.received,
+            'released': self.released,
+            'held': self.held,
+            'duplicates': self.duplicates,
+            'late': self.late,
+            'gaps': self.gaps,
+            'lost': self.lost,
+            'resets': self.resets,
+            'latency_us': self.latency.summary(),
+        }
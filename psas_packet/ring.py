@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Shared memory ring buffer for handing received messages to other local
+processes.
+
+One process (usually :class:`psas_packet.io.Network`) writes framed messages
+into the ring once, and any number of readers in other processes follow it
+with their own cursors. Readers never block the writer and never take a
+lock: a reader that falls a whole ring behind notices, counts what it lost
+and skips ahead to live data.
+
+Layout of the shared block, all little endian::
+
+    0   magic    4s   b'PSRB'
+    4   version  I
+    8   capacity Q    bytes in the data area, a power of two
+    16  written  Q    end of the last complete entry, only ever grows
+    24  claimed  Q    end of the entry being written
+    32  oldest   Q    start of the oldest entry not yet overwritten
+    40  entries  Q    entries written
+    48  data     capacity bytes
+
+Each entry is an ``<IQd`` header (length of the framed message, entry
+sequence number, receive time), then the framed message (HEADER and body,
+as in a log file), padded to 8 bytes. An entry never wraps; if it won't fit
+before the end of the data area a length of ``0xffffffff`` marks the rest as
+padding.
+"""
+import struct
+import time
+from psas_packet import messages
+
+MAGIC = b'PSRB'
+VERSION = 1
+
+_CONTROL = struct.Struct('<4sIQQQQQ')
+_POS = struct.Struct('<Q')
+_ENTRY = struct.Struct('<IQd')
+_WRITTEN = 16
+_CLAIMED = 24
+_OLDEST = 32
+_ENTRIES = 40
+_DATA = _CONTROL.size
+_PAD = 0xffffffff
+
+# Seconds to sleep while a writer is partway through an entry, doubling from
+# the first to the second
+_MIN_BACKOFF = 0.00001
+_MAX_BACKOFF = 0.002
+
+SEQN = messages.MESSAGES['SEQN']
+
+
+def _shared_memory(name, create, size=0):
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        raise RuntimeError("the ring buffer needs Python 3.8 or newer")
+    if create:
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # before 3.13 attaching registers the block with the resource tracker,
+    # which unlinks it when the reader exits. Unregistering afterwards would
+    # also drop the writer's entry when both share a tracker, so skip it
+    from multiprocessing import resource_tracker
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class RingWriter(object):
+    """Producer end of a ring
+
+    :param str name: Shared memory name, None picks a unique one
+    :param int size: Bytes for messages, rounded up to a power of two
+    :returns: RingWriter object
+
+    The writer owns the shared block and removes it on :meth:`close`.
+    """
+
+    def __init__(self, name=None, size=1 << 20):
+        capacity = 1
+        while capacity < size:
+            capacity <<= 1
+        self.capacity = capacity
+        # slack so an entry header can always be read at the last 8 bytes
+        self._shm = _shared_memory(name, True, _DATA + capacity + _ENTRY.size)
+        self.name = self._shm.name
+        self._buf = self._shm.buf
+        _CONTROL.pack_into(self._buf, 0, MAGIC, VERSION, capacity, 0, 0, 0, 0)
+        self._written = 0
+        self._oldest = 0
+        self._seq = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+
+    def write(self, framed, now=None):
+        """Add a framed message
+
+        :param bytes framed: HEADER and message body
+        :param float now: Receive time, defaults to now
+
+        """
+        if now is None:
+            now = time.time()
+        n = len(framed)
+        need = (_ENTRY.size + n + 7) & ~7
+        if need > self.capacity:
+            raise ValueError("message of {0} bytes won't fit in a {1} byte ring".format(n, self.capacity))
+
+        buf = self._buf
+        capacity = self.capacity
+        pos = self._written
+        at = pos & (capacity - 1)
+        pad = at + need > capacity
+        end = pos + (capacity - at if pad else 0) + need
+
+        # step the oldest entry past everything this one overwrites
+        oldest = self._oldest
+        while end - oldest > capacity:
+            old_at = oldest & (capacity - 1)
+            length, = struct.unpack_from('<I', buf, _DATA + old_at)
+            if length == _PAD:
+                oldest += capacity - old_at
+            else:
+                oldest += (_ENTRY.size + length + 7) & ~7
+        self._oldest = oldest
+        _POS.pack_into(buf, _OLDEST, oldest)
+        _POS.pack_into(buf, _CLAIMED, end)
+
+        if pad:
+            struct.pack_into('<I', buf, _DATA + at, _PAD)
+            pos += capacity - at
+            at = 0
+
+        _ENTRY.pack_into(buf, _DATA + at, n, self._seq, now)
+        buf[_DATA + at + _ENTRY.size:_DATA + at + _ENTRY.size + n] = framed
+        self._seq += 1
+        self._written = pos + need
+        _POS.pack_into(buf, _ENTRIES, self._seq)
+        _POS.pack_into(buf, _WRITTEN, self._written)
+
+    def close(self):
+        """Release and remove the shared block"""
+        if self._shm is None:
+            return
+        self._buf = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+
+class RingReader(object):
+    """Consumer end of a ring
+
+    :param str name: Shared memory name of the :class:`RingWriter`
+    :param decoder: function to decode framed messages with, defaults to
+                    :func:`psas_packet.messages.decode`
+    :param bool from_start: start at the oldest entry still in the ring
+                            instead of only new ones
+    :param float timeout: seconds to wait for a writer caught in the middle
+                          of an entry. A writer that died there never
+                          finishes it, so after this the entry is skipped
+    :returns: RingReader object
+
+    ``lost`` counts entries that were overwritten before this reader got to
+    them, and ``overruns`` how many times that happened.
+    """
+
+    def __init__(self, name, decoder=None, from_start=False, timeout=1.0):
+        self._shm = _shared_memory(name, False)
+        self._buf = self._shm.buf
+        magic, version, capacity, written, claimed, oldest, entries = _CONTROL.unpack_from(self._buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("{0} is not a psas_packet ring".format(name))
+        self.capacity = capacity
+        self.decode = decoder if decoder is not None else messages.decode
+        self.timeout = timeout
+        if from_start:
+            self.cursor = oldest
+            self._seq = None
+        else:
+            self.cursor, self._seq = self._live()
+        self.lost = 0
+        self.overruns = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+
+    def _live(self):
+        """Current end of the ring and the sequence number of the next entry,
+        None if a torn entry leaves it unknown"""
+        buf = self._buf
+        deadline = None
+        delay = _MIN_BACKOFF
+        while True:
+            written, = _POS.unpack_from(buf, _WRITTEN)
+            entries, = _POS.unpack_from(buf, _ENTRIES)
+            claimed, = _POS.unpack_from(buf, _CLAIMED)
+            # the writer claims before it counts, so with nothing claimed
+            # past written the count matches
+            if claimed == written:
+                return written, entries
+            now = time.time()
+            if deadline is None:
+                deadline = now + self.timeout
+            elif now >= deadline:
+                # the writer stopped partway through an entry. Start after
+                # the last whole one; the count may already include the
+                # torn one, so don't trust it for lost
+                return written, None
+            # give the writer the CPU instead of spinning on the cursors
+            time.sleep(delay)
+            delay = min(delay * 2, _MAX_BACKOFF)
+
+    def read_raw(self):
+        """Framed messages written since the last call
+
+        :returns: list of (receive time, framed bytes)
+
+        """
+        buf = self._buf
+        written, = _POS.unpack_from(buf, _WRITTEN)
+        out = []
+        mask = self.capacity - 1
+        cursor = self.cursor
+        while cursor < written:
+            at = cursor & mask
+            n, seq, now = _ENTRY.unpack_from(buf, _DATA + at)
+            if n != _PAD:
+                framed = bytes(buf[_DATA + at + _ENTRY.size:_DATA + at + _ENTRY.size + n])
+
+            claimed, = _POS.unpack_from(buf, _CLAIMED)
+            if claimed - cursor > self.capacity:
+                # the writer came round and may have changed what we read,
+                # go on from the oldest entry that's still whole
+                self.overruns += 1
+                cursor, = _POS.unpack_from(buf, _OLDEST)
+                written, = _POS.unpack_from(buf, _WRITTEN)
+                continue
+
+            if n == _PAD:
+                cursor += self.capacity - at
+                continue
+            if self._seq is not None and seq != self._seq:
+                self.lost += seq - self._seq
+            self._seq = seq + 1
+            cursor += (_ENTRY.size + n + 7) & ~7
+            out.append((now, framed))
+        self.cursor = cursor
+        return out
+
+    def read(self):
+        """Messages written since the last call, decoded
+
+        :returns: list of (timestamp, (fourcc, data)) tuples, the same as
+                  :meth:`psas_packet.io.Network.listen` yields
+
+        """
+        out = []
+        header = messages.HEADER.size
+        for now, framed in self.read_raw():
+            if framed[:4] == SEQN.fourcc:
+                out.append((now, ('SEQN', SEQN.decode(framed[header:]))))
+            else:
+                try:
+                    out.append((now, self.decode(framed)[1]))
+                except messages.MessageSizeError:
+                    pass
+        return out
+
+    def listen(self, interval=0.0005, timeout=None):
+        """Yield messages as they arrive
+
+        :param float interval: seconds to sleep when there's nothing new,
+                               0 to spin
+        :param float timeout: stop after this many seconds with nothing new
+        :returns: generator of (timestamp, (fourcc, data))
+
+        """
+        idle = time.time()
+        while self._buf is not None:
+            batch = self.read()
+            if batch:
+                for item in batch:
+                    yield item
+                idle = time.time()
+                continue
+            if timeout is not None and time.time() - idle > timeout:
+                return
+            if interval:
+                time.sleep(interval)
+
+    def close(self):
+        if self._shm is None:
+            return
+        self._buf = None
+        self._shm.close()
+        self._shm = None
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Logs split into segment files, with a manifest describing each segment.
+
+A :class:`SegmentWriter` takes the place of a single log file. It starts a
+new segment once the current one passes a size or age limit, always at a
+SEQN record so every segment can be read on its own, and a crash can only
+damage the tail of the last one. Next to the segments it keeps
+``<base>.manifest``, a JSON file listing every segment in order::
+
+    {"version": 1,
+     "segments": [{"file": "flight-000000.log",
+                   "bytes": 67108912,
+                   "records": 1398102,
+                   "seqn": [0, 93206],
+                   "timestamp": [1800012, 932060000],
+                   "fourccs": {"ADIS": 1118481, "SEQN": 93207, ...},
+                   "opened": 1465312345.1,
+                   "closed": 1465312405.8},
+                  ...]}
+
+``seqn`` is the first and last SEQN in the segment, ``timestamp`` the
+lowest and highest header timestamp of the messages in it, and ``fourccs``
+the record count of each type. SEQN records are left out of ``timestamp``
+because the receiver stamps them with its own clock, in seconds. The
+manifest is replaced atomically each time a segment starts or ends. The
+segment being written has ``closed`` of null and no counts.
+
+:class:`psas_packet.io.BinFile` opens a manifest as one logical log through
+:class:`SegmentedFile`, which opens a segment file the first time something
+reads from it.
+"""
+import bisect
+import json
+import os
+import time
+from psas_packet import messages
+from psas_packet.index import _may_match
+
+# Bump when the manifest layout changes
+VERSION = 1
+
+_SEQN = messages.MESSAGES['SEQN']
+
+
+def load_manifest(path):
+    """Read a manifest
+
+    :param str path: ``<base>.manifest`` file
+    :returns: dict with 'version' and 'segments'
+
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != VERSION:
+        raise ValueError("{0} is manifest version {1}, expected {2}".format(path, manifest.get('version'), VERSION))
+    return manifest
+
+
+def save_manifest(path, manifest):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.rename(tmp, path)
+
+
+class SegmentWriter(object):
+    """Write a log as a series of segment files
+
+    :param str base: Path prefix. Segments are ``<base>-000000.log``,
+                     ``<base>-000001.log``, ... and the manifest is
+                     ``<base>.manifest``
+    :param int max_bytes: Start a new segment once one is this big
+    :param float max_seconds: Start a new segment once one is this old
+    :returns: SegmentWriter object
+
+    It is a file-like object, so it can be passed as the ``logfile`` of
+    :class:`psas_packet.io.Network`. Writes must be whole records, possibly
+    split over several calls. A new segment is started at the first SEQN
+    record written after a limit is passed, so segments end on a datagram
+    boundary. If the manifest already exists, new segments are added after
+    the ones it lists.
+    """
+
+    def __init__(self, base, max_bytes=64 << 20, max_seconds=None):
+        self.base = base
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.manifest_path = base + '.manifest'
+        self.fh = None
+        self._pending = b''
+        self._due = False
+
+        if os.path.exists(self.manifest_path):
+            self.manifest = load_manifest(self.manifest_path)
+            for segment in self.manifest['segments']:
+                if segment['closed'] is None:
+                    # left open by a crash, counts are unknown
+                    segment['closed'] = segment['opened']
+                    segment['bytes'] = self._size(segment)
+        else:
+            self.manifest = {'version': VERSION, 'segments': []}
+        self._open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+
+    @property
+    def segments(self):
+        """Manifest entries of every segment, oldest first"""
+        return self.manifest['segments']
+
+    def _size(self, segment):
+        path = os.path.join(os.path.dirname(self.manifest_path), segment['file'])
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def _open(self):
+        name = '{0}-{1:06d}.log'.format(os.path.basename(self.base), len(self.segments))
+        self.fh = open(os.path.join(os.path.dirname(self.manifest_path), name), 'wb')
+        self.opened = time.time()
+        self.bytes = 0
+        self.records = 0
+        self.seqn = None
+        self.timestamp = None
+        self.counts = {}
+        self.segments.append({
+            'file': name, 'bytes': 0, 'records': 0, 'seqn': None, 'timestamp': None,
+            'fourccs': None, 'opened': self.opened, 'closed': None,
+        })
+        save_manifest(self.manifest_path, self.manifest)
+
+    def _finish(self):
+        self.fh.close()
+        self.segments[-1].update({
+            'bytes': self.bytes, 'records': self.records, 'seqn': self.seqn,
+            'timestamp': self.timestamp, 'closed': time.time(),
+            'fourccs': dict((messages.printable(k), v) for k, v in self.counts.items()),
+        })
+        save_manifest(self.manifest_path, self.manifest)
+
+    def rotate(self):
+        """End the current segment and start the next"""
+        self._finish()
+        self._open()
+        self._due = False
+
+    def write(self, data):
+        """Append bytes to the current segment
+
+        :param bytes data: whole records or parts of them
+
+        """
+        if self._due and not self._pending and data[:4] == _SEQN.fourcc:
+            self.rotate()
+        self.fh.write(data)
+        self.bytes += len(data)
+        self._count(data)
+
+    def _count(self, data):
+        buff = self._pending + data if self._pending else data
+        unpack_header = messages.HEADER.unpack_from
+        header = messages.HEADER.size
+        counts = self.counts
+        pos = 0
+        end = len(buff)
+        while pos + header <= end:
+            fourcc, hi, lo, length = unpack_header(buff, pos)
+            if pos + header + length > end:
+                break
+            counts[fourcc] = counts.get(fourcc, 0) + 1
+            if fourcc == _SEQN.fourcc:
+                if length == _SEQN.size:
+                    seqn = _SEQN.decode(buff[pos + header:pos + header + length])['Sequence']
+                    if self.seqn is None:
+                        self.seqn = [seqn, seqn]
+                    else:
+                        self.seqn[1] = seqn
+            else:
+                timestamp = (hi << 32) | lo
+                if self.timestamp is None:
+                    self.timestamp = [timestamp, timestamp]
+                elif timestamp < self.timestamp[0]:
+                    self.timestamp[0] = timestamp
+                elif timestamp > self.timestamp[1]:
+                    self.timestamp[1] = timestamp
+            self.records += 1
+            pos += header + length
+        self._pending = buff[pos:]
+
+    def flush(self):
+        """Flush the current segment and check the limits"""
+        self.fh.flush()
+        if self.bytes >= self.max_bytes or (self.max_seconds is not None and
+                                            time.time() - self.opened >= self.max_seconds):
+            self._due = True
+
+    def close(self):
+        """Finish the last segment and the manifest"""
+        if self.fh is not None and not self.fh.closed:
+            self._finish()
+
+
+class SegmentedFile(object):
+    """Read the segments listed in a manifest as one file
+
+    :param str path: ``<base>.manifest`` file
+    :returns: SegmentedFile object
+
+    Offsets run through the segments in order. A segment file is only
+    opened when a read reaches it; ``opened`` lists the ones that were.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.manifest = load_manifest(path)
+        self.segments = self.manifest['segments']
+        directory = os.path.dirname(path)
+        self._paths = [os.path.join(directory, s['file']) for s in self.segments]
+        self._starts = []
+        start = 0
+        for p in self._paths:
+            self._starts.append(start)
+            start += os.path.getsize(p) if os.path.exists(p) else 0
+        self.size = start
+        self._files = {}
+        self.opened = []
+        self.pos = 0
+        self.closed = False
+        self._fh = None
+        self._end = -1
+
+    def _segment(self, pos):
+        """Index of the segment holding logical offset pos"""
+        return max(bisect.bisect_right(self._starts, pos) - 1, 0)
+
+    def _file(self, i):
+        fh = self._files.get(i)
+        if fh is None:
+            fh = self._files[i] = open(self._paths[i], 'rb')
+            self.opened.append(self.segments[i]['file'])
+        return fh
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.pos
+        if self.pos + size <= self._end:
+            # still inside the segment the last read left off in
+            chunk = self._fh.read(size)
+            self.pos += len(chunk)
+            return chunk
+        out = []
+        while size > 0 and self.pos < self.size:
+            i = self._segment(self.pos)
+            end = self._starts[i + 1] if i + 1 < len(self._starts) else self.size
+            if end <= self.pos:
+                break
+            fh = self._file(i)
+            fh.seek(self.pos - self._starts[i])
+            chunk = fh.read(min(size, end - self.pos))
+            if not chunk:
+                break
+            out.append(chunk)
+            self.pos += len(chunk)
+            size -= len(chunk)
+            self._fh, self._end = fh, end
+        return b''.join(out)
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += self.size
+        self.pos = max(offset, 0)
+        self._end = -1
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def close(self):
+        for fh in self._files.values():
+            fh.close()
+        self._files = {}
+        self._fh = None
+        self._end = -1
+        self.closed = True
+
+    def select(self, where):
+        """Byte ranges of segments that could hold matching records
+
+        :param where: dict of printable fourcc to list of (key, op, value)
+                      predicates, as for :class:`psas_packet.query.Filter`,
+                      or a Filter
+        :returns: list of (offset, length), adjacent segments merged
+
+        Segments are ruled out by their fourcc counts and timestamp range.
+        A segment without counts, like one still being written, is always
+        read.
+        """
+        where = getattr(where, 'where', where)
+        ranges = []
+        for i, segment in enumerate(self.segments):
+            start = self._starts[i]
+            length = (self._starts[i + 1] if i + 1 < len(self._starts) else self.size) - start
+            if not length or not self._may_match(segment, where):
+                continue
+            if ranges and ranges[-1][0] + ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+            else:
+                ranges.append((start, length))
+        return ranges
+
+    def _may_match(self, segment, where):
+        counts = segment.get('fourccs')
+        if counts is None:
+            return True
+        for name, predicates in where.items():
+            if not counts.get(name):
+                continue
+            times = segment.get('timestamp')
+            if times is not None and name != 'SEQN' and not all(_may_match(op, times[0], times[1], value)
+                                             for key, op, value in predicates if key == 'timestamp'):
+                continue
+            return True
+        return False
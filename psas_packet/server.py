@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Live telemetry over WebSocket and recent history over HTTP.
+
+The ingest side calls :meth:`TelemetryServer.publish` for every message,
+from any thread. That only stores the message, so a busy display never
+slows the receiver down. Each WebSocket client has its own send loop that
+wakes at the rate it asked for, sends the latest values of the fields it
+subscribed to that changed since its last frame, and skips a frame if the
+client hasn't read the last one yet.
+
+Endpoints:
+
+``GET /ws``
+    WebSocket. The client sends JSON text messages like
+    ``{"subscribe": {"ADIS": ["Gyro_X", "Gyro_Y"], "VSTE": []}, "rate": 10}``
+    (an empty list means every field) and gets frames like
+    ``{"time": 1234.5, "data": {"ADIS": {"timestamp": ..., "Gyro_X": ...}}}``.
+
+``GET /history?fourcc=ADIS&fields=Gyro_X,Gyro_Y&seconds=10``
+    JSON list of ``[receive time, record]`` for the last seconds of a type.
+
+``GET /fourccs``
+    JSON list of the fourccs seen so far.
+
+Needs Python 3 and nothing outside the standard library.
+"""
+import asyncio
+import base64
+import collections
+import hashlib
+import json
+import struct
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+_CONTINUATION, _TEXT, _CLOSE, _PING, _PONG = 0x0, 0x1, 0x8, 0x9, 0xA
+
+# close statuses
+_PROTOCOL_ERROR, _TOO_BIG = 1002, 1009
+
+# largest message a client may send, subscriptions are small
+MAX_MESSAGE = 1 << 16
+
+
+class FrameError(Exception):
+    """Raised when a client breaks the WebSocket protocol
+
+    :param int status: close status to send back
+    :param str problem: what was wrong
+    :returns: FrameError exception
+
+    """
+
+    def __init__(self, status, problem):
+        Exception.__init__(self, problem)
+        self.status = status
+
+
+def _default(obj):
+    if isinstance(obj, bytes):
+        return obj.decode('latin-1')
+    raise TypeError(repr(obj))
+
+
+def dumps(obj):
+    """JSON for a frame or response, string fields as text"""
+    return json.dumps(obj, default=_default, separators=(',', ':'))
+
+
+def accept_key(key):
+    """Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key"""
+    return base64.b64encode(hashlib.sha1(key.encode('ascii') + _GUID).digest()).decode('ascii')
+
+
+def frame(payload, opcode=_TEXT, mask=None, fin=True):
+    """Encode one WebSocket frame
+
+    :param bytes payload: frame data
+    :param int opcode: frame type
+    :param bytes mask: 4 byte masking key, clients must mask
+    :param bool fin: last frame of the message
+    :returns: bytes
+
+    """
+    n = len(payload)
+    head = bytearray([(0x80 if fin else 0) | opcode])
+    bit = 0x80 if mask is not None else 0
+    if n < 126:
+        head.append(bit | n)
+    elif n < 1 << 16:
+        head.append(bit | 126)
+        head += struct.pack('!H', n)
+    else:
+        head.append(bit | 127)
+        head += struct.pack('!Q', n)
+    if mask is not None:
+        head += mask
+        payload = _unmask(payload, mask)
+    return bytes(head) + payload
+
+
+def _unmask(payload, mask):
+    n = len(payload)
+    key = int.from_bytes((mask * (n // 4 + 1))[:n], 'big')
+    return (int.from_bytes(payload, 'big') ^ key).to_bytes(n, 'big')
+
+
+async def read_frame(reader, max_size=MAX_MESSAGE):
+    """Read one WebSocket frame
+
+    :param asyncio.StreamReader reader: stream to read from
+    :param int max_size: largest payload to take
+    :returns: (fin, opcode, payload bytes)
+    :raises FrameError: if the payload is over max_size, or a control frame
+                        is fragmented or over 125 bytes
+
+    The length is checked before the payload is read, so a client can't
+    make the server allocate whatever it claims to send.
+    """
+    b0, b1 = await reader.readexactly(2)
+    fin = bool(b0 & 0x80)
+    opcode = b0 & 0x0f
+    n = b1 & 0x7f
+    if n == 126:
+        n, = struct.unpack('!H', await reader.readexactly(2))
+    elif n == 127:
+        n, = struct.unpack('!Q', await reader.readexactly(8))
+    if opcode >= _CLOSE and (not fin or n > 125):
+        raise FrameError(_PROTOCOL_ERROR, "bad control frame")
+    if n > max_size:
+        raise FrameError(_TOO_BIG, "frame of {0} bytes".format(n))
+    mask = await reader.readexactly(4) if b1 & 0x80 else None
+    payload = await reader.readexactly(n)
+    if mask is not None:
+        payload = _unmask(payload, mask)
+    return fin, opcode, payload
+
+
+class _Client(object):
+    """One WebSocket connection"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.partial = None
+        self.fields = {}
+        self.interval = 0.1
+        self.seen = {}
+        self.sent = 0
+        self.skipped = 0
+
+    def message(self, fin, opcode, payload, max_size=MAX_MESSAGE):
+        """Put fragmented messages back together
+
+        :returns: (opcode, payload) once a message is whole, else None.
+                  Control frames come through as they arrive, even between
+                  the fragments of another message
+
+        """
+        if opcode >= _CLOSE:
+            return opcode, payload
+        if opcode == _CONTINUATION:
+            if self.partial is None:
+                raise FrameError(_PROTOCOL_ERROR, "continuation with nothing to continue")
+            first, parts, size = self.partial
+            size += len(payload)
+            if size > max_size:
+                raise FrameError(_TOO_BIG, "message of over {0} bytes".format(max_size))
+            parts.append(payload)
+            if not fin:
+                self.partial = (first, parts, size)
+                return None
+            self.partial = None
+            return first, b''.join(parts)
+        if self.partial is not None:
+            raise FrameError(_PROTOCOL_ERROR, "new message before the last one ended")
+        if not fin:
+            self.partial = (opcode, [payload], len(payload))
+            return None
+        return opcode, payload
+
+    def configure(self, request):
+        if 'subscribe' in request:
+            self.fields = dict((fourcc, list(keys) or None) for fourcc, keys in request['subscribe'].items())
+        if 'rate' in request:
+            self.interval = 1.0 / max(float(request['rate']), 0.001)
+
+
+class TelemetryServer(object):
+    """Serve live and recent telemetry to local display clients
+
+    :param str host: Address to bind, loopback by default
+    :param int port: Port, 0 picks a free one
+    :param float history: Seconds of history to keep per type
+    :param int history_len: Most records to keep per type
+    :param int max_buffer: Skip a client's frame while it has this many
+                           bytes still unsent
+    :returns: TelemetryServer object
+
+    """
+
+    def __init__(self, host='127.0.0.1', port=8080, history=60.0, history_len=100000, max_buffer=1 << 16):
+        self.host = host
+        self.port = port
+        self.history = history
+        self.history_len = history_len
+        self.max_buffer = max_buffer
+        self.published = 0
+        self._latest = {}
+        self._history = {}
+        self._clients = set()
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    def publish(self, timestamp, message):
+        """Store a decoded message. Safe to call from any thread
+
+        :param float timestamp: receive time
+        :param tuple message: (fourcc, data), as from
+                              :meth:`psas_packet.io.Network.listen`
+
+        """
+        fourcc, data = message
+        self.published += 1
+        self._latest[fourcc] = (self.published, data)
+        history = self._history.get(fourcc)
+        if history is None:
+            history = self._history.setdefault(fourcc, collections.deque(maxlen=self.history_len))
+        history.append((timestamp, data))
+
+    def feed(self, source):
+        """Publish every message from a source until it ends
+
+        :param source: iterable of (timestamp, (fourcc, data))
+
+        """
+        for timestamp, message in source:
+            self.publish(timestamp, message)
+
+    def recent(self, fourcc, seconds=None, fields=None, now=None):
+        """Recent records of a type
+
+        :param str fourcc: printable fourcc
+        :param float seconds: how far back, defaults to all kept history
+        :param list fields: only these fields (and 'timestamp')
+        :returns: list of (receive time, record)
+
+        """
+        history = self._history.get(fourcc)
+        if not history:
+            return []
+        if now is None:
+            now = time.time()
+        since = now - (self.history if seconds is None else min(seconds, self.history))
+        out = []
+        for t, data in reversed(list(history)):
+            if t < since:
+                break
+            if fields:
+                data = dict((k, data[k]) for k in ['timestamp'] + list(fields) if k in data)
+            out.append((t, data))
+        out.reverse()
+        return out
+
+    async def start(self):
+        """Start listening on the running event loop"""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        for client in list(self._clients):
+            client.writer.close()
+
+    def start_in_thread(self):
+        """Run the server on its own event loop in a daemon thread
+
+        :returns: self, once it's listening
+
+        """
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run)
+        self._thread.daemon = True
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop_thread(self):
+        """Stop a server started with :meth:`start_in_thread`"""
+        future = asyncio.run_coroutine_threadsafe(self.stop(), self._loop)
+        future.result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = request.decode('latin-1').split('\r\n')
+        try:
+            method, target, _version = lines[0].split(' ', 2)
+        except ValueError:
+            writer.close()
+            return
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                k, v = line.split(':', 1)
+                headers[k.strip().lower()] = v.strip()
+
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        try:
+            if url.path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                await self._websocket(reader, writer, headers)
+                return
+            elif method != 'GET':
+                self._respond(writer, 405, {'error': 'method not allowed'})
+            elif url.path == '/fourccs':
+                self._respond(writer, 200, sorted(self._history))
+            elif url.path == '/history':
+                fourcc = query.get('fourcc', [''])[0]
+                fields = [f for f in query.get('fields', [''])[0].split(',') if f]
+                seconds = float(query['seconds'][0]) if 'seconds' in query else None
+                self._respond(writer, 200, self.recent(fourcc, seconds, fields))
+            else:
+                self._respond(writer, 404, {'error': 'not found'})
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        writer.close()
+
+    def _respond(self, writer, status, obj):
+        body = dumps(obj).encode('utf-8')
+        reason = {200: 'OK', 404: 'Not Found', 405: 'Method Not Allowed'}[status]
+        writer.write('HTTP/1.1 {0} {1}\r\nContent-Type: application/json\r\n'
+                     'Content-Length: {2}\r\nConnection: close\r\n\r\n'.format(status, reason, len(body)).encode('latin-1'))
+        writer.write(body)
+
+    async def _websocket(self, reader, writer, headers):
+        writer.write('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     'Sec-WebSocket-Accept: {0}\r\n\r\n'.format(accept_key(headers.get('sec-websocket-key', ''))).encode('latin-1'))
+        client = _Client(writer)
+        self._clients.add(client)
+        sender = asyncio.ensure_future(self._send_loop(client))
+        try:
+            while True:
+                message = client.message(*await read_frame(reader))
+                if message is None:
+                    continue
+                opcode, payload = message
+                if opcode == _TEXT:
+                    try:
+                        client.configure(json.loads(payload.decode('utf-8')))
+                    except (ValueError, TypeError, AttributeError):
+                        writer.write(frame(dumps({'error': 'bad request'}).encode('utf-8')))
+                elif opcode == _PING:
+                    writer.write(frame(payload, _PONG))
+                elif opcode == _CLOSE:
+                    writer.write(frame(payload[:2], _CLOSE))
+                    break
+        except FrameError as e:
+            writer.write(frame(struct.pack('!H', e.status) + str(e).encode('utf-8')[:100], _CLOSE))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            sender.cancel()
+            self._clients.discard(client)
+            writer.close()
+
+    def _collect(self, client):
+        """Changed subscribed values since the client's last frame"""
+        out = {}
+        for fourcc, keys in client.fields.items():
+            latest = self._latest.get(fourcc)
+            if latest is None or client.seen.get(fourcc) == latest[0]:
+                continue
+            client.seen[fourcc] = latest[0]
+            data = latest[1]
+            if keys is not None:
+                data = dict((k, data[k]) for k in ['timestamp'] + keys if k in data)
+            out[fourcc] = data
+        return out
+
+    async def _send_loop(self, client):
+        transport = client.writer.transport
+        while True:
+            await asyncio.sleep(client.interval)
+            if transport.is_closing():
+                return
+            if transport.get_write_buffer_size() > self.max_buffer:
+                # slow reader, drop this frame rather than queue it
+                client.skipped += 1
+                continue
+            data = self._collect(client)
+            if data:
+                client.writer.write(frame(dumps({'time': time.time(), 'data': data}).encode('utf-8')))
+                client.sent += 1
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Latest value of every message type, with rate limited change
+subscriptions.
+"""
+from psas_packet import messages
+from psas_packet.stats import clock
+
+_MISSING = object()
+
+
+class Subscription(object):
+    """A registered change callback, made by :meth:`TelemetryState.subscribe`
+
+    :returns: Subscription object
+
+    """
+
+    def __init__(self, state, fourcc, keys, callback, min_interval):
+        self.state = state
+        self.fourcc = fourcc
+        self.keys = keys
+        self.callback = callback
+        self.min_interval = min_interval
+        self.sent = {}
+        self.due = 0.0
+        self.calls = 0
+
+    def _check(self, data, now):
+        """Call back with the fields that changed since the last call"""
+        self.due = now + self.min_interval
+        sent = self.sent
+        if self.keys is None:
+            changed = dict((k, v) for k, v in data.items() if k != 'timestamp' and sent.get(k, _MISSING) != v)
+        else:
+            changed = dict((k, data[k]) for k in self.keys if k in data and sent.get(k, _MISSING) != data[k])
+        if not changed:
+            return
+        sent.update(changed)
+        if 'timestamp' in data:
+            changed['timestamp'] = data['timestamp']
+        self.calls += 1
+        self.callback(self.fourcc, changed)
+
+    def cancel(self):
+        """Stop calling back"""
+        self.state._unsubscribe(self)
+
+
+class TelemetryState(object):
+    """Latest decoded record of each message type
+
+    :param Registry registry: Where to look up message types, defaults to
+                              :data:`psas_packet.messages.MESSAGES`
+    :returns: TelemetryState object
+
+    Storing a record is a dictionary assignment. Raw records are decoded the
+    first time someone reads them, or when a subscriber to their type is due
+    a check, so types nobody watches are never decoded and a rate limited
+    subscriber costs nothing between checks.
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry if registry is not None else messages.MESSAGES
+        self._raw = {}
+        self._decoded = {}
+        self._subs = {}
+        self._due = {}
+        self._dirty = set()
+        self.received = {}
+        self.updates = 0
+
+    def update(self, timestamp, message):
+        """Store an already decoded message, as yielded by
+        :meth:`psas_packet.io.Network.listen`
+
+        :param float timestamp: receive time, kept in ``received``
+        :param tuple message: (fourcc, data)
+
+        """
+        fourcc, data = message
+        self.updates += 1
+        self.received[fourcc] = timestamp
+        self._raw.pop(fourcc, None)
+        self._decoded[fourcc] = data
+        if fourcc in self._subs:
+            self._changed(fourcc)
+
+    def update_raw(self, fourcc, raw, now=None):
+        """Store a framed record without decoding it
+
+        :param bytes fourcc: fourcc from the header
+        :param bytes raw: HEADER and body, as from
+                          :meth:`psas_packet.io.BinFile.scan`
+        :param float now: receive time, kept in ``received`` if given
+
+        """
+        name = messages.printable(fourcc)
+        self.updates += 1
+        if now is not None:
+            self.received[name] = now
+        self._raw[name] = raw
+        self._decoded.pop(name, None)
+        if name in self._subs:
+            self._changed(name)
+
+    def feed(self, source):
+        """Update from a stream of messages until it ends
+
+        :param source: iterable of (timestamp, (fourcc, data)), such as
+                       ``Network.listen()`` or ``RingReader.listen()``
+
+        """
+        update = self.update
+        for timestamp, message in source:
+            update(timestamp, message)
+
+    def feed_raw(self, source):
+        """Update from a stream of raw records until it ends
+
+        :param source: iterable of (fourcc, raw), such as ``BinFile.scan()``,
+                       or of (receive time, raw) from ``RingReader.read_raw()``
+
+        """
+        update_raw = self.update_raw
+        for first, raw in source:
+            if isinstance(first, bytes):
+                update_raw(first, raw)
+            else:
+                update_raw(raw[:4], raw, first)
+
+    def latest(self, fourcc):
+        """Most recent record of a type
+
+        :param str fourcc: printable fourcc
+        :returns: dict of decoded values with 'timestamp', or None if none
+                  has arrived
+
+        """
+        data = self._decoded.get(fourcc)
+        if data is None:
+            raw = self._raw.pop(fourcc, None)
+            if raw is None:
+                return None
+            message = self.registry.get(fourcc)
+            if message is None:
+                data = messages.decode(raw)[1][1]
+            else:
+                header = messages.HEADER.size
+                _fourcc, timestamp, length = messages.HEADER.decode(raw[:header])
+                data = dict({'timestamp': timestamp}, **message.decode(raw[header:header + length]))
+            self._decoded[fourcc] = data
+        return data
+
+    def get(self, fourcc, key, default=None):
+        """Most recent value of one field"""
+        data = self.latest(fourcc)
+        if data is None:
+            return default
+        return data.get(key, default)
+
+    def fourccs(self):
+        """Printable fourccs seen so far"""
+        return set(self._raw) | set(self._decoded)
+
+    def subscribe(self, fourcc, callback, keys=None, min_interval=0.0):
+        """Call back when fields of a type change
+
+        :param str fourcc: printable fourcc to watch
+        :param callback: function(fourcc, changed) where changed is a dict of
+                         the fields that changed since the last call, and
+                         the 'timestamp' of the record they came from
+        :param list keys: fields to watch, default all
+        :param float min_interval: check for changes at most this often, in
+                                   seconds. A check compares the latest
+                                   record to what was last sent, so a value
+                                   that changes and changes back in between
+                                   isn't reported
+        :returns: :class:`Subscription`
+
+        The first call comes with the next record of that type, or the next
+        :meth:`poll` if one has already arrived.
+        """
+        sub = Subscription(self, fourcc, keys, callback, min_interval)
+        self._subs.setdefault(fourcc, []).append(sub)
+        self._due[fourcc] = 0.0
+        if fourcc in self._raw or fourcc in self._decoded:
+            self._dirty.add(fourcc)
+        return sub
+
+    def _unsubscribe(self, sub):
+        subs = self._subs.get(sub.fourcc, [])
+        if sub in subs:
+            subs.remove(sub)
+        if subs:
+            self._due[sub.fourcc] = min(s.due for s in subs)
+        else:
+            self._subs.pop(sub.fourcc, None)
+            self._due.pop(sub.fourcc, None)
+            self._dirty.discard(sub.fourcc)
+
+    def _changed(self, fourcc):
+        now = clock()
+        if now >= self._due[fourcc]:
+            self._deliver(fourcc, now)
+        else:
+            self._dirty.add(fourcc)
+
+    def _deliver(self, fourcc, now):
+        """Check every subscriber of a type that is due"""
+        data = self.latest(fourcc)
+        due = None
+        waiting = False
+        for sub in list(self._subs[fourcc]):
+            if sub.due <= now:
+                sub._check(data, now)
+            else:
+                waiting = True
+            if due is None or sub.due < due:
+                due = sub.due
+        if fourcc in self._due:
+            self._due[fourcc] = due
+        if waiting:
+            self._dirty.add(fourcc)
+        else:
+            self._dirty.discard(fourcc)
+
+    def poll(self, now=None):
+        """Check subscribers whose interval is up against records that came
+        in while they waited. Call it when the stream may have gone quiet
+
+        :param float now: time from :data:`psas_packet.stats.clock`
+
+        """
+        if not self._dirty:
+            return
+        if now is None:
+            now = clock()
+        for fourcc in list(self._dirty):
+            if fourcc in self._subs and now >= self._due[fourcc]:
+                self._deliver(fourcc, now)
@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Low overhead counters and histograms for the receive and decode path.
+"""
+from __future__ import print_function
+import os
+import threading
+import time
+
+# best clock we have for measuring short intervals
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Rate(object):
+    """Count events per wall clock second
+
+    :returns: Rate object
+
+    Keeps the running count for the current second and the finished count of
+    the previous one, so reading a rate never has to look at history.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self._second = 0
+        self._count = 0
+        self._last = 0
+
+    def inc(self, now, n=1):
+        """Record n events at time now
+
+        :param float now: Unix time of the event
+        :param int n: Number of events
+
+        """
+        second = int(now)
+        if second != self._second:
+            self._last = self._count if second == self._second + 1 else 0
+            self._second = second
+            self._count = 0
+        self._count += n
+        self.total += n
+
+    def merge(self, other):
+        """Add the events counted by another Rate into this one
+
+        :param Rate other: Rate to add
+
+        """
+        self.total += other.total
+        if other._second == self._second:
+            self._count += other._count
+            self._last += other._last
+        elif other._second > self._second:
+            last = self._count if other._second == self._second + 1 else 0
+            self._second = other._second
+            self._count = other._count
+            self._last = other._last + last
+        elif other._second == self._second - 1:
+            self._last += other._count
+
+    def per_second(self, now=None):
+        """Events seen in the last complete second
+
+        :param float now: Unix time to evaluate at, defaults to now
+        :returns: int count
+
+        """
+        if now is None:
+            now = time.time()
+        age = int(now) - self._second
+        if age == 0:
+            return self._last
+        if age == 1:
+            return self._count
+        return 0
+
+
+class Histogram(object):
+    """Fixed memory log-linear histogram of non-negative integers
+
+    :param int sub_bits: Significant bits kept per value (precision)
+    :returns: Histogram object
+
+    Values are bucketed by power of two, and each power of two is split into
+    2**(sub_bits - 1) linear buckets, like an HDR histogram. Recording is a
+    couple of integer operations and percentiles are within 1/2**(sub_bits-1)
+    of the real value.
+    """
+
+    def __init__(self, sub_bits=5):
+        self._sub_bits = sub_bits
+        self._sub = 1 << sub_bits
+        self._half = self._sub >> 1
+        self.counts = [0] * ((64 + 2) * self._half)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value < self._sub:
+            return value
+        shift = value.bit_length() - self._sub_bits
+        return shift * self._half + (value >> shift)
+
+    def _value(self, index):
+        if index < self._sub:
+            return index
+        shift = index // self._half - 1
+        return (index - shift * self._half) << shift
+
+    def record(self, value):
+        """Add a value to the histogram
+
+        :param int value: Value to record, negative values count as 0
+
+        """
+        value = int(value)
+        if value < 0:
+            value = 0
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Add all the values recorded in another histogram into this one
+
+        :param Histogram other: Histogram with the same precision
+
+        """
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, p):
+        """Approximate value at a percentile
+
+        :param float p: Percentile from 0 to 100
+        :returns: Lower bound of the bucket holding that percentile, or None
+
+        """
+        if self.count == 0:
+            return None
+        target = max(1, int(round(self.count * p / 100.0)))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return min(max(self._value(i), self.min), self.max)
+        return self.max
+
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.total / float(self.count)
+
+    def summary(self, percentiles=(50, 90, 99, 99.9)):
+        """Dictionary summary of the histogram
+
+        :param tuple percentiles: Which percentiles to include
+        :returns: dict with count, min, max, mean and percentiles
+
+        """
+        s = {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean(),
+        }
+        for p in percentiles:
+            s['p{0:g}'.format(p)] = self.percentile(p)
+        return s
+
+
+class Stats(object):
+    """Counters for a receiver
+
+    :returns: Stats object
+
+    Pass an instance to :class:`psas_packet.io.Network` to turn on
+    instrumentation. One instance can be shared by several receivers.
+    Latencies are recorded in microseconds.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.datagrams = Rate()
+        self.bytes = Rate()
+        self.messages = {}
+        self.unknown = 0
+        self.out_of_sync = 0
+        self.errors = 0
+        self.decode_latency = Histogram()
+        self.log_write_latency = Histogram()
+
+    def datagram(self, now, size):
+        """Record an arriving datagram
+
+        :param float now: Arrival time
+        :param int size: Size in bytes
+
+        """
+        self.datagrams.inc(now)
+        self.bytes.inc(now, size)
+
+    def message(self, fourcc):
+        """Record a decoded message
+
+        :param str fourcc: printable fourcc of the message
+
+        """
+        self.messages[fourcc] = self.messages.get(fourcc, 0) + 1
+
+    def merge(self, other):
+        """Add the counters of another Stats into this one, to total up
+        several receivers
+
+        :param Stats other: Stats to add
+
+        """
+        self.started = min(self.started, other.started)
+        self.datagrams.merge(other.datagrams)
+        self.bytes.merge(other.bytes)
+        for fourcc, n in other.messages.items():
+            self.messages[fourcc] = self.messages.get(fourcc, 0) + n
+        self.unknown += other.unknown
+        self.out_of_sync += other.out_of_sync
+        self.errors += other.errors
+        self.decode_latency.merge(other.decode_latency)
+        self.log_write_latency.merge(other.log_write_latency)
+
+    def snapshot(self):
+        """Take a copy of the current counters
+
+        :returns: dict of plain values safe to serialize
+
+        """
+        now = time.time()
+        return {
+            'time': now,
+            'uptime': now - self.started,
+            'datagrams': self.datagrams.total,
+            'datagrams_per_sec': self.datagrams.per_second(now),
+            'bytes': self.bytes.total,
+            'bytes_per_sec': self.bytes.per_second(now),
+            'messages': dict(self.messages),
+            'unknown': self.unknown,
+            'out_of_sync': self.out_of_sync,
+            'errors': self.errors,
+            'decode_latency_us': self.decode_latency.summary(),
+            'log_write_latency_us': self.log_write_latency.summary(),
+        }
+
+    def prometheus(self):
+        """Render the counters in the Prometheus text exposition format
+
+        :returns: str
+
+        """
+        s = self.snapshot()
+        lines = []
+
+        def metric(name, kind, value, help_text, labels=None):
+            lines.append("# HELP psas_{0} {1}".format(name, help_text))
+            lines.append("# TYPE psas_{0} {1}".format(name, kind))
+            if labels is None:
+                lines.append("psas_{0} {1}".format(name, value))
+            else:
+                for label, v in sorted(labels.items()):
+                    lines.append('psas_{0}{{fourcc="{1}"}} {2}'.format(name, label, v))
+
+        metric('datagrams_total', 'counter', s['datagrams'], "Datagrams received")
+        metric('datagrams_per_second', 'gauge', s['datagrams_per_sec'], "Datagrams received in the last second")
+        metric('bytes_total', 'counter', s['bytes'], "Bytes received")
+        metric('bytes_per_second', 'gauge', s['bytes_per_sec'], "Bytes received in the last second")
+        metric('messages_total', 'counter', None, "Messages decoded by type", labels=s['messages'])
+        metric('unknown_total', 'counter', s['unknown'], "Messages with an unknown fourcc")
+        metric('out_of_sync_total', 'counter', s['out_of_sync'], "Datagrams that lost message sync")
+        metric('errors_total', 'counter', s['errors'], "Datagrams that failed to decode")
+        for name, key in (('decode_latency_us', 'decode_latency_us'),
+                          ('log_write_latency_us', 'log_write_latency_us')):
+            h = s[key]
+            lines.append("# TYPE psas_{0} summary".format(name))
+            for q in ('p50', 'p90', 'p99'):
+                if h[q] is not None:
+                    lines.append('psas_{0}{{quantile="0.{1}"}} {2}'.format(name, q[1:], h[q]))
+            lines.append("psas_{0}_count {1}".format(name, h['count']))
+            lines.append("psas_{0}_sum {1}".format(name, h['mean'] * h['count'] if h['count'] else 0))
+        return '\n'.join(lines) + '\n'
+
+
+class _Periodic(threading.Thread):
+    """Daemon thread that calls a function every interval seconds"""
+
+    def __init__(self, interval, func):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.interval = interval
+        self.func = func
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.func()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class FileExporter(object):
+    """Periodically write a stats snapshot to a file
+
+    :param Stats stats: Stats to export
+    :param str path: File to (re)write
+    :param float interval: Seconds between writes
+    :param str fmt: 'json' or 'prometheus'
+    :returns: FileExporter object
+
+    The file is replaced atomically so readers never see a partial write.
+    """
+
+    def __init__(self, stats, path, interval=10.0, fmt='json'):
+        self.stats = stats
+        self.path = path
+        self.fmt = fmt
+        self._thread = _Periodic(interval, self.write)
+
+    def write(self):
+        import json
+        if self.fmt == 'prometheus':
+            text = self.stats.prometheus()
+        else:
+            text = json.dumps(self.stats.snapshot(), sort_keys=True) + '\n'
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.rename(tmp, self.path)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._thread.stop()
+
+
+class PrometheusExporter(object):
+    """Serve stats in Prometheus text format over HTTP
+
+    :param Stats stats: Stats to export
+    :param int port: Port to listen on, 0 picks a free one
+    :param str host: Address to bind, defaults to loopback only
+    :returns: PrometheusExporter object
+
+    """
+
+    def __init__(self, stats, port=9101, host='127.0.0.1'):
+        try:
+            from http.server import BaseHTTPRequestHandler, HTTPServer
+        except ImportError:
+            from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = stats.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
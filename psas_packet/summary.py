@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" One pass summary statistics for every field in a log.
+"""
+import json
+import math
+import os
+import struct
+from psas_packet import io, messages
+
+
+class Accumulator(object):
+    """Running count, min, max, mean and variance of a series
+
+    :returns: Accumulator object
+
+    Each chunk is reduced on its own, its mean with ``math.fsum`` and then
+    the sum of squared differences from that mean, and chunks are combined
+    with Chan's formula. That is numerically stable and needs memory for one
+    chunk, not the whole series.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, values):
+        """Add a chunk of values
+
+        :param list values: numbers
+
+        """
+        n = len(values)
+        if n == 0:
+            return
+        mean = math.fsum(values) / n
+        m2 = math.fsum((v - mean) ** 2 for v in values)
+        self._merge(n, mean, m2, min(values), max(values))
+
+    def merge(self, other):
+        """Combine with another accumulator
+
+        :param Accumulator other: accumulator to add in
+
+        """
+        if other.count:
+            self._merge(other.count, other.mean, other.m2, other.min, other.max)
+
+    def _merge(self, n, mean, m2, lo, hi):
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        if self.min is None or lo < self.min:
+            self.min = lo
+        if self.max is None or hi > self.max:
+            self.max = hi
+
+    def result(self, scaleby=1, bias=0):
+        """Summary in (optionally) scaled units
+
+        :param float scaleby: multiply by this, as in member 'units'
+        :param float bias: then add this
+        :returns: dict with count, min, max, mean and (population) std
+
+        """
+        if self.count == 0:
+            return {'count': 0, 'min': None, 'max': None, 'mean': None, 'std': None}
+        lo, hi = self.min * scaleby + bias, self.max * scaleby + bias
+        if scaleby < 0:
+            lo, hi = hi, lo
+        return {
+            'count': self.count,
+            'min': lo,
+            'max': hi,
+            'mean': self.mean * scaleby + bias,
+            'std': math.sqrt(self.m2 / self.count) * abs(scaleby),
+        }
+
+
+def _numeric(stype):
+    return 's' not in stype and stype not in ('c', '?', 'x')
+
+
+class _Fixed(object):
+    """Collects raw bodies of one fixed size type and summarizes a chunk at a
+    time with Struct.iter_unpack"""
+
+    def __init__(self, message, chunk):
+        self.message = message
+        self.chunk = chunk
+        self.bodies = []
+        self.columns = [(i, m, Accumulator()) for i, m in enumerate(message.member_list) if _numeric(m['stype'])]
+        self.skipped = 0
+
+    def add(self, body):
+        self.bodies.append(body)
+        if len(self.bodies) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        if not self.bodies:
+            return
+        rows = list(messages._iter_unpack(self.message.struct, b''.join(self.bodies)))
+        self.bodies = []
+        for i, m, acc in self.columns:
+            acc.add([row[i] for row in rows])
+
+    def result(self):
+        self.flush()
+        out = {}
+        for i, m, acc in self.columns:
+            units = m.get('units', {})
+            out[m['key']] = acc.result(units.get('scaleby', 1), units.get('bias', 0))
+        return out
+
+
+class _Variable(object):
+    """Decodes each record of a variable size type and summarizes its scalar
+    numeric fields"""
+
+    def __init__(self, message):
+        self.message = message
+        self.values = dict((m['key'], []) for m in message.member_list
+                           if 'count' not in m and _numeric(m['stype']))
+        self.accs = dict((k, Accumulator()) for k in self.values)
+        self.chunk = 4096
+        self.skipped = 0
+
+    def add(self, body):
+        try:
+            data = self.message.decode(body)
+        except (messages.MessageSizeError, struct.error):
+            # a body that doesn't fit its prefixes, skip it like a fixed
+            # size record of the wrong size
+            self.skipped += 1
+            return
+        for key, values in self.values.items():
+            values.append(data[key])
+            if len(values) >= self.chunk:
+                self.accs[key].add(values)
+                del values[:]
+
+    def result(self):
+        out = {}
+        for key, values in self.values.items():
+            self.accs[key].add(values)
+            del values[:]
+            out[key] = self.accs[key].result()
+        return out
+
+
+def _sidecar(fname):
+    return fname + '.summary.json'
+
+
+def _signature(fname):
+    st = os.stat(fname)
+    return [st.st_size, st.st_mtime]
+
+
+def summarize(log, fourccs=None, chunk=4096, cache=False, skipped=None):
+    """Count, min, max, mean and std of every field of every message type in
+    a log, in one pass and constant memory
+
+    :param log: log filename or file-like object
+    :param fourccs: only summarize these printable fourccs (default all)
+    :param int chunk: records per type to unpack at once
+    :param bool cache: with a filename, keep the result in a
+                       ``<log>.summary.json`` sidecar and reuse it while the
+                       log is unchanged
+    :param dict skipped: if given, filled with the number of records of each
+                         printable fourcc that were skipped because they
+                         couldn't be decoded
+    :returns: dict of {fourcc: {field: {count, min, max, mean, std}}} in
+              normal units. std is the population standard deviation
+
+    """
+    path = log if io._is_string_like(log) else None
+    if cache and path is not None:
+        try:
+            with open(_sidecar(path)) as f:
+                saved = json.load(f)
+            if saved['signature'] == _signature(path):
+                summary = saved['summary']
+                bad = saved.get('skipped', {})
+                if fourccs is not None:
+                    summary = dict((k, v) for k, v in summary.items() if k in fourccs)
+                    bad = dict((k, v) for k, v in bad.items() if k in fourccs)
+                if skipped is not None:
+                    skipped.update(bad)
+                return summary
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    # a sidecar holds every type, so only narrow the scan without one
+    wanted = None if (fourccs is None or (cache and path is not None)) else set(fourccs)
+    collectors = {}
+    skip = set()
+    header = messages.HEADER.size
+    with io.BinFile(log) as f:
+        for fourcc, raw in f.scan():
+            collector = collectors.get(fourcc)
+            if collector is None:
+                if fourcc in skip:
+                    continue
+                name = messages.printable(fourcc)
+                message = messages.MESSAGES.get(name)
+                if message is None or (wanted is not None and name not in wanted):
+                    skip.add(fourcc)
+                    continue
+                collector = _Variable(message) if message.variable else _Fixed(message, chunk)
+                collectors[fourcc] = collector
+
+            body = raw[header:]
+            if collector.message.size is not None and len(body) != collector.message.size:
+                collector.skipped += 1
+                continue
+            collector.add(body)
+
+    summary = dict((messages.printable(k), c.result()) for k, c in collectors.items())
+    bad = dict((messages.printable(k), c.skipped) for k, c in collectors.items() if c.skipped)
+
+    if cache and path is not None:
+        tmp = _sidecar(path) + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({'signature': _signature(path), 'summary': summary, 'skipped': bad}, f)
+            os.rename(tmp, _sidecar(path))
+        except (IOError, OSError):
+            # read-only log directory, no sidecar this time
+            pass
+
+    if fourccs is not None:
+        summary = dict((k, v) for k, v in summary.items() if k in fourccs)
+        bad = dict((k, v) for k, v in bad.items() if k in fourccs)
+    if skipped is not None:
+        skipped.update(bad)
+    return summary
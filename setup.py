@@ -19,9 +19,11 @@ setup(
     package_dir={'psas_packet': 'psas_packet'},
     include_package_data=True,
     install_requires=[],
+    extras_require={'numpy': ['numpy']},
     scripts=[
         'scripts/gen-psas-types',
         'scripts/log2csv',
+        'scripts/log2sqlite',
         'scripts/slicelog',
         'scripts/replaylog',
         'scripts/autodoc',
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_bulk
+----------------------------------
+
+Tests for `bulk` module.
+"""
+
+import socket
+import unittest
+from psas_packet import bulk
+
+
+class TestBulk(unittest.TestCase):
+
+    def setUp(self):
+        self.rx = []
+        for i in range(2):
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.bind(('127.0.0.1', 0))
+            s.settimeout(1)
+            self.rx.append(s)
+
+    def tearDown(self):
+        for s in self.rx:
+            s.close()
+
+    def test_send_many(self):
+        datagrams = [b'packet %d' % i for i in range(1500)]
+        self.rx[0].setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        with bulk.SocketPool('127.0.0.1') as pool:
+            self.assertEqual(pool.send(self.rx[0].getsockname(), datagrams), 1500)
+        got = [self.rx[0].recv(64) for i in range(1500)]
+        self.assertEqual(got, datagrams)
+
+    def test_ctypes_fill(self):
+        if bulk._sendmmsg is None:
+            self.skipTest("no sendmmsg")
+        flat = bulk._FLAT
+        bulk._FLAT = False
+        try:
+            with bulk.SocketPool('127.0.0.1') as pool:
+                self.assertEqual(pool.send(self.rx[0].getsockname(), [b'x', b'yz']), 2)
+        finally:
+            bulk._FLAT = flat
+        self.assertEqual([self.rx[0].recv(8), self.rx[0].recv(8)], [b'x', b'yz'])
+
+    def test_send_loop_fallback(self):
+        tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        tx.connect(self.rx[0].getsockname())
+        try:
+            self.assertEqual(bulk._send_loop(tx, [b'a', b'b']), 2)
+        finally:
+            tx.close()
+        self.assertEqual(self.rx[0].recv(8), b'a')
+        self.assertEqual(self.rx[0].recv(8), b'b')
+
+    def test_send_batch(self):
+        a, b = [s.getsockname() for s in self.rx]
+        with bulk.SocketPool('127.0.0.1') as pool:
+            sent = pool.send_batch([(a, b'1'), (b, b'2'), (a, b'3')])
+            self.assertTrue(pool.get(a) is pool.get(a))
+        self.assertEqual(sent, 3)
+        self.assertEqual([self.rx[0].recv(8), self.rx[0].recv(8)], [b'1', b'3'])
+        self.assertEqual(self.rx[1].recv(8), b'2')
+
+
+if __name__ == '__main__':
+    unittest.main()
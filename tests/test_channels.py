@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_channels
+----------------------------------
+
+Tests for `channels` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from psas_packet import messages
+
+try:
+    import numpy
+    from psas_packet import channels
+except ImportError:
+    numpy = None
+
+GPS96 = messages.MESSAGES['GPS96']
+GPS99 = messages.MESSAGES['GPS99']
+SEQN = messages.MESSAGES['SEQN']
+
+
+def record(msg, t, data):
+    return messages.HEADER.encode(msg, t) + msg.encode(data)
+
+
+def satellites(i):
+    data = {'GPS_Week': 1800 + i, 'GPS_Time_of_Week': 10.0 * i, 'spare': i}
+    for c in range(12):
+        data['Channel_{0}'.format(c)] = c
+        data['Elev_Angle_{0}'.format(c)] = -c - i
+        data['Azimuth_Angle_{0}'.format(c)] = 2.0 * (i + c)
+        data['Dopplr_{0}'.format(c)] = 100 * c - i
+        data['spare_{0}'.format(c)] = c
+    return data
+
+
+@unittest.skipIf(numpy is None, "needs NumPy")
+class TestChannels(unittest.TestCase):
+
+    def test_layout(self):
+        fields, chans = channels.layout(GPS99)
+        self.assertEqual(len(chans), 17)
+        self.assertEqual(chans['Azimuth_Angle'], ['Azimuth_Angle_{0}'.format(c) for c in range(12)])
+        # 'spare' is its own member, so spare_<n> aren't a channel
+        self.assertTrue('spare' in fields and 'spare_0' in fields)
+        self.assertEqual(fields[:4], ['Nav_Mode_2', 'UTC_Time_Diff', 'GPS_Week', 'GPS_Time_of_Week'])
+
+        fields, chans = channels.layout(GPS96)
+        self.assertEqual(fields, ['spare', 'Week', 'TOW'])
+        self.assertEqual(sorted(chans), ['Phase', 'PseudoRange', 'UICS_TT_SNR_PRN', 'UIDoppler_FL'])
+
+    def test_same_as_decode(self):
+        raws = [record(GPS99, 1000 * i, satellites(i)) for i in range(20)]
+        cols = channels.from_records(raws, GPS99)
+        decoded = [GPS99.decode(r[messages.HEADER.size:]) for r in raws]
+
+        self.assertEqual(cols['timestamp'].tolist(), [1000 * i for i in range(20)])
+        self.assertEqual(cols['Azimuth_Angle'].shape, (20, 12))
+        for name, keys in channels.layout(GPS99)[1].items():
+            self.assertEqual(cols[name].tolist(), [[d[k] for k in keys] for d in decoded], name)
+        for key in channels.layout(GPS99)[0]:
+            self.assertEqual(cols[key].tolist(), [d[key] for d in decoded], key)
+        # scaled members are floats, the rest keep their packed type
+        self.assertEqual(cols['Azimuth_Angle'].dtype, numpy.float64)
+        self.assertEqual(cols['Elev_Angle'].dtype, numpy.int8)
+        self.assertEqual(cols['Azimuth_Angle'][3, 2], 10.0)
+
+    def test_raw_counts(self):
+        raws = [record(GPS99, i, satellites(i)) for i in range(4)]
+        counts = channels.from_records(raws, GPS99, units=False)
+        self.assertEqual(counts['Azimuth_Angle'].dtype, numpy.uint8)
+        self.assertEqual(counts['Azimuth_Angle'][3, 2], 5)
+        cols = channels.from_records(raws, GPS99)
+        self.assertEqual(GPS99.to_units('Azimuth_Angle_0', counts['Azimuth_Angle']).tolist(),
+                         cols['Azimuth_Angle'].tolist())
+
+    def test_field_major(self):
+        data = dict(('PseudoRange_{0}'.format(c), 1e7 + c) for c in range(12))
+        data['Phase_11'] = -1.5
+        bodies = GPS96.encode(data) * 3
+        cols = channels.decode(bodies, GPS96, records=False)
+        self.assertEqual(cols['PseudoRange'].shape, (3, 12))
+        self.assertEqual(cols['PseudoRange'][2].tolist(), [1e7 + c for c in range(12)])
+        self.assertEqual(cols['Phase'][:, 11].tolist(), [-1.5] * 3)
+        self.assertTrue('timestamp' not in cols)
+
+    def test_read_log(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'gps.log')
+            with open(path, 'wb') as f:
+                for i in range(5):
+                    f.write(record(SEQN, 0, {'Sequence': i}))
+                    f.write(record(GPS99, i, satellites(i)))
+                    f.write(record(GPS96, i, {}))
+            cols = channels.read(path, 'GPS99')
+            empty = channels.read(path, 'GPS94')
+        finally:
+            shutil.rmtree(tmp)
+        self.assertEqual(cols['GPS_Week'].tolist(), [1800, 1801, 1802, 1803, 1804])
+        self.assertEqual(cols['Dopplr'][:, 1].tolist(), [100, 99, 98, 97, 96])
+        self.assertEqual(len(empty['timestamp']), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_compact
+----------------------------------
+
+Tests for `compact` module.
+"""
+
+import unittest
+from psas_packet import compact, messages
+
+ADIS = messages.MESSAGES['ADIS']
+ROLL = messages.MESSAGES['ROLL']
+
+
+def adis_sample(i):
+    return {
+        'VCC': 5.0,
+        'Gyro_X': 0.05 * (i % 7),
+        'Gyro_Y': -0.1 * (i % 3),
+        'Gyro_Z': 0,
+        'Acc_X': 9.8,
+        'Acc_Y': 0.03 * i,
+        'Acc_Z': 0,
+        'Magn_X': 20e-6,
+        'Magn_Y': 0,
+        'Magn_Z': 0,
+        'Temp': 30,
+        'Aux_ADC': 0,
+    }
+
+
+class TestCompact(unittest.TestCase):
+
+    def test_zigzag(self):
+        for n in (0, 1, -1, 2, -2, 1000, -70000, 2**40):
+            self.assertEqual(compact.unzigzag(compact.zigzag(n)), n)
+        self.assertEqual([compact.zigzag(n) for n in (0, -1, 1, -2)], [0, 1, 2, 3])
+
+    def test_fourcc(self):
+        self.assertEqual(compact.compact_fourcc(b'ADIS'), b'aDIS')
+        self.assertEqual(compact.full_fourcc(b'gPS\x01'), b'GPS\x01')
+        self.assertTrue(compact.is_compact(b'rNHP'))
+        self.assertEqual(compact.printable(b'gPS\x01'), 'gPS1')
+        self.assertEqual(compact.printable(b'aDIS'), 'aDIS')
+
+    def test_round_trip(self):
+        enc = compact.CompactEncoder(ADIS, keyframe_interval=10)
+        dec = compact.CompactDecoder()
+        total = 0
+        for i in range(50):
+            body = enc.encode(adis_sample(i))
+            total += len(body)
+            self.assertEqual(bool(bytearray(body)[0] & compact.KEYFRAME), i % 10 == 0)
+            got = dec.decode_body(enc.fourcc, body)
+            expect = ADIS.decode(ADIS.encode(adis_sample(i)))
+            self.assertEqual(got, expect)
+        self.assertLess(total, 50 * ADIS.size / 2.0)
+
+    def test_bits(self):
+        enc = compact.CompactEncoder(ROLL)
+        dec = compact.CompactDecoder()
+        for data in ({'Angle': 1.5, 'Disable': 0}, {'Angle': 1.5, 'Disable': 1}, {'Angle': 2.5, 'Disable': 1}):
+            body = enc.encode(data)
+            self.assertEqual(dec.decode_body(enc.fourcc, body), data)
+        # frame byte, bitmap, bit field, nothing changed
+        self.assertEqual(len(enc.encode({'Angle': 2.5, 'Disable': 1})), 3)
+
+        # out of range flag falls back to a keyframe
+        body = enc.encode({'Angle': 2.5, 'Disable': 7})
+        self.assertTrue(bytearray(body)[0] & compact.KEYFRAME)
+        self.assertEqual(dec.decode_body(enc.fourcc, body)['Disable'], 7)
+
+    def test_lost_frame(self):
+        enc = compact.CompactEncoder(ADIS, keyframe_interval=5)
+        dec = compact.CompactDecoder()
+        bodies = [enc.encode(adis_sample(i)) for i in range(10)]
+        self.assertEqual(dec.decode_body(enc.fourcc, bodies[1]), None)
+        dec.decode_body(enc.fourcc, bodies[0])
+        self.assertEqual(dec.decode_body(enc.fourcc, bodies[2]), None)
+        self.assertEqual(dec.decode_body(enc.fourcc, bodies[3]), None)
+        self.assertEqual(dec.lost, 3)
+        self.assertNotEqual(dec.decode_body(enc.fourcc, bodies[5]), None)
+        self.assertNotEqual(dec.decode_body(enc.fourcc, bodies[6]), None)
+
+    def test_framed(self):
+        enc = compact.CompactEncoder(ADIS)
+        dec = compact.CompactDecoder()
+        buff = enc.message_bytes(adis_sample(0), 10) + enc.message_bytes(adis_sample(1), 20)
+        buff += messages.HEADER.encode(ROLL, 30) + ROLL.encode({'Angle': 1.0})
+        out = []
+        while buff:
+            n, data = dec.decode(buff)
+            buff = buff[n:]
+            out.append(data)
+        self.assertEqual([d[0] for d in out], ['ADIS', 'ADIS', 'ROLL'])
+        self.assertEqual(out[1][1]['timestamp'], 20)
+
+    def test_truncated(self):
+        enc = compact.CompactEncoder(ADIS)
+        dec = compact.CompactDecoder()
+        dec.decode_body(enc.fourcc, enc.encode(adis_sample(0)))
+        delta = enc.encode(adis_sample(1))
+        self.assertRaises(ValueError, dec.decode_body, enc.fourcc, b'')
+        self.assertRaises(ValueError, dec.decode_body, enc.fourcc, delta[:2])
+        self.assertRaises(ValueError, dec.decode_body, enc.fourcc, delta[:-1])
+
+    def test_variable_rejected(self):
+        diag = messages.Message({'name': "Diag", 'fourcc': b'DIAG', 'size': "Variable", 'endianness': '!',
+                                 'members': [{'key': "Text", 'stype': "s", 'count': "B"}]})
+        self.assertRaises(messages.SchemaError, compact.CompactEncoder, diag)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_export
+----------------------------------
+
+Tests for `export` module.
+"""
+
+import gzip
+import io as _io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from psas_packet import export, io, messages, pipeline
+
+ADIS = messages.MESSAGES['ADIS']
+GPS98 = messages.MESSAGES['GPS98']
+SEQN = messages.MESSAGES['SEQN']
+VSTE = messages.MESSAGES['VSTE']
+LOG = "tests/data/simple_logfile"
+# MPL3 headers say length 0, the body follows anyway
+MPL3_LOG = "tests/data/mpl3_logfile"
+
+
+def record(msg, t, data):
+    return messages.HEADER.encode(msg, t) + msg.encode(data)
+
+
+def expected(log):
+    with io.BinFile(log) as f:
+        return ''.join(json.dumps(m, sort_keys=True) + '\n' for m in f.read())
+
+
+class TestNDJSON(unittest.TestCase):
+
+    def dump(self, log, **kwargs):
+        out = _io.BytesIO()
+        export.dump(log, out, **kwargs)
+        return out.getvalue().decode('utf-8')
+
+    def test_same_as_json(self):
+        self.assertEqual(self.dump(LOG), expected(LOG))
+
+    def test_fixlength(self):
+        self.assertEqual(self.dump(MPL3_LOG), expected(MPL3_LOG))
+
+    def test_select(self):
+        lines = self.dump(LOG, fourccs=['SEQN', 'RNHP']).splitlines()
+        self.assertEqual(len(lines), 8)
+        self.assertEqual(set(json.loads(l)[0] for l in lines), set(['SEQN', 'RNHP']))
+
+    def test_awkward_values(self):
+        log = (record(VSTE, 1, {'Altitude': float('nan'), 'Acc_up': float('-inf'), 'Vel_up': -0.0}) +
+               messages.HEADER.encode(GPS98, 2) + GPS98.struct.pack(b'\x00\xab', 3, 0, 0) +
+               b'ABCD\x00\x00\x00\x00\x00\x03\x00\x03\x0a\xff\x00')
+        text = self.dump(_io.BytesIO(log))
+        state, almanac, unknown = [json.loads(l) for l in text.splitlines()]
+        self.assertEqual(text.splitlines()[0], json.dumps(['VSTE', dict(VSTE.decode(log[12:60]), timestamp=1)], sort_keys=True))
+        self.assertTrue('"Altitude": NaN' in text and '"Acc_up": -Infinity' in text)
+        self.assertEqual(state[1]['Vel_up'], 0.0)
+        # bytes come out as hex
+        self.assertEqual(almanac[1]['Alman_Data'], '00ab' + '00' * 62)
+        self.assertEqual(unknown, ['ABCD', {'raw': '0A FF 00', 'timestamp': 3}])
+
+    def test_sink(self):
+        out = _io.BytesIO()
+        writer = export.NDJSONWriter(out, buffer_size=100)
+        pipeline.from_log(LOG).to(writer)
+        self.assertEqual(out.getvalue().decode('utf-8'), expected(LOG))
+        self.assertEqual(writer.count, 171)
+
+    def test_orjson(self):
+        try:
+            import orjson
+        except ImportError:
+            self.skipTest("needs orjson")
+        lines = self.dump(LOG, orjson=True).splitlines()
+        self.assertEqual([json.loads(l) for l in lines], [json.loads(l) for l in expected(LOG).splitlines()])
+        self.assertTrue(lines[0].startswith('["SEQN",{"Sequence":'))
+
+
+class TestSQLite(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmp, 'flight.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def query(self, sql):
+        db = sqlite3.connect(self.db)
+        try:
+            return db.execute(sql).fetchall()
+        finally:
+            db.close()
+
+    def test_load(self):
+        self.assertEqual(export.to_sqlite(LOG, self.db), 171)
+        with io.BinFile(LOG) as f:
+            adis = [d for fourcc, d in f.read() if fourcc == 'ADIS']
+        keys = [m['key'] for m in ADIS.member_list]
+        rows = self.query('SELECT * FROM ADIS')
+        self.assertEqual([r[1:] for r in rows], [tuple([d['timestamp']] + [d[k] for k in keys]) for d in adis])
+        self.assertEqual(self.query('SELECT seqn, COUNT(*) FROM ADIS GROUP BY seqn')[0], (4820, 4))
+        self.assertEqual(self.query('SELECT COUNT(*) FROM RNHP'), [(2,)])
+        indexes = [r[0] for r in self.query("SELECT name FROM sqlite_master WHERE type = 'index'")]
+        self.assertTrue('ADIS_seqn' in indexes and 'ADIS_timestamp' in indexes)
+
+    def test_fixlength(self):
+        self.assertEqual(export.to_sqlite(MPL3_LOG, self.db), 9)
+        self.assertEqual(self.query('SELECT seqn, Pressure FROM MPL3'), [(100, 101.325), (101, 102.325), (102, 103.325)])
+        self.assertEqual(self.query('SELECT seqn FROM ADIS'), [(100,), (101,), (102,)])
+
+    def test_raw_and_unknown(self):
+        log = record(SEQN, 0, {'Sequence': 7}) + record(ADIS, 5, {'Gyro_X': -1.5}) + b'ABCD\x00\x00\x00\x00\x00\x06\x00\x02\x0a\xff'
+        export.to_sqlite(_io.BytesIO(log), self.db, units=False)
+        self.assertEqual(self.query('SELECT seqn, timestamp, Gyro_X, Temp FROM ADIS'), [(7, 5, -30, 0)])
+        (seqn, timestamp, fourcc, body), = self.query('SELECT * FROM _unknown')
+        self.assertEqual((seqn, timestamp, fourcc), (7, 6, 'ABCD'))
+        # a blob, which Python 2 reads back as a buffer
+        self.assertEqual(bytes(body), b'\x0a\xff')
+        self.assertEqual(self.query('SELECT typeof(body) FROM _unknown'), [('blob',)])
+
+    def test_variable(self):
+        messages.MESSAGES.define({'name': "Diagnostic", 'fourcc': b'DIAG', 'size': "Variable", 'endianness': '!',
+                                  'members': [{'key': "Text", 'stype': "s", 'count': "B"},
+                                              {'key': "SNR", 'stype': "h", 'count': "B", 'units': {'scaleby': 0.5}}]})
+        try:
+            DIAG = messages.MESSAGES['DIAG']
+            body = DIAG.encode({'Text': b'hi', 'SNR': [1.5, -2.0]})
+            export.to_sqlite(_io.BytesIO(messages.HEADER.encode(DIAG, 1, len(body)) + body), self.db)
+            self.assertEqual(self.query('SELECT Text, SNR FROM DIAG'), [(b'hi', '[1.5, -2.0]')])
+        finally:
+            messages.MESSAGES.remove('DIAG')
+
+    def test_append(self):
+        path = os.path.join(self.tmp, 'live.log')
+        datagrams = [record(SEQN, 0, {'Sequence': i}) + record(ADIS, i, {}) + record(ADIS, i, {}) for i in range(10)]
+        with open(path, 'wb') as f:
+            f.write(b''.join(datagrams[:4]) + datagrams[4][:30])
+        self.assertEqual(export.to_sqlite(path, self.db), 13)
+
+        # the log grows, only the new records go in
+        with open(path, 'ab') as f:
+            f.write(datagrams[4][30:] + b''.join(datagrams[5:]))
+        self.assertEqual(export.to_sqlite(path, self.db), 17)
+        self.assertEqual(export.to_sqlite(path, self.db), 0)
+        self.assertEqual(self.query('SELECT seqn, timestamp FROM ADIS ORDER BY rowid')[::2], [(i, i) for i in range(10)])
+        self.assertEqual(self.query('SELECT COUNT(*) FROM SEQN'), [(10,)])
+
+    def test_segments(self):
+        from psas_packet import segment
+        base = os.path.join(self.tmp, 'flight')
+        writer = segment.SegmentWriter(base, max_bytes=100)
+        for i in range(3):
+            writer.write(record(SEQN, 0, {'Sequence': i}) + record(ADIS, i, {}))
+            writer.flush()
+        self.assertEqual(export.to_sqlite(base + '.manifest', self.db), 6)
+        for i in range(3, 6):
+            writer.write(record(SEQN, 0, {'Sequence': i}) + record(ADIS, i, {}))
+            writer.flush()
+        writer.close()
+        self.assertEqual(export.to_sqlite(base + '.manifest', self.db), 6)
+        self.assertEqual(self.query('SELECT seqn FROM ADIS ORDER BY rowid'), [(i,) for i in range(6)])
+        self.assertEqual(len(self.query('SELECT * FROM _loaded')), len(writer.segments))
+
+
+class TestCSV(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def lines(self, name):
+        path = os.path.join(self.tmp, name)
+        with (gzip.open(path, 'rt') if name.endswith('.gz') else open(path)) as f:
+            return f.read().splitlines()
+
+    def test_same_as_decode(self):
+        self.assertEqual(export.to_csv(LOG, self.tmp), 171)
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['ADIS.csv', 'RNHH.csv', 'RNHP.csv', 'SEQN.csv'])
+        keys = [m['key'] for m in ADIS.member_list]
+        lines = self.lines('ADIS.csv')
+        self.assertEqual(lines[0], "# [0]SEQN, [1]Timestamp, " + ", ".join(
+            "[{0}]{1}".format(i + 2, k) for i, k in enumerate(keys)))
+        rows = [r for r in pipeline.from_log(LOG).select(['ADIS'])]
+        self.assertEqual(lines[1:], [','.join(str(v) for v in [r.seqn, r.timestamp] + [r.data[k] for k in keys])
+                                     for r in rows])
+
+    def test_columns_and_gzip(self):
+        seen = []
+        export.to_csv(LOG, self.tmp, fourccs=['ADIS', 'SEQN'], columns={'ADIS': ['VCC', 'Gyro_X']},
+                      compress=True, progress=seen.append)
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['ADIS.csv.gz', 'SEQN.csv.gz'])
+        lines = self.lines('ADIS.csv.gz')
+        self.assertEqual(lines[0], "# [0]SEQN, [1]Timestamp, [2]VCC, [3]Gyro_X")
+        first = next(iter(pipeline.from_log(LOG).select(['ADIS'])))
+        self.assertEqual(lines[1], '{0},{1},{2},{3}'.format(first.seqn, first.timestamp, first.data['VCC'], first.data['Gyro_X']))
+        self.assertEqual(len(lines), 163)
+        self.assertEqual(len(seen), 6)
+
+    def test_fixlength(self):
+        self.assertEqual(export.to_csv(MPL3_LOG, self.tmp), 9)
+        self.assertEqual(self.lines('MPL3.csv')[1:], ['100,1000001000,101.325,20.5',
+                                                      '101,1100001000,102.325,21.5',
+                                                      '102,1200001000,103.325,22.5'])
+
+    def test_bad_column(self):
+        self.assertRaises(ValueError, export.CSVWriter, self.tmp, columns={'ADIS': ['Nope']})
+
+    def test_awkward_values(self):
+        log = (record(SEQN, 0, {'Sequence': 3}) +
+               record(VSTE, 1, {'Altitude': float('nan'), 'Vel_up': -0.0}) +
+               b'ABCD\x00\x00\x00\x00\x00\x03\x00\x01\x0a')
+        with export.CSVWriter(self.tmp) as out:
+            pipeline.from_log(_io.BytesIO(log)).to(out)
+        row = self.lines('VSTE.csv')[1].split(',')
+        self.assertEqual(row[:2], ['3', '1'])
+        self.assertTrue('nan' in row and '-0.0' not in row)
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['SEQN.csv', 'VSTE.csv'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_index
+----------------------------------
+
+Tests for `index` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from psas_packet import index, io, messages, query
+
+ADIS = messages.MESSAGES['ADIS']
+FCFH = messages.MESSAGES['FCFH']
+MPL3 = messages.MESSAGES['MPL3']
+
+
+def record(msg, t, data):
+    return messages.HEADER.encode(msg, t) + msg.encode(data)
+
+
+class TestLogIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmp, 'log')
+        # Core_Temp goes over 70 only around record 300
+        self.records = []
+        for i in range(400):
+            self.records.append(record(ADIS, i * 1000, {'Gyro_X': i % 7}))
+            if i % 10 == 0:
+                temp = 75 if 300 <= i < 320 else 40
+                self.records.append(record(FCFH, i * 1000, {'Core_Temp': temp}))
+        with open(self.log, 'wb') as f:
+            f.write(b''.join(self.records))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def check(self, idx, where):
+        f = query.Filter(where)
+        with io.BinFile(self.log) as log:
+            got = list(log.filter(f, index=idx))
+        with io.BinFile(self.log) as log:
+            expect = list(log.filter(where))
+        self.assertEqual(got, expect)
+        return f
+
+    def test_blocks(self):
+        idx = index.log_index(self.log, block_size=1000, cache=False)
+        self.assertEqual(idx.blocks[0][0], 0)
+        for a, b in zip(idx.blocks, idx.blocks[1:]):
+            self.assertEqual(a[0] + a[1], b[0])
+            self.assertGreaterEqual(a[1], 1000)
+        last = idx.blocks[-1]
+        self.assertEqual(last[0] + last[1], os.path.getsize(self.log))
+
+    def test_skips_blocks(self):
+        idx = index.log_index(self.log, block_size=1000, cache=False)
+        f = self.check(idx, {'FCFH': [('Core_Temp', '>', 70)]})
+        self.assertEqual(f.matched, 2)
+        self.assertLess(f.scanned, len(self.records) // 4)
+
+        self.check(idx, {'FCFH': [('Core_Temp', '==', 40)]})
+        self.check(idx, {'ADIS': [('Gyro_X', '>=', 6), ('timestamp', '<', 50000)]})
+        f = self.check(idx, {'ADIS': [('Gyro_X', '>', 6)]})
+        self.assertEqual(f.scanned, 0)
+        self.assertEqual(idx.select({'SEQN': []}), [])
+
+    def test_fixlength(self):
+        # MPL3 headers say length 0, the body follows anyway
+        with open(self.log, 'wb') as f:
+            for i in range(100):
+                f.write(record(ADIS, i * 1000, {'Gyro_X': i % 7}))
+                f.write(messages.HEADER.struct.pack(b'MPL3', 0, i * 1000, 0) + MPL3.encode({'Pressure': i}))
+        idx = index.log_index(self.log, block_size=1000, cache=False)
+        last = idx.blocks[-1]
+        self.assertEqual(last[0] + last[1], os.path.getsize(self.log))
+        self.assertTrue(all(b[4] == 3 for b in idx.blocks))
+        f = self.check(idx, {'MPL3': [('Pressure', '>=', 90)]})
+        self.assertEqual(f.matched, 10)
+        self.assertLess(f.scanned, 100)
+        self.check(idx, {'ADIS': [('Gyro_X', '==', 6)]})
+
+    def test_incremental(self):
+        expect = index.log_index(self.log, block_size=1000, cache=False)
+
+        # partial trailing record is left for the next update
+        with open(self.log, 'wb') as f:
+            f.write(b''.join(self.records[:200]) + self.records[200][:7])
+        first = index.log_index(self.log, block_size=1000)
+        self.assertEqual(first.offset, len(b''.join(self.records[:200])))
+
+        with open(self.log, 'ab') as f:
+            f.write(self.records[200][7:] + b''.join(self.records[201:]))
+        idx = index.log_index(self.log, block_size=1000)
+        self.assertTrue(os.path.exists(self.log + '.index'))
+        self.assertEqual(idx.blocks, expect.blocks)
+        self.check(idx, {'FCFH': [('Core_Temp', '>', 70)]})
+
+    def test_save_load(self):
+        idx = index.log_index(self.log, block_size=1000, cache=False)
+        path = os.path.join(self.tmp, 'saved')
+        idx.save(path)
+        loaded = index.LogIndex.load(path)
+        self.assertEqual(loaded.fourccs, ['ADIS', 'FCFH'])
+        self.assertEqual(loaded.blocks, idx.blocks)
+        self.check(loaded, {'FCFH': [('Core_Temp', '>', 70)]})
+
+        # damaged or foreign sidecars are rebuilt, never trusted
+        for junk in (b'{"version": 1', b'\x80\x02}q\x00.', b'[]', b''):
+            with open(path, 'wb') as f:
+                f.write(junk)
+            self.assertIsNone(index.LogIndex.load(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,7 +11,8 @@ Tests for `io` module.
 from __future__ import print_function
 import unittest
 import json
-from psas_packet import io
+import socket
+from psas_packet import io, messages, stats
 
 
 class TestIO(unittest.TestCase):
@@ -42,5 +43,69 @@ class TestIO(unittest.TestCase):
                 self.assertEqual(self.simple_log_data[i], {fourcc: data})
 
 
+class TestNetwork(unittest.TestCase):
+
+    def setUp(self):
+        self.rx, self.tx = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    def tearDown(self):
+        self.rx.close()
+        self.tx.close()
+
+    def test_listen_stats(self):
+        ADIS = messages.MESSAGES['ADIS']
+        SEQN = messages.MESSAGES['SEQN']
+        body = ADIS.encode({'VCC': 5.0})
+        datagram = SEQN.encode({'Sequence': 7}) + (messages.HEADER.encode(ADIS, 1) + body) * 2
+        self.tx.send(datagram)
+
+        net = io.Network(self.rx, stats=stats.Stats())
+        received = list(net.listen())
+
+        self.assertEqual(len(received), 3)
+        self.assertEqual(received[0][1], ('SEQN', {'Sequence': 7}))
+        snap = net.stats()
+        self.assertEqual(snap['datagrams'], 1)
+        self.assertEqual(snap['bytes'], len(datagram))
+        self.assertEqual(snap['messages'], {'ADIS': 2})
+        self.assertEqual(snap['out_of_sync'], 0)
+        self.assertEqual(snap['decode_latency_us']['count'], 2)
+
+    def test_no_stats(self):
+        self.assertEqual(io.Network(self.rx).stats(), None)
+
+    def test_batch_sender(self):
+        ADIS = messages.MESSAGES['ADIS']
+        framed = messages.HEADER.size + ADIS.size
+        mtu = io.BatchSender.OVERHEAD + 4 + 3 * framed
+
+        sender = io.BatchSender(self.tx, mtu=mtu, max_delay=60, seqn=5)
+        for i in range(7):
+            sender.add(ADIS, {'VCC': 5.0}, timestamp=i)
+        self.assertEqual(sender.datagrams, 2)
+        sender.flush()
+        self.assertEqual(sender.stats()['messages_per_datagram'], 7 / 3.0)
+
+        net = io.Network(self.rx)
+        for seqn, count in ((5, 3), (6, 3), (7, 1)):
+            received = list(net.listen())
+            self.assertEqual(received[0][1], ('SEQN', {'Sequence': seqn}))
+            self.assertEqual(len(received), count + 1)
+            self.assertEqual(received[1][1][0], 'ADIS')
+
+    def test_batch_deadline(self):
+        ADIS = messages.MESSAGES['ADIS']
+        sender = io.BatchSender(self.tx, max_delay=0)
+        sender.add(ADIS, {})
+        self.assertEqual(sender.datagrams, 1)
+        self.assertEqual(sender.timeout(), None)
+
+        sender = io.BatchSender(self.tx, max_delay=60)
+        sender.add(ADIS, {})
+        sender.poll()
+        self.assertEqual(sender.datagrams, 0)
+        self.assertTrue(sender.timeout() > 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_latency
+----------------------------------
+
+Tests for `latency` module.
+"""
+
+import socket
+import time
+import unittest
+from psas_packet import io, latency, messages
+
+ADIS = messages.MESSAGES['ADIS']
+SEQN = messages.MESSAGES['SEQN']
+
+
+class TestLatencyTracer(unittest.TestCase):
+
+    def test_offset_estimate(self):
+        tracer = latency.LatencyTracer(window=10)
+        # producer clock starts at boot, ground clock is 1000 s ahead, and
+        # the link takes 2 to 7 ms
+        for i, delay in enumerate([0.005, 0.002, 0.007, 0.002, 0.003]):
+            produced = i * 0.1
+            tracer.arrived(36000, 'ADIS', int(produced * 1e9), 1000 + produced + delay)
+        self.assertAlmostEqual(tracer.clock_offset(36000), 1000.002, places=6)
+        self.assertEqual(tracer.clock_offset(1), None)
+        h = tracer.histograms[(36000, 'ADIS')]['transit']
+        self.assertEqual(h.count, 5)
+        self.assertAlmostEqual(h.max, 5000, delta=100)
+        self.assertEqual(h.min, 0)
+
+    def test_drift(self):
+        tracer = latency.LatencyTracer(window=1)
+        for i in range(50):
+            # producer clock runs 1% slow
+            produced = i * 0.1
+            tracer.arrived(0, 'ADIS', int(produced * 1e9), produced * 1.01 + 0.001)
+        # only the last two windows count
+        self.assertAlmostEqual(tracer.clock_offset(0), 3.0 * 0.01 + 0.001, places=3)
+
+    def test_fixed_offset(self):
+        tracer = latency.LatencyTracer(offset=1000.0)
+        tracer.arrived(0, 'ADIS', int(5e9), 1005.25)
+        self.assertAlmostEqual(tracer.histograms[(0, 'ADIS')]['transit'].max, 250000, delta=250000 / 16.0)
+        self.assertEqual(tracer.clock_offset(0), 1000.0)
+
+    def test_trace(self):
+        tracer = latency.LatencyTracer()
+        now = time.time()
+        source = [(now, ('SEQN', {'Sequence': 1})), (now, ('ADIS', {'timestamp': 10, 'VCC': 5.0}))]
+        got = []
+        for item in tracer.trace(source, port=5):
+            got.append(item)
+            time.sleep(0.01)
+        self.assertEqual(got, source)
+        stages = tracer.histograms[(5, 'ADIS')]
+        self.assertEqual(stages['transit'].count, 1)
+        self.assertGreaterEqual(stages['consume'].min, 10000)
+        self.assertEqual(stages['decode'].count, 0)
+        summary = tracer.summary()
+        self.assertEqual(sorted(summary['latency']['5/ADIS']), ['consume_us', 'transit_us'])
+        self.assertIn('5/ADIS', tracer.report())
+
+    def test_network(self):
+        rx, tx = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            tracer = latency.LatencyTracer()
+            net = io.Network(rx, tracer=tracer)
+            for i in range(3):
+                tx.send(SEQN.encode({'Sequence': i}) + messages.HEADER.encode(ADIS, i * 1000000) + ADIS.encode({}))
+                for item in net.listen():
+                    pass
+        finally:
+            rx.close()
+            tx.close()
+        stages = tracer.histograms[(0, 'ADIS')]
+        self.assertEqual([stages[s].count for s in latency.STAGES], [3, 3, 3])
+        self.assertEqual(stages['transit'].min, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
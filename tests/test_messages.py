@@ -237,6 +237,232 @@ typedef struct {
         data = SEQN.decode(b'\x01\xf6\xc4\xb8')
         self.assertEqual(data, {'Sequence': 32949432})
 
+    def test_raw_counts(self):
+        ADIS = messages.MESSAGES['ADIS']
+        body = ADIS.encode({'VCC': 5.0, 'Gyro_X': -1.5, 'Temp': 25.0})
+        raw = ADIS.decode(body, units=False)
+        self.assertEqual(raw['Gyro_X'], -30)
+        self.assertEqual(raw['Temp'], 0)
+        self.assertTrue(all(type(v) is int for v in raw.values()))
+
+        data = ADIS.decode(body)
+        for key in ADIS.member_dict:
+            self.assertAlmostEqual(ADIS.to_units(key, raw[key]), data[key])
+        self.assertEqual(ADIS.to_units('Temp', [0, 10]), [25, 26.4])
+
+        n, (fourcc, framed) = messages.decode(messages.HEADER.encode(ADIS, 7) + body, units=False)
+        self.assertEqual(framed, dict(raw, timestamp=7))
+
+    def test_to_units_column(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest("needs NumPy")
+        ADIS = messages.MESSAGES['ADIS']
+        counts = numpy.array([-2, 0, 10], dtype=numpy.int16)
+        temp = ADIS.to_units('Temp', counts)
+        self.assertEqual(temp.dtype, numpy.float64)
+        self.assertEqual(temp.tolist(), [(c * 0.14) + 25 for c in (-2, 0, 10)])
+        # unscaled members are left alone
+        SEQN = messages.MESSAGES['SEQN']
+        self.assertTrue(SEQN.to_units('Sequence', counts) is counts)
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = messages.Registry(messages._list)
+
+    def test_lazy_build(self):
+        self.assertTrue('ADIS' in self.registry)
+        self.assertEqual(self.registry._messages, {})
+        adis = self.registry['ADIS']
+        self.assertEqual(adis.size, ADIS.size)
+        self.assertTrue(self.registry['ADIS'] is adis)
+        self.assertEqual(list(self.registry._messages), ['ADIS'])
+
+    def test_get_missing(self):
+        self.assertEqual(self.registry.get('NOPE'), None)
+        self.assertRaises(KeyError, lambda: self.registry['NOPE'])
+
+    def test_size_without_build(self):
+        self.assertEqual(self.registry.size('MPL3'), 6)
+        self.assertEqual(self.registry._messages, {})
+
+    def test_cache(self):
+        import os
+        import tempfile
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            self.registry.save_cache(path)
+            fresh = messages.Registry(messages._list)
+            self.assertTrue(fresh.load_cache(path))
+            self.assertEqual(fresh._layouts['GPS99']['size'], fresh['GPS99'].size)
+
+            other = messages.Registry(messages._list[:2])
+            self.assertFalse(other.load_cache(path))
+
+            # a damaged cache is ignored
+            with open(path, 'w') as f:
+                f.write('{"hash": ')
+            self.assertFalse(fresh.load_cache(path))
+        finally:
+            os.remove(path)
+
+
+class TestSchema(unittest.TestCase):
+
+    def test_load_json(self):
+        registry = messages.Registry(messages._list)
+        loaded = registry.load('tests/data/extra_schema.json')
+        self.assertEqual(sorted(loaded), ['GPS200', 'TSNS'])
+        self.assertTrue('ADIS' in registry)
+
+        tsns = registry['TSNS']
+        self.assertEqual(tsns.fourcc, b'TSNS')
+        self.assertEqual(tsns.size, 4)
+        self.assertEqual(registry['GPS200'].fourcc, b'GPS\xc8')
+        data = tsns.decode(tsns.encode({'Count': 3, 'Volts': 1.5}))
+        self.assertEqual(data['Count'], 3)
+        self.assertAlmostEqual(data['Volts'], 1.5)
+
+    def test_load_toml(self):
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import toml
+            except ImportError:
+                self.skipTest("no TOML parser")
+        registry = messages.Registry()
+        self.assertEqual(registry.load('tests/data/extra_schema.toml'), ['TSNS'])
+        self.assertEqual(registry['TSNS'].member_list[1]['units']['scaleby'], 0.01)
+
+    def test_compiled_cache(self):
+        import json
+        import os
+        import shutil
+        import tempfile
+        cache = tempfile.mkdtemp()
+        try:
+            first = messages.Registry().load('tests/data/extra_schema.json', cache)
+            # the cache is plain JSON, nothing in it runs on load
+            name, = os.listdir(cache)
+            with open(os.path.join(cache, name)) as f:
+                self.assertEqual(sorted(json.load(f)['layouts']), ['GPS200', 'TSNS'])
+            registry = messages.Registry()
+            self.assertEqual(registry.load('tests/data/extra_schema.json', cache), first)
+            self.assertEqual(registry.size('TSNS'), 4)
+            self.assertEqual(registry['TSNS'].size, 4)
+            self.assertEqual(registry['GPS200'].fourcc, b'GPS\xc8')
+        finally:
+            shutil.rmtree(cache)
+
+    def test_bad_environment_schema(self):
+        import os
+        import subprocess
+        import sys
+        import tempfile
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.write(fd, b'{"messages": [{"name": "Broken"}]}')
+        os.close(fd)
+        try:
+            env = dict(os.environ, PSAS_PACKET_SCHEMA=path)
+            proc = subprocess.Popen([sys.executable, '-c', 'from psas_packet import messages; print(len(messages.MESSAGES))'],
+                                    env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            out, err = proc.communicate()
+        finally:
+            os.remove(path)
+        self.assertEqual(proc.returncode, 0)
+        self.assertEqual(int(out), len(messages._list))
+        self.assertTrue(b'skipping' in err and b'missing' in err)
+
+    def test_bad_definition(self):
+        bad = {'name': "Bad", 'fourcc': "BAD", 'size': "Fixed", 'endianness': '!', 'members': []}
+        self.assertRaises(messages.SchemaError, messages.validate, bad)
+        bad['fourcc'] = "BADD"
+        bad['members'] = [{'key': "x", 'stype': "Z"}]
+        self.assertRaises(messages.SchemaError, messages.validate, bad)
+
+
+DIAG = messages.Message({
+    'name': "Diagnostic",
+    'fourcc': b'DIAG',
+    'size': "Variable",
+    'endianness': '!',
+    'members': [
+        {'key': "Level",    'stype': "B"},
+        {'key': "Text",     'stype': "s", 'count': "H"},
+        {'key': "PRN",      'stype': "H", 'count': "B"},
+        {'key': "Channels", 'count': "B", 'members': [
+            {'key': "SV",   'stype': "B"},
+            {'key': "SNR",  'stype': "h", 'units': {'mks': "dB", 'scaleby': 0.5}},
+        ]},
+        {'key': "Flags",    'stype': "H"},
+    ]
+})
+
+
+class TestVariable(unittest.TestCase):
+
+    def test_back_and_forth(self):
+        data = {
+            'Level': 2,
+            'Text': b'hello',
+            'PRN': [3, 17, 22],
+            'Channels': [{'SV': 3, 'SNR': 21.5}, {'SV': 17, 'SNR': -4.0}],
+            'Flags': 0x8001,
+        }
+        raw = DIAG.encode(data)
+        self.assertEqual(len(raw), 1 + 2 + 5 + 1 + 6 + 1 + 6 + 2)
+        self.assertEqual(DIAG.decode(raw), data)
+
+    def test_raw_counts(self):
+        raw = DIAG.encode({'Level': 2, 'PRN': [3], 'Channels': [{'SV': 3, 'SNR': 21.5}]})
+        counts = DIAG.decode(raw, units=False)
+        self.assertEqual(counts['Channels'], [{'SV': 3, 'SNR': 43}])
+        self.assertEqual(DIAG.decode(raw)['Channels'], [{'SV': 3, 'SNR': 21.5}])
+
+    def test_empty_parts(self):
+        raw = DIAG.encode({'Level': 1})
+        self.assertEqual(raw, b'\x01\x00\x00\x00\x00\x00\x00')
+        self.assertEqual(DIAG.decode(raw), {'Level': 1, 'Text': b'', 'PRN': [], 'Channels': [], 'Flags': 0})
+
+    def test_size_errors(self):
+        raw = DIAG.encode({'Level': 1, 'Text': b'abc'})
+        self.assertRaises(messages.MessageSizeError, DIAG.decode, raw[:-1])
+        self.assertRaises(messages.MessageSizeError, DIAG.decode, raw[:4])
+        self.assertRaises(messages.MessageSizeError, DIAG.decode, raw + b'\x00')
+
+    def test_framed_decode(self):
+        body = DIAG.encode({'Level': 1, 'Text': b'hi'})
+        raw = messages.HEADER.encode(DIAG, 5, len(body)) + body
+        messages.MESSAGES.define({'name': "Diagnostic", 'fourcc': b'DIAG', 'size': "Variable",
+                                  'endianness': '!', 'members': DIAG.member_list})
+        try:
+            bytes_read, (fourcc, data) = messages.decode(raw + b'trailing')
+        finally:
+            messages.MESSAGES.remove('DIAG')
+        self.assertEqual(bytes_read, len(raw))
+        self.assertEqual(data['Text'], b'hi')
+        self.assertEqual(data['timestamp'], 5)
+
+    def test_typedef(self):
+        code = DIAG.typedef()
+        self.assertIn("\tuint16_t text_count;\n\t/* char text[text_count]; */\n", code)
+        self.assertIn("/* uint16_t prn[prn_count]; */", code)
+        self.assertIn("/* struct { uint8_t sv; int16_t snr; } channels[channels_count]; */", code)
+
+    def test_validate(self):
+        bad = {'name': "Bad", 'fourcc': b'BADD', 'size': "Fixed", 'endianness': '!',
+               'members': [{'key': "Text", 'stype': "s", 'count': "H"}]}
+        self.assertRaises(messages.SchemaError, messages.validate, bad)
+        bad['size'] = "Variable"
+        messages.validate(bad)
+        bad['members'][0]['count'] = "f"
+        self.assertRaises(messages.SchemaError, messages.validate, bad)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_overlay
+----------------------------------
+
+Tests for `overlay` module.
+"""
+
+import ctypes
+import unittest
+from psas_packet import messages, overlay
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ADIS = messages.MESSAGES['ADIS']
+VSTE = messages.MESSAGES['VSTE']
+
+
+def raw_values(message, body):
+    return dict((m['key'], v) for m, v in zip(message.member_list, message.struct.unpack(body)))
+
+
+class TestCtypes(unittest.TestCase):
+
+    def test_sizes_match_struct(self):
+        for name in messages.MESSAGES.keys():
+            message = messages.MESSAGES[name]
+            if message.variable:
+                continue
+            self.assertEqual(ctypes.sizeof(message.ctype()), message.size, name)
+            self.assertEqual(ctypes.sizeof(overlay.record_ctype(message)), messages.HEADER.size + message.size)
+        self.assertEqual(ctypes.sizeof(overlay.Header), messages.HEADER.size)
+
+    def test_read_in_place(self):
+        for message, data in [(ADIS, {'VCC': 5.0, 'Gyro_X': -1.5, 'Aux_ADC': 806 * 3}),
+                              (VSTE, {'Altitude': 1234.5, 'Time': 2.0})]:
+            body = message.encode(data)
+            buff = bytearray(messages.HEADER.encode(message, (7 << 32) + 99) + body)
+            rec = overlay.view(overlay.record_ctype(message), buff)
+            self.assertEqual(rec.header.ID, message.fourcc)
+            self.assertEqual(rec.header.timestamp, (7 << 32) + 99)
+            self.assertEqual(rec.header.data_length, message.size)
+            for key, value in raw_values(message, body).items():
+                self.assertEqual(getattr(rec.data, key), value)
+
+            # writes go straight to the buffer
+            first = message.member_list[0]['key']
+            setattr(rec.data, first, 0)
+            self.assertEqual(raw_values(message, bytes(buff[messages.HEADER.size:]))[first], 0)
+
+    def test_readonly_copies(self):
+        body = ADIS.encode({'Gyro_Y': 2.0})
+        data = overlay.view(ADIS.ctype(), body)
+        self.assertEqual(data.Gyro_Y, 40)
+
+    def test_variable(self):
+        diag = messages.Message({'name': "Diag", 'fourcc': b'DIAG', 'size': "Variable", 'endianness': '!',
+                                 'members': [{'key': "Text", 'stype': "s", 'count': "H"}]})
+        self.assertRaises(messages.SchemaError, overlay.ctype, diag)
+
+
+@unittest.skipIf(numpy is None, "needs NumPy")
+class TestDtype(unittest.TestCase):
+
+    def test_sizes_match_struct(self):
+        for name in messages.MESSAGES.keys():
+            message = messages.MESSAGES[name]
+            if not message.variable:
+                self.assertEqual(message.dtype().itemsize, message.size, name)
+        self.assertEqual(overlay.header_dtype().itemsize, messages.HEADER.size)
+
+    def test_frombuffer(self):
+        buff = b''
+        for i in range(5):
+            buff += messages.HEADER.encode(VSTE, (1 << 32) * i + i) + VSTE.encode({'Altitude': i * 10.0})
+        recs = overlay.frombuffer(buff, VSTE)
+        self.assertEqual(len(recs), 5)
+        self.assertEqual(recs['data']['Altitude'].tolist(), [0.0, 10.0, 20.0, 30.0, 40.0])
+        self.assertEqual(overlay.timestamps(recs['header']).tolist(), [(1 << 32) * i + i for i in range(5)])
+        self.assertFalse(recs.flags.owndata)
+
+        bodies = b''.join(ADIS.encode({'Gyro_Z': -i * 0.05}) for i in range(3))
+        arr = overlay.frombuffer(bodies, ADIS, records=False)
+        self.assertEqual(arr['Gyro_Z'].tolist(), [0, -1, -2])
+
+
+if __name__ == '__main__':
+    unittest.main()
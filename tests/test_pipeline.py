@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_pipeline
+----------------------------------
+
+Tests for `pipeline` module.
+"""
+
+import io as _io
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+from psas_packet import io, messages, pipeline
+
+ADIS = messages.MESSAGES['ADIS']
+GPS1 = messages.MESSAGES['GPS1']
+SEQN = messages.MESSAGES['SEQN']
+LOG = "tests/data/simple_logfile"
+
+
+def record(msg, t, data):
+    return messages.HEADER.encode(msg, t) + msg.encode(data)
+
+
+class ListSink(object):
+
+    def __init__(self):
+        self.items = []
+        self.closed = False
+
+    def write(self, item):
+        self.items.append(item)
+
+    def close(self):
+        self.closed = True
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_same_as_read(self):
+        with io.BinFile(LOG) as log:
+            expect = list(log.read())
+        self.assertEqual([r.message for r in pipeline.from_log(LOG)], expect)
+
+    def test_select_does_not_decode(self):
+        records = list(pipeline.from_log(LOG).select(['ADIS']))
+        self.assertTrue(records)
+        self.assertTrue(all(r.name == 'ADIS' for r in records))
+        self.assertTrue(all(r._data is None for r in records))
+
+    def test_fused(self):
+        seen = ListSink()
+        p = (pipeline.from_log(LOG)
+             .select(['ADIS', 'SEQN'])
+             .where(lambda r: r.name == 'ADIS')
+             .tee(seen)
+             .map(lambda r: r.data['VCC']))
+        vccs = list(p)
+        with io.BinFile(LOG) as log:
+            self.assertEqual(vccs, [d['VCC'] for f, d in log.read() if f == 'ADIS'])
+        self.assertEqual(len(seen.items), len(vccs))
+        # the pipeline can run again, and building on it leaves it alone
+        self.assertEqual(list(p), vccs)
+        self.assertEqual(len(list(p.batch(5))), (len(vccs) + 4) // 5)
+
+    def test_seqns_and_batch(self):
+        path = os.path.join(self.tmp, 'log')
+        with open(path, 'wb') as f:
+            for i in range(10):
+                f.write(record(SEQN, 0, {'Sequence': i}))
+                f.write(record(ADIS, i * 10 ** 8, {}))
+        got = list(pipeline.from_log(path).seqns(3, 5).select(['ADIS']))
+        self.assertEqual([r.seqn for r in got], [3, 4, 5])
+        batches = list(pipeline.from_log(path).select(['ADIS']).batch(4))
+        self.assertEqual([len(b) for b in batches], [4, 4, 2])
+        # 0.1 s apart, in 0.25 s windows
+        windows = list(pipeline.from_log(path).select(['ADIS']).window(0.25))
+        self.assertEqual([[r.seqn for r in w] for w in windows], [[0, 1, 2], [3, 4], [5, 6, 7], [8, 9]])
+
+    def test_log_sink(self):
+        out = os.path.join(self.tmp, 'adis')
+        n = pipeline.from_log(LOG).select(['SEQN', 'ADIS']).to(pipeline.LogSink(out))
+        with io.BinFile(out) as log:
+            got = list(log.read())
+        with io.BinFile(LOG) as log:
+            expect = [m for m in log.read() if m[0] in ('SEQN', 'ADIS')]
+        self.assertEqual(got, expect)
+        self.assertEqual(n, len(expect))
+
+    def test_csv_sink(self):
+        pipeline.from_log(LOG).to(pipeline.CSVSink(self.tmp, fourccs=['ADIS']))
+        self.assertEqual(os.listdir(self.tmp), ['ADIS.csv'])
+        with open(os.path.join(self.tmp, 'ADIS.csv')) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines[0].startswith("# [0]SEQN, [1]Timestamp, [2]VCC, [3]Gyro_X"))
+        first = next(r for r in pipeline.from_log(LOG).select(['ADIS']))
+        self.assertEqual(lines[1].split(',')[:3], [str(first.seqn), str(first.data['timestamp']), str(first.data['VCC'])])
+
+    def test_progress(self):
+        out = _io.StringIO()
+        progress = pipeline.Progress(out, "{0}\n", interval=60)
+        pipeline.from_log(LOG).to(progress)
+        # the first SEQN is shown, the rest come too soon after it
+        self.assertEqual(out.getvalue(), "4820\n")
+        self.assertEqual(progress.last, 4825)
+
+    def test_columns(self):
+        sink = pipeline.Columns()
+        pipeline.from_log(LOG).select(['ADIS']).to(sink)
+        with io.BinFile(LOG) as log:
+            expect = [d['Gyro_X'] for f, d in log.read() if f == 'ADIS']
+        self.assertEqual(sink.columns['ADIS']['Gyro_X'], expect)
+
+    def test_raw_columns(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest("needs NumPy")
+        sink = pipeline.Columns(numpy=True, units=False)
+        pipeline.from_log(LOG).select(['ADIS']).to(sink)
+        gyro = sink.columns['ADIS']['Gyro_X']
+        self.assertEqual(gyro.dtype, numpy.int16)
+        with io.BinFile(LOG) as log:
+            expect = [d['Gyro_X'] for f, d in log.read() if f == 'ADIS']
+        self.assertEqual(ADIS.to_units('Gyro_X', gyro).tolist(), expect)
+
+    def test_network_source(self):
+        rx, tx = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            for i in range(3):
+                tx.send(SEQN.encode({'Sequence': i}) + record(ADIS, i, {}) + record(GPS1, i, {}))
+            net = io.Network(rx)
+            live = []
+            for i in range(3):
+                live.extend(pipeline.from_messages(net.listen()).select(['GPS1']))
+        finally:
+            rx.close()
+            tx.close()
+        self.assertEqual([(r.name, r.timestamp) for r in live], [('GPS1', 0), ('GPS1', 1), ('GPS1', 2)])
+        self.assertTrue(all(r.received is not None for r in live))
+        # decoded records encode back to what was sent
+        self.assertEqual([r.raw for r in live], [record(GPS1, i, {}) for i in range(3)])
+
+    def test_framed_network_source(self):
+        messages.MESSAGES.define({'name': "Diagnostic", 'fourcc': b'DIAG', 'size': "Variable", 'endianness': '!',
+                                  'members': [{'key': "Text", 'stype': "s", 'count': "B"}]})
+        rx, tx = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            diag = messages.MESSAGES['DIAG']
+            body = diag.encode({'Text': b'hello'})
+            frames = [messages.HEADER.encode(diag, 7, len(body)) + body,
+                      b'ABCD\x00\x00\x00\x00\x00\x08\x00\x02\x0a\xff',
+                      record(ADIS, 9, {})]
+            tx.send(SEQN.encode({'Sequence': 1}) + b''.join(frames))
+            net = io.Network(rx)
+            got = list(pipeline.from_messages(net.listen(framed=True)))
+            # decoded data alone rebuilds the same bytes
+            rebuilt = [r.raw for r in pipeline.from_messages((r.received, r.message) for r in got)]
+        finally:
+            messages.MESSAGES.remove('DIAG')
+            rx.close()
+            tx.close()
+        self.assertEqual([r.name for r in got], ['SEQN', 'DIAG', 'ABCD', 'ADIS'])
+        self.assertEqual([r.raw for r in got[1:]], frames)
+        self.assertEqual(got[0].raw[messages.HEADER.size:], SEQN.encode({'Sequence': 1}))
+        self.assertEqual(rebuilt[1:], frames)
+
+    def test_socket_sink(self):
+        rx, tx = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            pipeline.from_log(LOG).to(pipeline.SocketSink(tx))
+            net = io.Network(rx)
+            rx.settimeout(0.1)
+            got = []
+            try:
+                while True:
+                    got.extend(m for t, m in net.listen())
+            except socket.timeout:
+                pass
+        finally:
+            rx.close()
+            tx.close()
+        with io.BinFile(LOG) as log:
+            expect = [(f, d) for f, d in log.read()]
+        # SEQN records go back over the wire without their header time
+        strip = [(f, dict((k, v) for k, v in d.items() if not (f == 'SEQN' and k == 'timestamp'))) for f, d in expect]
+        self.assertEqual(got, strip)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_pyramid
+----------------------------------
+
+Tests for `pyramid` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from psas_packet import messages, pyramid
+
+ADIS = messages.MESSAGES['ADIS']
+SEQN = messages.MESSAGES['SEQN']
+
+
+def record(msg, t, data):
+    return messages.HEADER.encode(msg, t) + msg.encode(data)
+
+
+class TestPyramid(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmp, 'log')
+        # 1000 ADIS samples, 1 every 0.25 ms, with a spike at sample 500
+        self.records = []
+        for i in range(1000):
+            gyro = 100.0 if i == 500 else (i % 10) * 0.05
+            self.records.append(record(ADIS, i * 250000, {'Gyro_X': gyro}))
+            if i % 100 == 0:
+                self.records.append(record(SEQN, i * 250000, {'Sequence': i // 100}))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, records, mode='wb'):
+        with open(self.log, mode) as f:
+            f.write(b''.join(records))
+
+    def test_levels(self):
+        self.write(self.records)
+        p = pyramid.pyramid(self.log, base_ms=1.0, cache=False)
+        adis = p.types['ADIS']
+        f = adis.index['Gyro_X']
+        self.assertEqual(len(adis.levels[0].buckets), 250)
+        self.assertEqual(len(adis.levels[-1].buckets), 1)
+        for level in adis.levels:
+            self.assertEqual(sum(level.counts), 1000)
+            self.assertAlmostEqual(max(level.maxs[f]), 100.0)
+            self.assertAlmostEqual(min(level.mins[f]), 0.0)
+        self.assertEqual(p.types['SEQN'].levels[0].counts.tolist(), [1] * 10)
+
+    def test_fetch(self):
+        self.write(self.records)
+        p = pyramid.pyramid(self.log, base_ms=1.0, cache=False)
+        series = p.fetch('ADIS', 'Gyro_X', 0, 250, 30)
+        self.assertTrue(30 <= len(series['time']) <= 60)
+        self.assertEqual(sum(series['count']), 1000)
+        self.assertAlmostEqual(max(series['max']), 100.0)
+        self.assertAlmostEqual(min(series['min']), 0.0)
+
+        zoom = p.fetch('ADIS', 'Gyro_X', 100, 110, 1000)
+        self.assertEqual(zoom['time'], [float(t) for t in range(100, 111)])
+
+        self.assertEqual(p.fetch('ADIS', 'Nope', 0, 250, 10)['time'], [])
+
+    def test_incremental(self):
+        full = os.path.join(self.tmp, 'full')
+        with open(full, 'wb') as f:
+            f.write(b''.join(self.records))
+        expect = pyramid.pyramid(full, base_ms=1.0, cache=False)
+
+        # partial trailing record is left for the next update
+        half = b''.join(self.records[:600])
+        self.write([half, self.records[600][:5]])
+        first = pyramid.pyramid(self.log, base_ms=1.0)
+        self.assertEqual(first.offset, len(half))
+
+        self.write([self.records[600][5:]] + self.records[601:], 'ab')
+        p = pyramid.pyramid(self.log, base_ms=1.0)
+        self.assertTrue(os.path.exists(self.log + '.pyramid'))
+        for name, kind in expect.types.items():
+            got = p.types[name].levels
+            self.assertEqual(len(got), len(kind.levels))
+            for a, b in zip(got, kind.levels):
+                self.assertEqual(a.buckets, b.buckets)
+                self.assertEqual(a.counts, b.counts)
+                self.assertEqual(a.maxs, b.maxs)
+                self.assertEqual(a.mins, b.mins)
+
+    def test_save_load(self):
+        self.write(self.records)
+        p = pyramid.pyramid(self.log, base_ms=1.0, cache=False)
+        path = os.path.join(self.tmp, 'saved')
+        p.save(path)
+        q = pyramid.Pyramid.load(path)
+        self.assertEqual((q.base_ms, q.offset, q.signature), (p.base_ms, p.offset, p.signature))
+        self.assertEqual(q.fetch('ADIS', 'Gyro_X', 0, 250, 30), p.fetch('ADIS', 'Gyro_X', 0, 250, 30))
+        self.assertEqual(q.fetch('SEQN', 'Sequence', 0, 250, 5), p.fetch('SEQN', 'Sequence', 0, 250, 5))
+
+        # damaged or foreign sidecars are rebuilt, never trusted
+        with open(path, 'rb') as f:
+            saved = f.read()
+        for junk in (saved[:-1], saved[:20], b'\x80\x02}q\x00.', b''):
+            with open(path, 'wb') as f:
+                f.write(junk)
+            self.assertIsNone(pyramid.Pyramid.load(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_query
+----------------------------------
+
+Tests for `query` module.
+"""
+
+import io as pyio
+import unittest
+from psas_packet import io, messages, query
+
+LOG = "tests/data/simple_logfile"
+
+
+def decoded(fourcc):
+    with io.BinFile(LOG) as log:
+        return [(f, d) for f, d in log.read() if f == fourcc]
+
+
+class TestFilter(unittest.TestCase):
+
+    def test_matches_decode_then_filter(self):
+        adis = decoded('ADIS')
+        for key, op, value in [('Gyro_X', '>', 0.1), ('Acc_X', '<=', 9.7), ('Aux_ADC', '==', 0), ('Temp', '!=', 18.42)]:
+            expect = [r for r in adis if query.OPS[op](r[1][key], value)]
+            f = query.Filter({'ADIS': [(key, op, value)]})
+            with io.BinFile(LOG) as log:
+                got = list(log.filter(f))
+            self.assertEqual(got, expect)
+            self.assertEqual(f.scanned, 171)
+            self.assertEqual(f.decoded, len(expect))
+            self.assertEqual(f.matched, len(expect))
+
+    def test_and_timestamp(self):
+        adis = decoded('ADIS')
+        t = adis[50][1]['timestamp']
+        expect = [r for r in adis if r[1]['timestamp'] >= t and r[1]['Gyro_Z'] < 0]
+        with io.BinFile(LOG) as log:
+            got = list(log.filter({'ADIS': [('timestamp', '>=', t), ('Gyro_Z', '<', 0)]}))
+        self.assertEqual(got, expect)
+
+    def test_whole_types(self):
+        f = query.Filter({'SEQN': [], 'RNHP': []})
+        with io.BinFile(LOG) as log:
+            got = list(log.filter(f))
+        with io.BinFile(LOG) as log:
+            expect = [r for r in log.read() if r[0] in ('SEQN', 'RNHP')]
+        self.assertEqual(got, expect)
+        self.assertEqual(len(got), 8)
+        self.assertEqual(f.decoded, 8)
+
+    def test_fixlength(self):
+        # MPL3 headers say length 0, the scan must still step over the body
+        with io.BinFile("tests/data/mpl3_logfile") as log:
+            expect = [r for r in log.read() if r[0] in ('ADIS', 'MPL3')]
+        with io.BinFile("tests/data/mpl3_logfile") as log:
+            got = list(log.filter({'ADIS': [], 'MPL3': [('Pressure', '>', 102)]}))
+        self.assertEqual(len(expect), 6)
+        self.assertEqual(got, [r for r in expect if r[0] == 'ADIS' or r[1]['Pressure'] > 102])
+
+    def test_small_blocks(self):
+        with open(LOG, 'rb') as fh:
+            raw = fh.read()
+        expect = list(query.Filter({'ADIS': [('VCC', '>', 5.07)]}).run(pyio.BytesIO(raw)))
+        old = query.BLOCK
+        query.BLOCK = 7
+        try:
+            got = list(query.Filter({'ADIS': [('VCC', '>', 5.07)]}).run(pyio.BytesIO(raw)))
+        finally:
+            query.BLOCK = old
+        self.assertTrue(expect)
+        self.assertEqual(got, expect)
+
+    def test_variable(self):
+        diag = {'name': "Diagnostic", 'fourcc': b'DIAG', 'size': "Variable", 'endianness': '!',
+                'members': [{'key': "Level", 'stype': "B"}, {'key': "Text", 'stype': "s", 'count': "H"}]}
+        registry = messages.Registry([diag])
+        message = registry['DIAG']
+        raw = b''
+        for i in range(5):
+            body = message.encode({'Level': i, 'Text': b'x' * i})
+            raw += messages.HEADER.encode(message, i, len(body)) + body
+        f = query.Filter({'DIAG': [('Level', '>', 2)]}, registry=registry)
+        got = list(f.run(pyio.BytesIO(raw)))
+        self.assertEqual([d['Text'] for _, d in got], [b'xxx', b'xxxx'])
+        self.assertEqual((f.scanned, f.decoded, f.matched), (5, 5, 2))
+
+    def test_errors(self):
+        self.assertRaises(KeyError, query.Filter, {'ADIS': [('Nope', '>', 1)]})
+        self.assertRaises(ValueError, query.Filter, {'ADIS': [('VCC', '~', 1)]})
+
+    def test_offsets(self):
+        adis = messages.MESSAGES['ADIS']
+        offsets = query.field_offsets(adis)
+        self.assertEqual(offsets['VCC'][0], 0)
+        self.assertEqual(offsets['Gyro_X'][0], 2)
+        self.assertEqual(offsets['Aux_ADC'][0], adis.size - 2)
+        self.assertEqual(offsets['Gyro_X'][1].format, adis.endianness + 'h')
+
+
+if __name__ == '__main__':
+    unittest.main()
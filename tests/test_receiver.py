@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_receiver
+----------------------------------
+
+Tests for `receiver` module.
+"""
+
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+from psas_packet import io, messages, receiver
+
+ADIS = messages.MESSAGES['ADIS']
+SEQN = messages.MESSAGES['SEQN']
+
+
+class TestSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.base = os.path.join(self.tmp, 'flight')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_workers(self):
+        sup = receiver.Supervisor([0], workers=2, host='127.0.0.1', log_base=self.base, interval=0.05).start()
+        port = sup.ports[0]
+        self.assertNotEqual(port, 0)
+        # many source ports, so the kernel spreads them over both workers
+        senders = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for i in range(8)]
+        for i in range(200):
+            body = messages.HEADER.encode(ADIS, i) + ADIS.encode({'Gyro_X': i % 10})
+            senders[i % 8].sendto(SEQN.encode({'Sequence': i}) + body, ('127.0.0.1', port))
+            if i % 20 == 19:
+                time.sleep(0.01)
+        for s in senders:
+            s.close()
+
+        deadline = time.time() + 10
+        while sup.stats().datagrams.total < 200 and time.time() < deadline:
+            sup.poll(0.1)
+        sup.stop()
+
+        total = sup.stats()
+        self.assertEqual(total.datagrams.total, 200)
+        self.assertEqual(total.messages, {'ADIS': 200})
+        if sup.reuse:
+            self.assertEqual(len(sup.worker_stats), 2)
+            self.assertTrue(all(s.datagrams.total for s in sup.worker_stats.values()))
+
+        merged, = sup.merge()
+        with io.BinFile(merged) as log:
+            seqns = [d['Sequence'] for f, d in log.read() if f == 'SEQN']
+        self.assertEqual(seqns, list(range(200)))
+
+    def test_merge_logs(self):
+        logs = []
+        for part in range(2):
+            path = os.path.join(self.tmp, 'part{0}'.format(part))
+            with open(path, 'wb') as f:
+                for i in range(part, 10, 2):
+                    f.write(messages.HEADER.encode(SEQN, 0) + SEQN.encode({'Sequence': i}))
+                    f.write(messages.HEADER.encode(ADIS, i) + ADIS.encode({}))
+            logs.append(path)
+        out = os.path.join(self.tmp, 'merged')
+        self.assertEqual(receiver.merge_logs(logs, out), 10)
+        with io.BinFile(out) as log:
+            self.assertEqual([d['timestamp'] for f, d in log.read() if f == 'ADIS'], list(range(10)))
+
+    def test_merge_out_of_order(self):
+        # each worker got some of its datagrams out of order
+        order = [[4, 0, 2, 8, 6], [1, 3, 9, 5, 7]]
+        logs = []
+        for part, seqns in enumerate(order):
+            path = os.path.join(self.tmp, 'part{0}'.format(part))
+            with open(path, 'wb') as f:
+                for i in seqns:
+                    f.write(messages.HEADER.encode(SEQN, 0) + SEQN.encode({'Sequence': i}))
+                    f.write(messages.HEADER.encode(ADIS, i) + ADIS.encode({}))
+                    f.write(messages.HEADER.encode(ADIS, i) + ADIS.encode({}))
+            logs.append(path)
+        out = os.path.join(self.tmp, 'merged')
+        self.assertEqual(receiver.merge_logs(logs, out), 10)
+        with io.BinFile(out) as log:
+            got = list(log.read())
+        self.assertEqual([d['Sequence'] for f, d in got if f == 'SEQN'], list(range(10)))
+        self.assertEqual([d['timestamp'] for f, d in got if f == 'ADIS'], [i // 2 for i in range(20)])
+
+
+if __name__ == '__main__':
+    unittest.main()
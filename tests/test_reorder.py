@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_reorder
+----------------------------------
+
+Tests for `reorder` module.
+"""
+
+import socket
+import unittest
+from psas_packet import io, messages, reorder
+
+ADIS = messages.MESSAGES['ADIS']
+SEQN = messages.MESSAGES['SEQN']
+
+
+def released(buff, now):
+    return [(seqn, item, missing) for seqn, item, arrived, missing in buff.pop(now)]
+
+
+class TestReorderBuffer(unittest.TestCase):
+
+    def test_in_order(self):
+        buff = reorder.ReorderBuffer(window=8)
+        out = []
+        for i in range(20):
+            self.assertTrue(buff.push(i, i * 10, i))
+            out.extend(released(buff, i))
+        self.assertEqual(out, [(i, i * 10, 0) for i in range(20)])
+        self.assertEqual(buff.held, 0)
+
+    def test_reorder_and_duplicates(self):
+        buff = reorder.ReorderBuffer(window=8)
+        out = []
+        for seqn in [0, 2, 1, 1, 4, 3, 2, 0, 5, 5]:
+            buff.push(seqn, seqn, 0.0)
+            out.extend(s for s, _, _ in released(buff, 0.0))
+        self.assertEqual(out, [0, 1, 2, 3, 4, 5])
+        self.assertEqual(buff.duplicates, 4)
+        self.assertEqual(buff.late, 0)
+
+    def test_gap_timeout(self):
+        buff = reorder.ReorderBuffer(window=8, timeout=0.5)
+        buff.push(0, 'a', 0.0)
+        buff.push(3, 'd', 1.0)
+        buff.push(2, 'c', 1.1)
+        self.assertEqual(released(buff, 1.2), [(0, 'a', 0)])
+        self.assertEqual(buff.held, 2)
+        # waits from when the first datagram after the gap arrived
+        self.assertEqual(released(buff, 1.5), [])
+        self.assertEqual(released(buff, 1.6), [(2, 'c', 1), (3, 'd', 0)])
+        self.assertEqual((buff.gaps, buff.lost), (1, 1))
+        # too late now
+        self.assertFalse(buff.push(1, 'b', 1.7))
+        self.assertEqual(buff.late, 1)
+        self.assertEqual(buff.latency.count, 3)
+        self.assertEqual(buff.latency.max, 1200000)
+
+    def test_window_overflow(self):
+        buff = reorder.ReorderBuffer(window=4, timeout=10)
+        for seqn in [0, 2, 3, 9]:
+            buff.push(seqn, seqn, 0.0)
+        self.assertEqual(released(buff, 0.0), [(0, 0, 0), (2, 2, 1), (3, 3, 0), (9, 9, 5)])
+        self.assertEqual((buff.gaps, buff.lost), (2, 6))
+
+    def test_wrap(self):
+        buff = reorder.ReorderBuffer(window=8)
+        top = (1 << 32) - 2
+        for seqn in [top, top + 1, 1, 0]:
+            buff.push(seqn % (1 << 32), seqn, 0.0)
+        self.assertEqual([s for s, _, _ in released(buff, 0.0)], [top, top + 1, 0, 1])
+        self.assertFalse(buff.push(top + 1, None, 0.0))
+        self.assertEqual(buff.duplicates, 1)
+
+    def test_restart(self):
+        buff = reorder.ReorderBuffer(window=8)
+        for seqn in [1000, 1001, 3, 1002, 5, 6, 7]:
+            buff.push(seqn, seqn, 0.0)
+        # a single stray old number is dropped, two in a row restart
+        self.assertEqual([s for s, _, _ in released(buff, 0.0)], [1000, 1001, 1002, 5, 6, 7])
+        self.assertEqual((buff.resets, buff.late), (1, 1))
+
+    def test_flush(self):
+        buff = reorder.ReorderBuffer(window=8, timeout=10)
+        buff.push(0, 0, 0.0)
+        buff.push(5, 5, 0.0)
+        self.assertEqual(released(buff, 0.0), [(0, 0, 0)])
+        self.assertEqual([(s, m) for s, _, _, m in buff.flush()], [(5, 4)])
+        self.assertEqual(buff.summary()['lost'], 4)
+
+    def test_window_size(self):
+        self.assertRaises(ValueError, reorder.ReorderBuffer, window=10)
+
+
+class TestNetwork(unittest.TestCase):
+
+    def test_listen(self):
+        rx, tx = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            rx.settimeout(0.01)
+            net = io.Network(rx, reorder=reorder.ReorderBuffer(window=8, timeout=10))
+            for seqn in [0, 2, 1, 1, 4]:
+                tx.send(SEQN.encode({'Sequence': seqn}) + messages.HEADER.encode(ADIS, seqn) + ADIS.encode({}))
+            got = []
+            for i in range(6):
+                got.extend(net.listen())
+            # 4 waits for 3 until the stream ends
+            self.assertEqual(net.reorder.held, 1)
+            got.extend(net.flush())
+            self.assertEqual([d['Sequence'] for f, d in (m for t, m in got) if f == 'SEQN'], [0, 1, 2, 4])
+            self.assertEqual([d['timestamp'] for f, d in (m for t, m in got) if f == 'ADIS'], [0, 1, 2, 4])
+            gap = [d for f, d in (m for t, m in got) if f == 'SEQE']
+            self.assertEqual(gap, [{'Port': 0, 'Expected': 3, 'Received': 4}])
+            self.assertEqual(net.reorder.duplicates, 1)
+        finally:
+            rx.close()
+            tx.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
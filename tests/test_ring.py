@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_ring
+----------------------------------
+
+Tests for `ring` module.
+"""
+
+import multiprocessing
+import socket
+import unittest
+from psas_packet import io, messages, ring
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+ADIS = messages.MESSAGES['ADIS']
+SEQN = messages.MESSAGES['SEQN']
+
+
+def framed(i):
+    return messages.HEADER.encode(ADIS, i) + ADIS.encode({'Aux_ADC': 806 * i})
+
+
+def consume(name, n, queue):
+    with ring.RingReader(name, from_start=True) as reader:
+        got = []
+        for item in reader.listen(interval=0.0001, timeout=5):
+            got.append(item[1][1]['timestamp'])
+            if len(got) == n:
+                break
+        queue.put(got)
+
+
+@unittest.skipIf(shared_memory is None, "needs multiprocessing.shared_memory")
+class TestRing(unittest.TestCase):
+
+    def setUp(self):
+        self.writer = ring.RingWriter(size=1024)
+
+    def tearDown(self):
+        self.writer.close()
+
+    def test_read_decoded(self):
+        reader = ring.RingReader(self.writer.name)
+        self.assertEqual(reader.read(), [])
+        for i in range(3):
+            self.writer.write(framed(i), now=100.0 + i)
+        got = reader.read()
+        self.assertEqual([t for t, _ in got], [100.0, 101.0, 102.0])
+        self.assertEqual(got[2][1], messages.decode(framed(2))[1])
+        self.assertEqual(reader.read(), [])
+        reader.close()
+
+    def test_wraps_and_overruns(self):
+        slow = ring.RingReader(self.writer.name)
+        fast = ring.RingReader(self.writer.name)
+        seen = []
+        # 60 byte entries in a 1024 byte ring wrap with padding
+        for i in range(200):
+            self.writer.write(framed(i))
+            if i % 5 == 4:
+                seen.extend(d['timestamp'] for _, (f, d) in fast.read())
+        self.assertEqual(seen, list(range(200)))
+        self.assertEqual((fast.lost, fast.overruns), (0, 0))
+
+        got = [d['timestamp'] for _, (f, d) in slow.read()]
+        self.assertEqual(slow.overruns, 1)
+        self.assertEqual(got, list(range(200 - len(got), 200)))
+        self.assertEqual(slow.lost, 200 - len(got))
+        self.assertTrue(10 < len(got) < 20)
+
+    def test_from_start(self):
+        for i in range(100):
+            self.writer.write(framed(i))
+        reader = ring.RingReader(self.writer.name, from_start=True)
+        got = [d['timestamp'] for _, (f, d) in reader.read()]
+        self.assertEqual(got, list(range(100 - len(got), 100)))
+        self.assertEqual(reader.overruns, 0)
+        reader.close()
+
+    def test_torn_entry(self):
+        import time
+        for i in range(3):
+            self.writer.write(framed(i))
+        # the writer claimed and counted an entry, then died before it
+        # published it
+        buf = self.writer._buf
+        written = self.writer._written
+        ring._POS.pack_into(buf, ring._CLAIMED, written + 64)
+        ring._POS.pack_into(buf, ring._ENTRIES, 4)
+        start = time.time()
+        cpu = time.process_time()
+        reader = ring.RingReader(self.writer.name, timeout=0.2)
+        self.assertLess(time.time() - start, 1)
+        # waiting for the writer sleeps instead of spinning
+        self.assertLess(time.process_time() - cpu, 0.1)
+        self.assertEqual(reader.cursor, written)
+        self.assertEqual(reader.read(), [])
+
+        # whatever writes there next is read, without counting the torn
+        # entry as lost
+        self.writer.write(framed(3))
+        self.assertEqual([d['timestamp'] for _, (f, d) in reader.read()], [3])
+        self.assertEqual(reader.lost, 0)
+        reader.close()
+
+    def test_too_big(self):
+        self.assertRaises(ValueError, self.writer.write, b'\x00' * 2000)
+
+    def test_other_process(self):
+        queue = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=consume, args=(self.writer.name, 10, queue))
+        proc.start()
+        for i in range(10):
+            self.writer.write(framed(i))
+        self.assertEqual(queue.get(timeout=10), list(range(10)))
+        proc.join(10)
+
+    def test_network(self):
+        rx, tx = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            tx.send(SEQN.encode({'Sequence': 3}) + framed(1) + framed(2))
+            reader = ring.RingReader(self.writer.name)
+            net = io.Network(rx, ring=self.writer)
+            received = list(net.listen())
+            self.assertEqual(reader.read(), received)
+            reader.close()
+        finally:
+            rx.close()
+            tx.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_segment
+----------------------------------
+
+Tests for `segment` module.
+"""
+
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+from psas_packet import io, messages, segment
+
+ADIS = messages.MESSAGES['ADIS']
+GPS1 = messages.MESSAGES['GPS1']
+SEQN = messages.MESSAGES['SEQN']
+
+
+def record(msg, t, data):
+    return messages.HEADER.encode(msg, t) + msg.encode(data)
+
+
+def datagram(writer, seqn):
+    """Write like Network does: the SEQN record, then the messages"""
+    writer.write(messages.HEADER.encode(SEQN, seqn))
+    writer.write(SEQN.encode({'Sequence': seqn}))
+    body = record(ADIS, seqn * 100, {'Gyro_X': seqn}) + record(ADIS, seqn * 100 + 50, {'Gyro_X': -seqn})
+    if seqn >= 45:
+        body += record(GPS1, seqn * 100, {'Latitude': 45.5})
+    writer.write(body)
+    writer.flush()
+
+
+class TestSegments(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.base = os.path.join(self.tmp, 'flight')
+        self.manifest = self.base + '.manifest'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_rotate_by_size(self):
+        with segment.SegmentWriter(self.base, max_bytes=500) as writer:
+            for i in range(50):
+                datagram(writer, i)
+
+        segments = segment.load_manifest(self.manifest)['segments']
+        self.assertGreater(len(segments), 5)
+        self.assertEqual(sorted(os.listdir(self.tmp))[0], 'flight-000000.log')
+        seqns = []
+        for s in segments:
+            with io.BinFile(os.path.join(self.tmp, s['file'])) as log:
+                data = list(log.read())
+            # every segment starts on a SEQN and matches its manifest entry
+            self.assertEqual(data[0][0], 'SEQN')
+            self.assertEqual(s['seqn'], [data[0][1]['Sequence'], [d for f, d in data if f == 'SEQN'][-1]['Sequence']])
+            self.assertEqual(s['records'], len(data))
+            self.assertEqual(s['bytes'], os.path.getsize(os.path.join(self.tmp, s['file'])))
+            self.assertEqual(sum(s['fourccs'].values()), len(data))
+            self.assertGreaterEqual(s['bytes'], 500 if s is not segments[-1] else 0)
+            seqns.extend(range(s['seqn'][0], s['seqn'][1] + 1))
+        self.assertEqual(seqns, list(range(50)))
+        self.assertEqual(sum(s['fourccs'].get('GPS1', 0) for s in segments), 5)
+
+    def test_fixlength(self):
+        # MPL3 headers say length 0, the body follows anyway
+        mpl3 = messages.MESSAGES['MPL3']
+        with segment.SegmentWriter(self.base, max_bytes=200) as writer:
+            for i in range(10):
+                writer.write(record(SEQN, 0, {'Sequence': i}) +
+                             messages.HEADER.struct.pack(b'MPL3', 0, i * 100, 0) + mpl3.encode({'Pressure': i}) +
+                             record(ADIS, i * 100 + 50, {}))
+                writer.flush()
+        segments = segment.load_manifest(self.manifest)['segments']
+        self.assertEqual(sum(s['fourccs'].get('MPL3', 0) for s in segments), 10)
+        self.assertEqual(sum(s['records'] for s in segments), 30)
+        self.assertEqual(segments[-1]['timestamp'][1], 950)
+        with io.BinFile(self.manifest) as log:
+            got = list(log.filter({'ADIS': [('timestamp', '>', 900)]}))
+        self.assertEqual([d['timestamp'] for f, d in got], [950])
+
+    def test_rotate_by_time(self):
+        with segment.SegmentWriter(self.base, max_seconds=0) as writer:
+            for i in range(3):
+                datagram(writer, i)
+        segments = segment.load_manifest(self.manifest)['segments']
+        self.assertEqual([s['seqn'] for s in segments], [[0, 0], [1, 1], [2, 2]])
+
+    def test_read_as_one_log(self):
+        with segment.SegmentWriter(self.base, max_bytes=500) as writer:
+            for i in range(50):
+                datagram(writer, i)
+        with io.BinFile(self.manifest) as log:
+            got = list(log.read())
+        self.assertEqual(len([f for f, d in got if f == 'SEQN']), 50)
+        self.assertEqual([d['Gyro_X'] for f, d in got if f == 'ADIS'][:4], [0, 0, 1, -1])
+
+        with io.BinFile(self.manifest) as log:
+            fh = log.fh
+            fh.seek(fh.size - 10)
+            self.assertEqual(len(fh.read(100)), 10)
+            fh.seek(0)
+            self.assertEqual(len(fh.read()), fh.size)
+
+    def test_filter_skips_segments(self):
+        with segment.SegmentWriter(self.base, max_bytes=500) as writer:
+            for i in range(50):
+                datagram(writer, i)
+        segments = segment.load_manifest(self.manifest)['segments']
+        with io.BinFile(self.manifest) as log:
+            got = list(log.filter({'GPS1': []}))
+            opened = log.fh.opened
+        self.assertEqual(len(got), 5)
+        with_gps = [s['file'] for s in segments if 'GPS1' in s['fourccs']]
+        self.assertEqual(opened, with_gps)
+        self.assertLess(len(opened), len(segments))
+
+        # segments are also ruled out by their timestamp range
+        with io.BinFile(self.manifest) as log:
+            got = list(log.filter({'ADIS': [('timestamp', '<', 300)]}))
+            self.assertEqual(log.fh.opened, [segments[0]['file']])
+        self.assertEqual([d['timestamp'] for f, d in got], [0, 50, 100, 150, 200, 250])
+
+    def test_resume_after_crash(self):
+        writer = segment.SegmentWriter(self.base)
+        for i in range(10):
+            datagram(writer, i)
+        writer.fh.close()
+
+        # the receiver restarts, the open segment is kept without counts
+        with segment.SegmentWriter(self.base) as writer:
+            for i in range(10, 20):
+                datagram(writer, i)
+        segments = segment.load_manifest(self.manifest)['segments']
+        self.assertEqual(segments[0]['fourccs'], None)
+        self.assertGreater(segments[0]['bytes'], 0)
+        with io.BinFile(self.manifest) as log:
+            seqns = [d['Sequence'] for f, d in log.read() if f == 'SEQN']
+            self.assertEqual(seqns, list(range(20)))
+        with io.BinFile(self.manifest) as log:
+            self.assertEqual(len(list(log.filter({'GPS1': []}))), 0)
+            # unknown counts, so it had to be read
+            self.assertEqual(log.fh.opened, [segments[0]['file']])
+
+    def test_network(self):
+        rx, tx = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            writer = segment.SegmentWriter(self.base, max_bytes=1)
+            net = io.Network(rx, logfile=writer)
+            for i in range(5):
+                tx.send(SEQN.encode({'Sequence': i}) + record(ADIS, i, {}))
+                list(net.listen())
+            writer.close()
+        finally:
+            rx.close()
+            tx.close()
+        segments = segment.load_manifest(self.manifest)['segments']
+        self.assertEqual([s['seqn'] for s in segments], [[i, i] for i in range(5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_server
+----------------------------------
+
+Tests for `server` module.
+"""
+
+import json
+import socket
+import struct
+import time
+import unittest
+
+try:
+    from psas_packet import server
+except SyntaxError:
+    # asyncio, Python 3 only
+    server = None
+
+
+def recv_exactly(sock, n):
+    data = b''
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+
+class Client(object):
+    """Minimal blocking WebSocket client"""
+
+    def __init__(self, port):
+        self.sock = socket.create_connection(('127.0.0.1', port), timeout=5)
+        self.sock.sendall(b'GET /ws HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n'
+                          b'Connection: Upgrade\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n'
+                          b'Sec-WebSocket-Version: 13\r\n\r\n')
+        response = b''
+        while not response.endswith(b'\r\n\r\n'):
+            response += self.sock.recv(1)
+        self.response = response.decode('latin-1')
+
+    def send(self, obj):
+        self.sock.sendall(server.frame(json.dumps(obj).encode('utf-8'), mask=b'\x01\x02\x03\x04'))
+
+    def recv(self):
+        b0, b1 = recv_exactly(self.sock, 2)
+        n = b1 & 0x7f
+        if n == 126:
+            n, = struct.unpack('!H', recv_exactly(self.sock, 2))
+        elif n == 127:
+            n, = struct.unpack('!Q', recv_exactly(self.sock, 8))
+        return b0 & 0x0f, recv_exactly(self.sock, n)
+
+    def close(self):
+        self.sock.close()
+
+
+def http_get(port, path):
+    sock = socket.create_connection(('127.0.0.1', port), timeout=5)
+    sock.sendall('GET {0} HTTP/1.1\r\nHost: localhost\r\n\r\n'.format(path).encode('latin-1'))
+    response = b''
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        response += chunk
+    sock.close()
+    head, body = response.split(b'\r\n\r\n', 1)
+    return head.split(b'\r\n')[0].decode('latin-1'), json.loads(body.decode('utf-8'))
+
+
+@unittest.skipIf(server is None, "needs Python 3")
+class TestFrames(unittest.TestCase):
+
+    def test_accept_key(self):
+        # example from RFC 6455
+        self.assertEqual(server.accept_key('dGhlIHNhbXBsZSBub25jZQ=='), 's3pPLMBiTxaQ9kYGzzhZRbK+xOo=')
+
+    def test_lengths(self):
+        self.assertEqual(server.frame(b'hi'), b'\x81\x02hi')
+        self.assertEqual(server.frame(b'x' * 200)[:4], b'\x81\x7e\x00\xc8')
+        self.assertEqual(server.frame(b'x' * 70000)[:10], b'\x81\x7f' + struct.pack('!Q', 70000))
+        masked = server.frame(b'Hello', mask=b'\x37\xfa\x21\x3d')
+        self.assertEqual(masked, b'\x81\x85\x37\xfa\x21\x3d\x7f\x9f\x4d\x51\x58')
+
+
+@unittest.skipIf(server is None, "needs Python 3")
+class TestTelemetryServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = server.TelemetryServer(port=0, history=60).start_in_thread()
+
+    def tearDown(self):
+        self.server.stop_thread()
+
+    def test_history(self):
+        now = time.time()
+        for i in range(5):
+            self.server.publish(now - 4 + i, ('ADIS', {'timestamp': i, 'Gyro_X': i * 0.5, 'VCC': 5.0}))
+        self.server.publish(now, ('GPS1', {'timestamp': 9, 'Name': b'ok'}))
+
+        status, body = http_get(self.server.port, '/history?fourcc=ADIS&fields=Gyro_X&seconds=2.5')
+        self.assertEqual(status, 'HTTP/1.1 200 OK')
+        self.assertEqual([r[1] for r in body], [{'timestamp': i, 'Gyro_X': i * 0.5} for i in (2, 3, 4)])
+        self.assertEqual(http_get(self.server.port, '/fourccs')[1], ['ADIS', 'GPS1'])
+        self.assertEqual(http_get(self.server.port, '/history?fourcc=GPS1')[1][0][1]['Name'], 'ok')
+        self.assertEqual(http_get(self.server.port, '/nope')[0], 'HTTP/1.1 404 Not Found')
+
+    def test_websocket(self):
+        client = Client(self.server.port)
+        self.assertTrue('Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=' in client.response)
+        client.send({'subscribe': {'ADIS': ['Gyro_X'], 'VSTE': []}, 'rate': 100})
+        time.sleep(0.05)
+
+        # a burst between frames is decimated to the latest value
+        for i in range(100):
+            self.server.publish(time.time(), ('ADIS', {'timestamp': i, 'Gyro_X': i, 'VCC': 5.0}))
+        self.server.publish(time.time(), ('RNHP', {'timestamp': 1}))
+        frames = []
+        while not frames or frames[-1]['ADIS']['timestamp'] != 99:
+            opcode, payload = client.recv()
+            self.assertEqual(opcode, 1)
+            frames.append(json.loads(payload.decode('utf-8'))['data'])
+            self.assertEqual(list(frames[-1]), ['ADIS'])
+        self.assertLess(len(frames), 10)
+        self.assertEqual(frames[-1]['ADIS'], {'timestamp': 99, 'Gyro_X': 99})
+
+        self.server.publish(time.time(), ('VSTE', {'timestamp': 5, 'Altitude': 10.0}))
+        opcode, payload = client.recv()
+        self.assertEqual(json.loads(payload.decode('utf-8'))['data'], {'VSTE': {'timestamp': 5, 'Altitude': 10.0}})
+
+        client.sock.sendall(server.frame(b'', 0x9, mask=b'abcd'))
+        self.assertEqual(client.recv(), (0xA, b''))
+        client.close()
+
+    def test_fragments(self):
+        client = Client(self.server.port)
+        text = json.dumps({'subscribe': {'VSTE': []}, 'rate': 100}).encode('utf-8')
+        mask = b'\x01\x02\x03\x04'
+        client.sock.sendall(server.frame(text[:10], 0x1, mask=mask, fin=False))
+        # a ping may come between the fragments
+        client.sock.sendall(server.frame(b'hi', 0x9, mask=mask))
+        self.assertEqual(client.recv(), (0xA, b'hi'))
+        client.sock.sendall(server.frame(text[10:20], 0x0, mask=mask, fin=False) +
+                            server.frame(text[20:], 0x0, mask=mask))
+        time.sleep(0.05)
+        self.server.publish(time.time(), ('VSTE', {'timestamp': 5, 'Altitude': 10.0}))
+        opcode, payload = client.recv()
+        self.assertEqual(json.loads(payload.decode('utf-8'))['data'], {'VSTE': {'timestamp': 5, 'Altitude': 10.0}})
+
+        # a continuation with nothing to continue is a protocol error
+        client.sock.sendall(server.frame(b'x', 0x0, mask=mask))
+        opcode, payload = client.recv()
+        self.assertEqual((opcode, struct.unpack('!H', payload[:2])[0]), (0x8, 1002))
+        client.close()
+
+    def test_too_big(self):
+        client = Client(self.server.port)
+        # only the header is sent, the server must not wait for 2**40 bytes
+        client.sock.sendall(b'\x81\xff' + struct.pack('!Q', 1 << 40) + b'abcd')
+        opcode, payload = client.recv()
+        self.assertEqual((opcode, struct.unpack('!H', payload[:2])[0]), (0x8, 1009))
+        client.close()
+
+        client = Client(self.server.port)
+        chunk = b'x' * 60000
+        client.sock.sendall(server.frame(chunk, 0x1, mask=b'abcd', fin=False) +
+                            server.frame(chunk, 0x0, mask=b'abcd', fin=False))
+        opcode, payload = client.recv()
+        self.assertEqual((opcode, struct.unpack('!H', payload[:2])[0]), (0x8, 1009))
+        client.close()
+
+    def test_slow_client(self):
+        self.server.max_buffer = 1000
+        client = Client(self.server.port)
+        client.send({'subscribe': {'BIG': []}, 'rate': 200})
+        # never read, frames are skipped once the socket buffers fill
+        deadline = time.time() + 5
+        clients = []
+        while time.time() < deadline and not any(c.skipped for c in clients):
+            self.server.publish(time.time(), ('BIG', {'timestamp': time.time(), 'Blob': b'x' * 100000}))
+            time.sleep(0.005)
+            clients = list(self.server._clients)
+        self.assertTrue(any(c.skipped for c in clients))
+        client.close()
+
+    def test_many_clients(self):
+        clients = [Client(self.server.port) for i in range(30)]
+        for c in clients:
+            c.send({'subscribe': {'ADIS': []}, 'rate': 50})
+        time.sleep(0.05)
+        start = time.time()
+        for i in range(20000):
+            self.server.publish(time.time(), ('ADIS', {'timestamp': i, 'VCC': float(i)}))
+        ingest = time.time() - start
+        for c in clients:
+            msg = json.loads(c.recv()[1].decode('utf-8'))
+            self.assertEqual(list(msg['data']), ['ADIS'])
+            c.close()
+        self.assertLess(ingest, 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
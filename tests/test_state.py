@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_state
+----------------------------------
+
+Tests for `state` module.
+"""
+
+import unittest
+from psas_packet import io, messages, state
+
+ADIS = messages.MESSAGES['ADIS']
+
+
+def record(t, data):
+    return messages.HEADER.encode(ADIS, t) + ADIS.encode(data)
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTelemetryState(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self._clock = state.clock
+        state.clock = self.clock
+        self.calls = []
+
+    def tearDown(self):
+        state.clock = self._clock
+
+    def callback(self, fourcc, changed):
+        self.calls.append((fourcc, changed))
+
+    def test_latest_from_log(self):
+        st = state.TelemetryState()
+        with io.BinFile("tests/data/simple_logfile") as log:
+            st.feed_raw(log.scan())
+        with io.BinFile("tests/data/simple_logfile") as log:
+            last = {}
+            for fourcc, data in log.read():
+                last[fourcc] = data
+        self.assertEqual(st.fourccs(), set(last))
+        # nothing is decoded until it's asked for
+        self.assertEqual(st._decoded, {})
+        for fourcc, data in last.items():
+            self.assertEqual(st.latest(fourcc), data)
+        self.assertEqual(st.get('ADIS', 'VCC'), last['ADIS']['VCC'])
+        self.assertEqual(st.get('GPS1', 'VCC', 'none'), 'none')
+
+    def test_decoded_source(self):
+        st = state.TelemetryState()
+        st.feed([(10.0, ('SEQN', {'Sequence': 4})), (11.0, ('ADIS', {'VCC': 5.0}))])
+        self.assertEqual(st.latest('SEQN'), {'Sequence': 4})
+        self.assertEqual(st.received, {'SEQN': 10.0, 'ADIS': 11.0})
+
+    def test_changes_only(self):
+        st = state.TelemetryState()
+        st.subscribe('ADIS', self.callback, keys=['Gyro_X'])
+        st.update_raw(ADIS.fourcc, record(1, {'Gyro_X': 1.0, 'VCC': 5.0}))
+        st.update_raw(ADIS.fourcc, record(2, {'Gyro_X': 1.0, 'VCC': 4.0}))
+        st.update_raw(ADIS.fourcc, record(3, {'Gyro_X': 2.0}))
+        self.assertEqual(self.calls, [('ADIS', {'Gyro_X': 1.0, 'timestamp': 1}),
+                                      ('ADIS', {'Gyro_X': 2.0, 'timestamp': 3})])
+
+    def test_rate_limit(self):
+        st = state.TelemetryState()
+        sub = st.subscribe('ADIS', self.callback, keys=['Gyro_X', 'Gyro_Y'], min_interval=1.0)
+        for i in range(10):
+            self.clock.now = i * 0.25
+            st.update_raw(ADIS.fourcc, record(i, {'Gyro_X': i * 0.05, 'Gyro_Y': 1.0}))
+        # checks at 0, 1 and 2 seconds
+        self.assertEqual([c[1]['timestamp'] for c in self.calls], [0, 4, 8])
+        self.assertEqual(self.calls[1][1], {'Gyro_X': 0.2, 'timestamp': 4})
+
+        # the last record is sent once the stream goes quiet
+        st.poll()
+        self.assertEqual(len(self.calls), 3)
+        self.clock.now = 3.0
+        st.poll()
+        self.assertEqual(self.calls[-1][1], {'Gyro_X': 0.45, 'timestamp': 9})
+        self.assertEqual(sub.calls, 4)
+
+        sub.cancel()
+        st.update_raw(ADIS.fourcc, record(20, {'Gyro_X': 5.0}))
+        self.assertEqual(sub.calls, 4)
+
+    def test_lazy(self):
+        st = state.TelemetryState()
+        st.subscribe('ADIS', self.callback, min_interval=10)
+        st.update_raw(ADIS.fourcc, record(1, {'VCC': 5.0}))
+        st.update_raw(ADIS.fourcc, record(2, {'VCC': 5.0}))
+        # only the first record was due a check, the second is still raw
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue('ADIS' in st._raw)
+
+    def test_subscribe_late(self):
+        st = state.TelemetryState()
+        st.update(1.0, ('ADIS', {'VCC': 5.0}))
+        st.subscribe('ADIS', self.callback)
+        st.poll()
+        self.assertEqual(self.calls, [('ADIS', {'VCC': 5.0})])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_stats
+----------------------------------
+
+Tests for `stats` module.
+"""
+
+import unittest
+from psas_packet import stats
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_small_values_exact(self):
+        h = stats.Histogram()
+        for v in range(1, 11):
+            h.record(v)
+        self.assertEqual(h.count, 10)
+        self.assertEqual(h.min, 1)
+        self.assertEqual(h.max, 10)
+        self.assertEqual(h.percentile(50), 5)
+        self.assertEqual(h.percentile(100), 10)
+
+    def test_large_values_precision(self):
+        h = stats.Histogram()
+        for v in range(1000, 1000000, 1000):
+            h.record(v)
+        p50 = h.percentile(50)
+        self.assertAlmostEqual(p50, 500000, delta=500000 / 16.0)
+
+    def test_merge(self):
+        a = stats.Histogram()
+        b = stats.Histogram()
+        a.record(5)
+        b.record(500)
+        a.merge(b)
+        self.assertEqual(a.count, 2)
+        self.assertEqual(a.max, 500)
+
+    def test_empty(self):
+        self.assertEqual(stats.Histogram().percentile(99), None)
+
+
+class TestRate(unittest.TestCase):
+
+    def test_per_second(self):
+        r = stats.Rate()
+        r.inc(100.1)
+        r.inc(100.5, 4)
+        self.assertEqual(r.per_second(100.9), 0)
+        self.assertEqual(r.per_second(101.2), 5)
+        r.inc(101.3)
+        self.assertEqual(r.per_second(101.4), 5)
+        self.assertEqual(r.per_second(105), 0)
+        self.assertEqual(r.total, 6)
+
+    def test_merge(self):
+        a = stats.Rate()
+        b = stats.Rate()
+        a.inc(100.1, 2)
+        b.inc(100.5, 3)
+        b.inc(101.5, 1)
+        a.merge(b)
+        self.assertEqual(a.total, 6)
+        self.assertEqual(a.per_second(101.6), 5)
+
+
+class TestStats(unittest.TestCase):
+
+    def test_snapshot_and_prometheus(self):
+        s = stats.Stats()
+        s.datagram(100.0, 64)
+        s.message('ADIS')
+        s.message('ADIS')
+        s.decode_latency.record(12)
+        snap = s.snapshot()
+        self.assertEqual(snap['datagrams'], 1)
+        self.assertEqual(snap['bytes'], 64)
+        self.assertEqual(snap['messages'], {'ADIS': 2})
+
+        text = s.prometheus()
+        self.assertIn('psas_messages_total{fourcc="ADIS"} 2', text)
+        self.assertIn('psas_bytes_total 64', text)
+
+    def test_merge(self):
+        a = stats.Stats()
+        b = stats.Stats()
+        a.message('ADIS')
+        b.message('ADIS')
+        b.message('GPS1')
+        b.datagram(100.0, 64)
+        b.decode_latency.record(12)
+        a.merge(b)
+        snap = a.snapshot()
+        self.assertEqual(snap['messages'], {'ADIS': 2, 'GPS1': 1})
+        self.assertEqual(snap['datagrams'], 1)
+        self.assertEqual(snap['decode_latency_us']['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_summary
+----------------------------------
+
+Tests for `summary` module.
+"""
+
+import math
+import os
+import shutil
+import tempfile
+import unittest
+from psas_packet import io, messages, summary
+
+
+class TestAccumulator(unittest.TestCase):
+
+    def test_chunks_match_single_pass(self):
+        values = [1.0, 4.0, 9.0, 16.0, 25.0, 36.0, 49.0]
+        whole = summary.Accumulator()
+        whole.add(values)
+        parts = summary.Accumulator()
+        parts.add(values[:2])
+        other = summary.Accumulator()
+        other.add(values[2:])
+        parts.merge(other)
+
+        mean = sum(values) / len(values)
+        std = math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+        for acc in (whole, parts):
+            r = acc.result()
+            self.assertEqual(r['count'], 7)
+            self.assertAlmostEqual(r['mean'], mean)
+            self.assertAlmostEqual(r['std'], std)
+            self.assertEqual((r['min'], r['max']), (1.0, 49.0))
+
+    def test_scaled(self):
+        acc = summary.Accumulator()
+        acc.add([1, 3])
+        r = acc.result(scaleby=-2, bias=1)
+        self.assertEqual((r['min'], r['max'], r['mean'], r['std']), (-5, -1, -3, 2))
+
+
+class TestSummarize(unittest.TestCase):
+
+    def expected(self):
+        columns = {}
+        with io.BinFile("tests/data/simple_logfile") as log:
+            for fourcc, data in log.read():
+                for key, value in data.items():
+                    if key != 'timestamp':
+                        columns.setdefault(fourcc, {}).setdefault(key, []).append(value)
+        return columns
+
+    def test_matches_decoded(self):
+        result = summary.summarize("tests/data/simple_logfile", chunk=3)
+        columns = self.expected()
+        self.assertEqual(sorted(result), sorted(columns))
+        for fourcc, fields in columns.items():
+            for key, values in fields.items():
+                r = result[fourcc][key]
+                mean = sum(values) / float(len(values))
+                self.assertEqual(r['count'], len(values))
+                self.assertAlmostEqual(r['min'], min(values))
+                self.assertAlmostEqual(r['max'], max(values))
+                self.assertAlmostEqual(r['mean'], mean)
+
+    def test_bad_variable_record(self):
+        messages.MESSAGES.define({'name': "Diagnostic", 'fourcc': b'DIAG', 'size': "Variable", 'endianness': '!',
+                                  'members': [{'key': "Code", 'stype': "H"},
+                                              {'key': "Text", 'stype': "s", 'count': "B"}]})
+        tmp = tempfile.mkdtemp()
+        try:
+            diag = messages.MESSAGES['DIAG']
+            path = os.path.join(tmp, 'log')
+            with open(path, 'wb') as f:
+                for code in (1, 2, 3):
+                    body = diag.encode({'Code': code, 'Text': b'ok'})
+                    if code == 2:
+                        # says it has 9 bytes of text, but has 2
+                        body = body[:2] + b'\x09' + body[3:]
+                    f.write(messages.HEADER.encode(diag, code, len(body)) + body)
+            skipped = {}
+            result = summary.summarize(path, skipped=skipped)
+        finally:
+            messages.MESSAGES.remove('DIAG')
+            shutil.rmtree(tmp)
+        self.assertEqual(result['DIAG']['Code']['count'], 2)
+        self.assertEqual(result['DIAG']['Code']['mean'], 2.0)
+        self.assertEqual(skipped, {'DIAG': 1})
+
+    def test_select_and_cache(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'log')
+            shutil.copy("tests/data/simple_logfile", path)
+            first = summary.summarize(path, fourccs=['ADIS'], cache=True)
+            self.assertEqual(list(first), ['ADIS'])
+            self.assertTrue(os.path.exists(path + '.summary.json'))
+            self.assertEqual(summary.summarize(path, cache=True), summary.summarize(path))
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_cache_file_object(self):
+        # nothing to cache for a file object, fourccs still apply
+        with open("tests/data/simple_logfile", 'rb') as f:
+            got = summary.summarize(f, fourccs=['ADIS'], cache=True)
+        self.assertEqual(list(got), ['ADIS'])
+
+    def test_cache_unwritable(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'log')
+            shutil.copy("tests/data/simple_logfile", path)
+            # can't create the sidecar, summarize works without it
+            os.mkdir(path + '.summary.json.tmp')
+            got = summary.summarize(path, fourccs=['ADIS'], cache=True)
+            self.assertEqual(list(got), ['ADIS'])
+            self.assertFalse(os.path.exists(path + '.summary.json'))
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()